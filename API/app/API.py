@@ -1,15 +1,31 @@
 # Importing all the required modules
-from connections import broker_connections, db_connections, web_connections
-from utils import credentials_manager, logs_handler, data_checker, args_checker
+from connections import broker_connections, db_archive, db_connections, db_migrations, db_rollups, web_connections, ingest_pipeline, supervisor
+from utils import credentials_manager, logs_handler, data_checker, args_checker, query_cache, schema_catalog, readings_buffer, live_feed, write_marks, response_encoder, metrics
 # Importing the required libraries
-from flask import Flask, jsonify, request
+from flask import Flask, Response, current_app, g, jsonify, request, stream_with_context
 from flask_restful import Api, Resource
 from flasgger import Swagger
+from datetime import datetime, timedelta
 import paho.mqtt
+import itertools
 import logging
 import mysql.connector
+import multiprocessing
+import threading
+import signal
+import json
+import time
+import csv
+import io
 import os
 
+# The columns returned by the queries of the measurement tables (the surrogate ID is internal).
+MEASURE_COLUMNS = "CHIP_ID, DATA_ID, VALUE, DATE"
+EXPORT_COLUMNS = ["MEASURE", "ID", "CHIP_ID", "DATA_ID", "VALUE", "DATE"] # The columns of the exports.
+
+# The origin of the time buckets of the aggregations (a Monday, so the weekly buckets start on Monday).
+BUCKET_ORIGIN = "2000-01-03 00:00:00"
+
 def start(app: Flask, api: Api, swagger: Swagger) -> None:
     """
     This function is the entry point for the API.
@@ -34,6 +50,7 @@ def start(app: Flask, api: Api, swagger: Swagger) -> None:
     try:
         logger.info("Setting the credentials for the API...")
         credentials_manager.set_credentials() # Set the credentials in the environment variables.
+        logs_handler.configure() # Apply the logging settings of the credentials file.
         logger.info("Credentials set successfully!")
 
     except Exception as error:
@@ -41,68 +58,190 @@ def start(app: Flask, api: Api, swagger: Swagger) -> None:
         logger.error(f"Error: {error}")
         exit(1)
 
-    # Connect to the database.
-    logger.info("Attempting connection to the DataBase server...")
-    db_connection, db_cursor = connect_database(logger)
-    logger.info("DataBase connected successfully!")
+    # With several web workers (or if configured), the ingest runs in its own process, so it does not compete with the requests.
+    workers = int(os.environ.get("API_SERVER_WORKERS", "1"))
+    separate_ingest = os.environ.get("API_SERVER_INGEST", "inprocess") == "process" or workers > 1
+
+    if separate_ingest: # The committed batches are relayed to the web processes through the broker.
+        try:
+            broker_connections.notify_topic()
+
+        except Exception as error:
+            logger.error("The topic of the committed batches is not valid. See the error below:")
+            logger.error(f"Error: {error}")
+            exit(1)
+
+    if not separate_ingest: # Start the writer of the ingest pipeline first, it spools the messages while the database is not reachable.
+        start_ingest_pipeline(logger)
+
+    # Connect to the database (checking the migrations and loading the schema and the latest readings) and to the broker mqtt at the same time.
+    broker_clients, database_ready = connect_services(logger, ingest = not separate_ingest, maintain = not separate_ingest)
+
+    # Reload the schema when the process receives SIGHUP (where the platform supports it).
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(target = refresh_db_schema, args = (logger,)).start())
+
+    if separate_ingest:
+        ingest_processes = start_ingest_processes(logger)
+
+        # Start an ingest process again if it dies, until the web services are stopped.
+        ingest_stopping = threading.Event()
+        ingest_supervisor = threading.Thread(target = supervise_ingest_processes, args = (logger, ingest_processes, ingest_stopping), name = "ingest-supervisor", daemon = True)
+        ingest_supervisor.start()
+
+        # The committed batches are relayed by the ingest process, the web processes keep their in-memory state with them.
+        ingest_pipeline.add_listener(query_cache.on_ingest)
+        ingest_pipeline.add_listener(readings_buffer.on_ingest)
+        ingest_pipeline.add_listener(live_feed.on_ingest)
+        ingest_pipeline.add_listener(write_marks.on_ingest)
+
+        observers = [] # The observer of this process (each forked worker starts its own, and its own supervisor).
+
+        if workers <= 1:
+            observers.append(start_ingest_observer(logger))
+            supervisor.start(lambda: complete_startup(logger, []), observers, database_ready)
 
-    # Set the tables in the environment variables.
-    set_db_tables(logger)
+        # Start the web modules.
+        start_web_services(logger, app, api, swagger, after_fork = lambda: supervisor.start(lambda: complete_startup(logger, [], migrate = False), [start_ingest_observer(logger)], database_ready))
 
-    # Connect to the broker mqtt.
-    broker_connection = connect_broker(logger)
+        # Stop the ingest processes once the web services are stopped.
+        supervisor.stop()
+        ingest_stopping.set(); ingest_supervisor.join(10) # Before the ingest processes are stopped, so they are not started again.
+        stop_ingest_processes(logger, ingest_processes, observers)
 
-    # Start the web modules.
-    start_web_services(logger, app, api, swagger)
+    else:
+        # Reconnect the database and the broker mqtt when they fail, and complete the startup if the database was not reachable.
+        supervisor.start(lambda: complete_startup(logger, broker_clients, maintain = True), broker_clients, database_ready)
+
+        # Start the web modules.
+        start_web_services(logger, app, api, swagger)
+
+        # Stop the ingest once the web services are stopped (the supervisor first, so it does not reconnect the workers).
+        supervisor.stop()
+        stop_ingest(logger, broker_clients)
 
     pass
 
-def connect_database(logger: logging.Logger) -> mysql.connector.MySQLConnection:
+def init_database_pool(logger: logging.Logger) -> bool:
     """
-    This function connects to the database.
-    It sets the credentials in the environment variables and then connects to the database.
-    If there is an error in connecting to the database, it logs the error and exits the program.
+    This function initializes the connection pool to the database, opening its first connections.
+    If the database is not reachable, it retries with an exponential backoff until the 'startup_timeout' setting expires.
+    Then it logs the error and the API starts without the database (not ready), the supervisor keeps retrying in the background.
 
     Args:
         - logger (logging.Logger): The logger object.
 
     Returns:
-        - db_connection (mysql.connector.MySQLConnection): The connection object.
-        - db_cursor (mysql.connector.cursor): The cursor object.
+        - bool: True if the pool is initialized.
+    """
+
+    deadline = time.monotonic() + float(os.environ.get("API_SERVER_STARTUP_TIMEOUT", "30"))
+    delay = float(os.environ.get("API_DB_RECONNECT_MIN_DELAY", "1"))
+
+    logger.info("Attempting connection to the DataBase server...")
+
+    while True:
+        try:
+            db_connections.init_pool() # Initialize the connection pool to the database.
+            logger.info(f"DataBase connected successfully! Pool stats: {db_connections.pool_stats()}")
+
+            return True
+
+        except Exception as error:
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                logger.error(f"The DataBase is not reachable, the API starts without it and keeps retrying in the background. See the error below:")
+                logger.error(f"Error: {error}")
+
+                return False
+
+            logger.warning(f"The DataBase is not reachable yet, retrying in {min(delay, remaining):.1f} seconds. Error: {error}")
+
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, float(os.environ.get("API_DB_RECONNECT_MAX_DELAY", "30")))
+
+def migrate_database(logger: logging.Logger, fatal: bool = True) -> None:
+    """
+    This function checks the migrations of the database and, depending on the 'migrations' setting, applies them:
+        - 'apply': The pending migrations are applied and the monthly partitions of the measurement tables are created.
+        - 'check': The pending migrations are only logged.
+        - 'off': Nothing is done.
+    If there is an error in applying the migrations, it logs the error and exits the program (or raises it, if it is not fatal).
+
+    Args:
+        - logger (logging.Logger): The logger object.
+        - fatal (bool): False when called by the supervisor, which retries later.
+
+    Returns:
+        - None
+
+    Raises:
+        - Exception: If there is an error in applying the migrations and it is not fatal.
     """
 
+    mode = os.environ.get("API_DB_MIGRATIONS", "check") # Get the migrations mode from the environment variables.
+
+    if mode == "off":
+        return
 
     try:
-        db_connection, db_cursor = db_connections.init() # Initialize the connection to the database.
+        db_connection, db_cursor = db_connections.init() # Check out a connection from the pool.
+
+        try:
+            pending_migrations = db_migrations.pending(db_cursor) # Get the migrations not applied yet.
+
+            if mode != "apply": # If the migrations must only be checked.
+                for version, name, path in pending_migrations:
+                    logger.warning(f"The DataBase migration V{version} ({name}) is pending. Set the 'migrations' setting to 'apply' to apply it.")
+
+                return
+
+            for migration in pending_migrations: # Apply the pending migrations in order.
+                logger.info(f"Applying the DataBase migration V{migration[0]} ({migration[1]})...")
+                db_migrations.apply(db_cursor, migration)
+                logger.info("Migration applied successfully!")
 
-        return db_connection, db_cursor
+            months_ahead = int(os.environ.get("API_DB_PARTITIONS_AHEAD", "3"))
+
+            for table in db_migrations.MEASUREMENT_TABLES: # Create the next monthly partitions of the measurement tables.
+                created = db_migrations.ensure_partitions(db_cursor, table, months_ahead)
+
+                if created:
+                    logger.info(f"Partitions created in the table {table}: {created}")
+
+        finally:
+            db_connections.close(db_connection, db_cursor) # Return the connection to the pool.
 
     except Exception as error:
-        logger.error(f"An error occurred while connecting to the database. See the error below:")
+        logger.error(f"An error occurred while applying the migrations of the database. See the error below:")
         logger.error(f"Error: {error}")
 
+        if not fatal:
+            raise error
+
         exit(1)
 
-def connect_broker(logger: logging.Logger) -> paho.mqtt.client.Client:
+def connect_broker(logger: logging.Logger, process: int = 0) -> list:
     """
-    This function connects to the broker mqtt.
-    It sets the credentials in the environment variables and then connects to the broker mqtt.
-    If there is an error in connecting to the broker, it logs the error and exits the program.
+    This function sets up the ingest workers of this process, which connect to the broker mqtt in the background.
+    They only subscribe once the schema is loaded (see complete_startup).
+    If there is an error in setting them up, it logs the error and exits the program.
 
     Args:
         - logger (logging.Logger): The logger object.
+        - process (int): The index of the ingest process.
 
     Returns:
-        - broker_connection (paho.mqtt.client.Client): The client object.
+        - broker_clients (list): The client objects.
 
     """
 
     try:
         logger.info("Attempting connection to the MQTT Broker...")
-        broker_connection = broker_connections.init(broker_on_message) # Initialize the connection to the broker mqtt.
-        logger.info("MQTT Broker connected successfully!")
+        broker_clients = broker_connections.init_workers(broker_on_message, process) # Initialize the connections to the broker mqtt.
 
-        return broker_connection
+        return broker_clients
 
     except Exception as error:
         logger.error(f"An error occurred while connecting to the MQTT broker. See the error below:")
@@ -110,150 +249,1518 @@ def connect_broker(logger: logging.Logger) -> paho.mqtt.client.Client:
 
         exit(1)
 
-def start_web_services(logger: logging.Logger, app: Flask, api: Api, swagger: Swagger) -> None:
+def connect_services(logger: logging.Logger, process: int = 0, ingest: bool = True, full: bool = True, maintain: bool = False) -> tuple:
     """
-    This function starts the web services for the API.
+    This function connects to the database and, if the ingest runs in this process, its workers to the broker mqtt, at the same time:
+    the workers connect in the background while the pool is opened and the startup is completed.
+    Each side is bounded by its timeout (the 'startup_timeout' setting of the server and 'connect_timeout' of the broker mqtt),
+    what is not reachable by then is left to the supervisor.
 
     Args:
-        - app (flask.Flask): The Flask app object.
-        - api (flask_restful.Api): The API object.
-        - swagger (flasgger.Swagger): The Swagger object.
+        - logger (logging.Logger): The logger object.
+        - process (int): The index of the ingest process.
+        - ingest (bool): True to connect the ingest workers of this process.
+        - full (bool): False in the ingest processes, which only need the schema catalog (see complete_startup).
+        - maintain (bool): True in the process that maintains the partitions, the rollups and the archive (see complete_startup).
 
     Returns:
-        - None
+        - broker_clients (list): The client objects (empty without ingest).
+        - database_ready (bool): True if the database was reached and the startup completed.
     """
 
-    @app.route("/OrusDashboard/API", methods = ["GET"])
-    def execute_request() -> jsonify:
-        table_id = request.args.get("table_id") # Get the table id from the request.
-        start_date = request.args.get("start_date") # Get the start date from the request.
-        end_date = request.args.get("end_date") # Get the end date from the request.
-
-        # Create a dictionary with the arguments.
-        args = {"table_id": table_id, "start_date": start_date, "end_date": end_date}
+    broker_deadline = time.monotonic() + float(os.environ.get("API_MQTT_CONNECT_TIMEOUT", "10"))
+    broker_clients = connect_broker(logger, process) if ingest else [] # They connect while the database is initialized.
 
-        logger.info(f"Request received. Table ID: {table_id}, Start Date: {start_date}, End Date: {end_date}")
+    database_ready = init_database_pool(logger)
 
+    if database_ready:
         try:
-            logger.info("Checking the arguments...")
-            args = args_checker.check(args) # Check the arguments passed from the web clients.
-            logger.info("Arguments checked successfully!")
+            complete_startup(logger, broker_clients, migrate = full, warm = full, maintain = maintain, fatal = True)
 
-            table_id = args["table_id"]; start_date = args["start_date"]; end_date = args["end_date"] # Get the checked arguments.
+        except Exception as error:
+            logger.error(f"An error occurred while loading the schema of the database. See the error below:")
+            logger.error(f"Error: {error}")
 
-            db_connection, db_cursor = connect_database(logger) # Connect to the database.
+            database_ready = False
 
-            logger.info("Executing the queries to get the data from the database...")
-            query = f"SHOW columns FROM {table_id}"
-            column_names = [column_name for column_name in db_connections.execute(db_cursor, query)]
+    if broker_clients:
+        if broker_connections.wait_connected(broker_clients, max(broker_deadline - time.monotonic(), 0)):
+            logger.info(f"MQTT Broker connected successfully! Workers: {len(broker_clients)}, Topic: {broker_connections.subscription_topic()}")
 
-            if start_date == None and end_date == None: # If the start and end dates are missing.
-                query = f"SELECT * FROM {table_id}" # Query to get all the values from the table.
+        else:
+            logger.warning("The MQTT Broker is not reachable yet, the workers keep connecting in the background.")
 
-            elif end_date == None: # If the end date is missing.
-                query = f"SELECT * FROM {table_id} WHERE DATE >= '{start_date}'" # Query to get the values from the start date.
+    return broker_clients, database_ready
 
-            else: # If both the start and end dates are present.
-                query = f"SELECT * FROM {table_id} WHERE DATE >= '{start_date}' AND DATE <= '{end_date}'" # Query to get the values between the start and end dates.
+def complete_startup(logger: logging.Logger, broker_clients: list, migrate: bool = True, warm: bool = True, maintain: bool = False, fatal: bool = False) -> None:
+    """
+    This function completes the startup once the database answers: it checks (or applies) the migrations, loads the schema catalog
+    and the latest readings, starts the maintenance of the rollups and the archive (they need the catalog to know if their tables exist),
+    and lets the ingest workers subscribe, so no message is received before it can be checked.
+    The steps already done are skipped, so it is called at startup and by the supervisor each time the database answers again.
 
-            data = [value for value in db_connections.execute(db_cursor, query)] # Execute the query to get the values from the table.
-            logger.info("Queries executed successfully!")
+    Args:
+        - logger (logging.Logger): The logger object.
+        - broker_clients (list): The ingest workers of this process.
+        - migrate (bool): True to check the migrations (only one process does).
+        - warm (bool): True to load the latest readings in memory (the ingest processes do not keep them).
+        - maintain (bool): True in the single process that maintains the partitions, the rollups and the archive (the one with the ingest, the first if there are several).
+        - fatal (bool): True at startup, an error in applying the migrations exits the program.
 
-            db_connections.close(db_connection, db_cursor) # Close the database connection.
+    Returns:
+        - None
 
-            logger.info("Formatting the data to be returned to the client...")
-            result = format_data(column_names, data) # Format the data to be returned to the client.
-            logger.info("Data formatted successfully!")
+    Raises:
+        - Exception: If the schema cannot be loaded (the supervisor retries later).
+    """
 
-            logger.info("Returning the result to the client...")
+    if schema_catalog.version() == 0: # If the schema was not loaded yet.
+        if migrate:
+            migrate_database(logger, fatal)
 
-            return jsonify(result), 200
+        refresh_db_schema(logger) # Load the schema catalog and the registry of chips.
 
-        except Exception as error:
-            logger.error(f"An error occurred while processing the request. See the error below:")
-            logger.error(f"Error: {error}")
+        if warm:
+            warm_readings_buffer(logger) # Load the latest readings in memory.
 
-            return jsonify(f"An error occurred while processing the request. Error: {error}"), 500
+    if maintain: # Nothing is done if they are already running (or disabled).
+        db_migrations.start_partitions()
+        db_rollups.start()
+        db_archive.start()
+
+    broker_connections.open_subscriptions(broker_clients)
+
+def start_ingest_pipeline(logger: logging.Logger, local_listeners: bool = True, process: int = 0) -> None:
+    """
+    This function starts the writer thread of the ingest pipeline.
+    If there is an error in starting the pipeline, it logs the error and exits the program.
+
+    Args:
+        - logger (logging.Logger): The logger object.
+        - local_listeners (bool): True to pass the committed batches to the in-memory state of this process (False in a separate ingest process).
+        - process (int): The index of the ingest process, each process has its own spool.
+
+    Returns:
+        - None
+    """
 
     try:
-        logger.info("Starting the web services of the API...")
-        web_connections.init(app, api, swagger)
-        logger.info("Web services started successfully!")
+        logger.info("Starting the ingest pipeline...")
+        ingest_pipeline.init(process) # Start the writer thread of the ingest pipeline (and the replayer of its spool).
+
+        if local_listeners:
+            ingest_pipeline.add_listener(query_cache.on_ingest) # Invalidate the cached results of the tables written.
+            ingest_pipeline.add_listener(readings_buffer.on_ingest) # Keep the latest readings in memory.
+            ingest_pipeline.add_listener(live_feed.on_ingest) # Push the readings to the subscribers of the live feed.
+            ingest_pipeline.add_listener(write_marks.on_ingest) # Advance the versions of the tables and chips written.
+
+        logger.info("Ingest pipeline started successfully!")
 
     except Exception as error:
-        logger.error(f"An error occurred while starting the web modules. See the error below:")
+        logger.error(f"An error occurred while starting the ingest pipeline. See the error below:")
         logger.error(f"Error: {error}")
 
-    pass
+        exit(1)
 
-def set_db_tables(logger: logging.Logger) -> None:
+def stop_ingest(logger: logging.Logger, broker_clients: list) -> None:
     """
-    This function sets the tables in the environment variables.
+    This function stops the ingest workers and drains the ingest pipeline, so the messages already received are written to the database.
+    The workers stay connected while the pipeline is drained, so the messages written are acknowledged.
 
     Args:
         - logger (logging.Logger): The logger object.
+        - broker_clients (list): The client objects.
 
     Returns:
         - None
-
-    Raises:
-        - None
     """
 
     try:
-        logger.info("Setting the tables in the environment variables...")
+        logger.info("Stopping the ingest of messages...")
+
+        for broker_client in broker_clients: # Stop receiving messages.
+            broker_client.unsubscribe(broker_connections.subscription_topic())
+
+        ingest_pipeline.shutdown() # Write (and acknowledge) the messages left in the queue.
+        db_rollups.stop() # Stop the maintenance of the rollups (if it runs in this process).
+        db_archive.stop() # Stop the archival of the old readings (if it runs in this process).
+        db_migrations.stop_partitions() # Stop the creation of the next partitions (if it runs in this process).
+
+        for broker_client in broker_clients:
+            broker_client.disconnect() # This also ends the loop of the MQTT thread.
+
+        logger.info(f"Ingest stopped successfully! Stats: {ingest_pipeline.stats()}")
+
+    except Exception as error:
+        logger.error(f"An error occurred while stopping the ingest. See the error below:")
+        logger.error(f"Error: {error}")
+
+def start_ingest_processes(logger: logging.Logger) -> list:
+    """
+    This function starts the ingest (MQTT workers and writer of the ingest pipeline) in separate processes, as set in the 'ingest_processes' setting.
+    The processes split the messages of the topic with a shared subscription.
+    The connections of the pool are closed first, so the processes do not share them (this process opens new ones when needed).
+
+    Args:
+        - logger (logging.Logger): The logger object.
 
-        db_connection, db_cursor = connect_database(logger) # Connect to the database.
-        db_tables = db_connections.execute(db_cursor, "SHOW TABLES") # Execute the query to get the tables in the database.
+    Returns:
+        - ingest_processes (list): The ingest processes (multiprocessing.Process).
+    """
 
-        db_tables_string = "" # Initialize the string to store the tables.
+    try:
+        logger.info("Starting the ingest processes...")
 
-        for table in db_tables: # Iterate through the tables.
-            db_tables_string += f"{table[0]} " # Add the table to the string.
+        db_connections.close_pool() # The connections cannot be shared with the ingest processes.
 
-        db_tables_string = db_tables_string.strip() # Strip the string to remove the trailing whitespace.
-        os.environ["API_DB_TABLES"] = db_tables_string # Set the tables in the environment variables.
+        # Fork where the platform supports it, the processes inherit the settings and the schema catalog.
+        ingest_processes = []
 
-        db_connections.close(db_connection, db_cursor) # Close the database connection.
+        for process in range(int(os.environ.get("API_SERVER_INGEST_PROCESSES", "1"))):
+            ingest_processes.append(start_ingest_process(logger, process))
 
-        logger.info("Tables set in the environment variables successfully!")
+        return ingest_processes
 
     except Exception as error:
-        logger.error(f"An error occurred while setting the tables in the environment variables. See the error below:")
+        logger.error(f"An error occurred while starting the ingest processes. See the error below:")
         logger.error(f"Error: {error}")
 
-def broker_on_message(client, userdata, message) -> None:
+        exit(1)
+
+def start_ingest_process(logger: logging.Logger, process: int) -> multiprocessing.Process:
     """
-    This function is called by the mqtt client thread when a new message is received from the broker.
+    This function starts an ingest process, forked where the platform supports it, so it inherits the settings and the schema catalog.
 
     Args:
-        - client (paho.mqtt.client.Client): The client object.
-        - userdata: The user data.
-        - message (paho.mqtt.client.MQTTMessage): The message object.
+        - logger (logging.Logger): The logger object.
+        - process (int): The index of the ingest process.
+
+    Returns:
+        - ingest_process (multiprocessing.Process): The ingest process.
+    """
+
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+
+    ingest_process = context.Process(target = run_ingest_process, args = (process,), name = f"ingest-{process}", daemon = False)
+    ingest_process.start()
+
+    logger.info(f"Ingest process started successfully! PID: {ingest_process.pid}")
+
+    return ingest_process
+
+def supervise_ingest_processes(logger: logging.Logger, ingest_processes: list, stopping: threading.Event) -> None:
+    """
+    This function is the body of the thread that supervises the ingest processes: every 'supervisor_interval' seconds,
+    an ingest process that died is logged and started again (in its place of the list), until 'stopping' is set.
+
+    Args:
+        - logger (logging.Logger): The logger object.
+        - ingest_processes (list): The ingest processes (multiprocessing.Process).
+        - stopping (threading.Event): Set when the ingest processes are being stopped.
+
+    Returns:
+        - None
+    """
+
+    while not stopping.wait(float(os.environ.get("API_SERVER_SUPERVISOR_INTERVAL", "1"))):
+        for process, ingest_process in enumerate(ingest_processes):
+            if ingest_process.is_alive() or stopping.is_set():
+                continue
+
+            logger.error(f"Ingest process {ingest_process.name} died, starting it again. Exit code: {ingest_process.exitcode}")
+
+            try:
+                ingest_processes[process] = start_ingest_process(logger, process)
+
+            except Exception as error:
+                logger.error(f"An error occurred while starting the ingest process again. Error: {error}")
+
+def run_ingest_process(process: int = 0) -> None:
+    """
+    This function is the body of an ingest process.
+    It connects to the database and the broker mqtt, writes the messages received, and publishes every committed batch to the notify topic,
+    so the web processes can update their in-memory state, and the statistics of its pipeline every 'stats_interval' seconds.
+    It stops, draining the pipeline, when it receives SIGTERM.
+
+    Args:
+        - process (int): The index of the ingest process.
 
     Returns:
         - None
     """
 
     logger = logs_handler.init() # Initialize the logger.
+    stopping = threading.Event()
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # The web process stops this one with SIGTERM.
+
+    start_ingest_pipeline(logger, local_listeners = False, process = process)
+    broker_clients, database_ready = connect_services(logger, process, full = False, maintain = process == 0)
+
+    notify_topic = broker_connections.notify_topic()
+
+    # Relay the committed batches to the web processes.
+    ingest_pipeline.add_listener(lambda batch: broker_clients[0].publish(notify_topic, json.dumps(batch), qos = 1))
+
+    # Reconnect the database and the broker mqtt when they fail, and load the schema if the database was not reachable.
+    supervisor.start(lambda: complete_startup(logger, broker_clients, migrate = False, warm = False, maintain = process == 0), broker_clients, database_ready)
+
+    # Until SIGTERM, relay the statistics of the pipeline to the web processes, as they do not see it (for their metrics and readiness).
+    while not stopping.wait(float(os.environ.get("API_INGEST_STATS_INTERVAL", "5"))):
+        broker_clients[0].publish(notify_topic, json.dumps({"process": process, "stats": ingest_pipeline.stats()}), qos = 0)
+
+    supervisor.stop() # First, so it does not reconnect the workers.
+    stop_ingest(logger, broker_clients)
+
+def start_ingest_observer(logger: logging.Logger) -> paho.mqtt.client.Client:
+    """
+    This function subscribes this process to the batches relayed by the ingest process, and passes them to the listeners of the ingest pipeline.
+    The batches committed while it is not subscribed are lost, so the results are not validated from the write marks until it is,
+    and the cached results are dropped each time it subscribes (again).
+    If there is an error in setting up the client, it logs the error and the in-memory state of this process is only updated on restart.
+
+    Args:
+        - logger (logging.Logger): The logger object.
+
+    Returns:
+        - observer_connection (paho.mqtt.client.Client): The client object, or None.
+    """
+
+    def on_message(client, userdata, message) -> None:
+        try:
+            payload = json.loads(message.payload.decode("utf-8"))
+
+            if isinstance(payload, dict): # The statistics of an ingest process, else a committed batch.
+                ingest_pipeline.record_relayed_stats(payload["process"], payload["stats"])
+
+            else:
+                ingest_pipeline.notify_listeners(payload)
+
+        except Exception as error:
+            logger.error(f"An error occurred while processing a relayed batch. Error: {error}")
+
+    def on_status(subscribed: bool) -> None:
+        if subscribed: # The batches missed before are not known, start again from a clean state.
+            query_cache.clear()
+            write_marks.reset()
+
+        else:
+            write_marks.disable()
 
     try:
+        write_marks.disable() # Until the observer is subscribed.
+
+        observer_connection = broker_connections.init_observer(on_message, broker_connections.notify_topic(), on_status)
+        logger.info(f"Observing the batches committed by the ingest process. PID: {os.getpid()}")
+
+        return observer_connection
+
+    except Exception as error:
+        logger.error(f"An error occurred while observing the ingest process. See the error below:")
+        logger.error(f"Error: {error}")
 
-        logger.info("New message received from the MQTT broker, processing the message...")
+        return None
 
-        logger.info("Parsing the data received from the MQTT broker...")
-        data = data_checker.parse_data(message.payload.decode("utf-8")) # Parse the data received from the broker.
-        logger.info("Data parsed successfully!")
+def stop_ingest_processes(logger: logging.Logger, ingest_processes: list, observers: list) -> None:
+    """
+    This function stops the observers of this process and the ingest processes, which drain their pipelines before exiting.
+
+    Args:
+        - logger (logging.Logger): The logger object.
+        - ingest_processes (list): The ingest processes (multiprocessing.Process).
+        - observers (list): The observer clients of this process.
+
+    Returns:
+        - None
+    """
 
-        db_connection, db_cursor = connect_database(logger) # Connect to the database.
+    try:
+        logger.info("Stopping the ingest processes...")
+
+        for observer_connection in observers:
+            if observer_connection is not None:
+                observer_connection.disconnect() # This also ends the loop of the MQTT thread.
 
-        logger.info("Attempting to write the data to the database...")
-        db_connections.write_data(db_cursor, data) # Write the data to the database.
-        logger.info("Data written to the database successfully!")
+        for ingest_process in ingest_processes:
+            ingest_process.terminate() # Send SIGTERM, the process writes the messages left in its queue.
 
-        db_connections.close(db_connection, db_cursor) # Close the database connection.
+        for ingest_process in ingest_processes:
+            ingest_process.join(60)
+
+            logger.info(f"Ingest process {ingest_process.name} stopped. Exit code: {ingest_process.exitcode}")
 
     except Exception as error:
+        logger.error(f"An error occurred while stopping the ingest process. See the error below:")
+        logger.error(f"Error: {error}")
+
+def start_web_services(logger: logging.Logger, app: Flask, api: Api, swagger: Swagger, after_fork: callable = None) -> None:
+    """
+    This function starts the web services for the API.
+
+    Args:
+        - app (flask.Flask): The Flask app object.
+        - api (flask_restful.Api): The API object.
+        - swagger (flasgger.Swagger): The Swagger object.
+        - after_fork (function): The function called in each web worker after it is forked, when there are several.
+
+    Returns:
+        - None
+    """
+
+    logger = logs_handler.init("query") # The requests are logged by the 'query' logger, so its level can be set separately.
+
+    register_metrics()
+
+    export_slots = threading.BoundedSemaphore(int(os.environ.get("API_EXPORT_CONCURRENCY", "2"))) # The exports running at once in this worker.
+
+    # Each subscriber of the live feed keeps a thread of the server, which has that many threads on top of 'threads', so they never starve the other requests.
+    live_slots = threading.BoundedSemaphore(web_connections.live_max_subscribers()) # 0 disables the live feed.
+
+    @app.before_request
+    def start_request_timer() -> None:
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response: Response) -> Response:
+        # Registered before the compression, so it runs after it and counts the bytes sent.
+        endpoint = request.endpoint or "unknown"
+
+        metrics.observe("orus_request_seconds", time.perf_counter() - g.get("request_start", time.perf_counter()), (("endpoint", endpoint),))
+        metrics.increment("orus_requests_total", 1, (("endpoint", endpoint), ("status", response.status_code)))
+
+        if not response.is_streamed:
+            metrics.increment("orus_response_bytes_total", response.content_length or 0)
+
+        return response
+
+    @app.after_request
+    def compress_response(response: Response) -> Response:
+        # Compress the responses if the client accepts it (brotli or gzip), the streamed ones as they are sent.
+        encoding = response_encoder.negotiate_encoding(request.accept_encodings)
+
+        # The exports are already compressed, and the events of the live feed must not wait for a full block of the compressor.
+        if encoding is None or response.status_code != 200 or "Content-Encoding" in response.headers or response.mimetype in ("application/gzip", "text/event-stream"):
+            return response
+
+        response.vary.add("Accept-Encoding")
+
+        if response.is_streamed:
+            response.response = response_encoder.compress_stream(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+
+        else:
+            body = response.get_data()
+
+            if len(body) < int(os.environ.get("API_COMPRESS_MIN_SIZE", "1024")): # Small bodies do not pay off.
+                return response
+
+            response.set_data(response_encoder.compress(body, encoding))
+
+        response.headers["Content-Encoding"] = encoding
+
+        return response
+
+    @app.route("/OrusDashboard/API", methods = ["GET"])
+    def execute_request() -> jsonify:
+        table_id = request.args.get("table_id") # Get the table id from the request.
+        start_date = request.args.get("start_date") # Get the start date from the request.
+        end_date = request.args.get("end_date") # Get the end date from the request.
+        stream = request.args.get("stream") # Get the flag to stream the response from the request.
+        output_format = request.args.get("format") # Get the output format from the request.
+
+        if output_format is None: # Without the argument, the output format is negotiated with the Accept header.
+            output_format = response_encoder.negotiate_format(request.accept_mimetypes)
+        limit = request.args.get("limit") # Get the page size from the request.
+        cursor = request.args.get("cursor") # Get the continuation token from the request.
+        bucket = request.args.get("bucket") # Get the bucket size of the aggregation from the request.
+        aggregates = request.args.get("aggregates") # Get the aggregate functions from the request.
+        by_chip = request.args.get("by_chip") # Get the flag to aggregate each chip separately from the request.
+        since = request.args.get("since") # Get the date of the last reading seen by the client (delta mode) from the request.
+
+        # Create a dictionary with the arguments.
+        args = {
+            "table_id": table_id, "start_date": start_date, "end_date": end_date, "stream": stream, "format": output_format,
+            "limit": limit, "cursor": cursor, "bucket": bucket, "aggregates": aggregates, "by_chip": by_chip, "since": since,
+        }
+
+        logger.info(f"Request received. Table ID: {table_id}, Start Date: {start_date}, End Date: {end_date}")
+
+        try:
+            logger.debug("Checking the arguments...")
+            args = args_checker.check(args) # Check the arguments passed from the web clients.
+            logger.debug("Arguments checked successfully!")
+
+            table_id = args["table_id"]; start_date = args["start_date"]; end_date = args["end_date"] # Get the checked arguments.
+            measure = table_id in schema_catalog.measures() # The other tables (e.g. iot_chips) are not tracked, cached nor archived.
+            headers = {}
+
+            if args["since"] is not None: # Delta mode: only the readings after the last one seen by the client, until a settled instant.
+                start_date, end_date, headers["X-Next-Since"] = delta_range(args["since"], start_date, end_date)
+                args["start_date"] = start_date; args["end_date"] = end_date
+
+            elif measure: # The result only changes with the writes of its table, so it is validated without the database.
+                validators = write_marks.validators([table_id], query_cache.build_key(args))
+
+                if validators is not None:
+                    if write_marks.not_modified(validators, request.if_none_match, request.if_modified_since):
+                        metrics.increment("orus_not_modified_total")
+
+                        return Response(status = 304, headers = validators["headers"])
+
+                    headers.update(validators["headers"])
+
+            # The start of the live readings if the range (after the cursor) reaches into the archive, else None.
+            boundary = db_archive.boundary(table_id, args["cursor"][0] if args["cursor"] is not None else start_date) if measure else None
+
+            if args["bucket"] is not None: # If the values must be aggregated in time buckets.
+                # Answer the range from the coarsest rollup that fits the bucket size, if it covers a part of it.
+                rollup = db_rollups.route(table_id, args_checker.BUCKETS[args["bucket"]], start_date, end_date)
+
+                params = None
+
+                if rollup is not None:
+                    query = build_rollup_query(table_id, start_date, end_date, args["bucket"], args["aggregates"], args["by_chip"], rollup)
+
+                else:
+                    query = build_aggregate_query(table_id, start_date, end_date, args["bucket"], args["aggregates"], args["by_chip"])
+
+            else:
+                query, params = build_query(table_id, start_date, end_date, args["cursor"], args["limit"])
+
+            # If the response must be streamed (the pages are bounded and the columnar formats need the whole result, so they are not).
+            # The aggregations that reach into the archive are combined in memory, so they are not streamed either.
+            if args["format"] in response_encoder.STREAM_FORMATS and (args["stream"] or args["format"] != "json") and args["limit"] is None and (boundary is None or args["bucket"] is None):
+                logger.info(f"Streaming the data to the client as {args['format']}...")
+
+                if boundary is not None: # Send the archived readings first, then the live ones.
+                    response = stream_data(*build_query(table_id, boundary, end_date), args["format"], db_archive.read_chunks(table_id, start_date, archive_end(end_date, boundary)))
+
+                else:
+                    response = stream_data(query, params, args["format"])
+
+                response.headers.update(headers)
+
+                return response
+
+            logger.debug("Executing the queries to get the data from the database...")
+            column_names, data = fetch_data(query, params, args, boundary, measure) # Get the values from the cache or the database (and the archive).
+            logger.debug("Queries executed successfully!")
+
+            names = [column_name[0] for column_name in column_names] # Get the column names from the list.
+
+            if args["limit"] is not None and len(data) == args["limit"]: # If the page is full, there may be more rows after it.
+                last_row = data[-1]
+
+                # The continuation token points after the last row of the page.
+                headers["X-Next-Cursor"] = args_checker.encode_cursor(last_row[names.index("DATE")], last_row[names.index("CHIP_ID")], last_row[names.index("ID")])
+
+            if args["format"] not in response_encoder.STREAM_FORMATS: # Encode the columnar formats straight from the rows.
+                with metrics.timer("orus_format_seconds"):
+                    body = response_encoder.encode(names, data, args["format"], current_app.json)
+
+                metrics.increment("orus_rows_returned_total", len(data))
+
+                return Response(body, mimetype = response_encoder.MIMETYPES[args["format"]], headers = headers)
+
+            if args["format"] != "json": # If a page is requested in another format, encode it in one piece.
+                return Response("".join(encode_stream(names, [data], args["format"])), mimetype = response_encoder.MIMETYPES[args["format"]], headers = headers)
+
+            logger.debug("Formatting the data to be returned to the client...")
+
+            with metrics.timer("orus_format_seconds"):
+                result = format_data(column_names, data) # Format the data to be returned to the client.
+
+            logger.debug("Data formatted successfully!")
+
+            logger.debug("Returning the result to the client...")
+
+            with metrics.timer("orus_serialize_seconds"):
+                response = jsonify(result)
+
+            metrics.increment("orus_rows_returned_total", len(data))
+
+            return response, 200, headers
+
+        except Exception as error:
+            logger.error(f"An error occurred while processing the request. See the error below:")
+            logger.error(f"Error: {error}")
+
+            return jsonify(f"An error occurred while processing the request. Error: {error}"), 500
+
+    @app.route("/OrusDashboard/API/latest", methods = ["GET"])
+    def get_latest() -> jsonify:
+        # Create a dictionary with the arguments (table_id and chip_id are optional filters).
+        args = {"table_id": request.args.get("table_id"), "chip_id": request.args.get("chip_id")}
+
+        try:
+            args = args_checker.check_buffer_args(args) # Check the arguments passed from the web clients.
+
+            return jsonify(readings_buffer.latest(args["table_id"], args["chip_id"])), 200 # Answer from memory, without the database.
+
+        except Exception as error:
+            logger.error(f"An error occurred while processing the request. Error: {error}")
+
+            return jsonify(f"An error occurred while processing the request. Error: {error}"), 500
+
+    @app.route("/OrusDashboard/API/recent", methods = ["GET"])
+    def get_recent() -> jsonify:
+        # Create a dictionary with the arguments (table_id and chip_id are optional filters, window is in seconds).
+        args = {"table_id": request.args.get("table_id"), "chip_id": request.args.get("chip_id"), "window": request.args.get("window")}
+
+        try:
+            args = args_checker.check_buffer_args(args) # Check the arguments passed from the web clients.
+
+            return jsonify(readings_buffer.recent(args["window"], args["table_id"], args["chip_id"])), 200 # Answer from memory, without the database.
+
+        except Exception as error:
+            logger.error(f"An error occurred while processing the request. Error: {error}")
+
+            return jsonify(f"An error occurred while processing the request. Error: {error}"), 500
+
+    @app.route("/OrusDashboard/API/chips", methods = ["GET"])
+    def get_chips() -> jsonify:
+        # Create a dictionary with the arguments (chip_id and measures are separated by commas).
+        args = {
+            "chip_id": request.args.get("chip_id"), "measures": request.args.get("measures"),
+            "start_date": request.args.get("start_date"), "end_date": request.args.get("end_date"), "align": request.args.get("align"),
+        }
+
+        logger.info(f"Request received. Chip ID: {args['chip_id']}, Measures: {args['measures']}, Start Date: {args['start_date']}, End Date: {args['end_date']}")
+
+        try:
+            args = args_checker.check_chip_args(args) # Check the arguments passed from the web clients.
+
+            # The result only changes with the writes of its chips, so it is validated without the database.
+            validators = write_marks.validators([(measure, chip_id) for measure in args["measures"] for chip_id in args["chip_id"]], query_cache.build_key(args))
+            headers = validators["headers"] if validators is not None else {}
+
+            if validators is not None and write_marks.not_modified(validators, request.if_none_match, request.if_modified_since):
+                metrics.increment("orus_not_modified_total")
+
+                return Response(status = 304, headers = headers)
+
+            # Get the readings of every measure with a single query, on a single connection.
+            query, params = build_chips_query(args["chip_id"], args["measures"], args["start_date"], args["end_date"])
+
+            db_connection, db_cursor = db_connections.init() # Check out a connection from the pool.
+
+            try:
+                data = db_connections.execute(db_cursor, query, params)
+                column_names = db_cursor.description # Get the column names from the metadata of the result.
+
+            finally:
+                db_connections.close(db_connection, db_cursor) # Return the connection to the pool.
+
+            if args["align"]: # Return one row per chip and instant, with a column per measure.
+                return jsonify(align_readings(data, args["measures"])), 200, headers
+
+            return jsonify(format_data(column_names, data)), 200, headers
+
+        except Exception as error:
+            logger.error(f"An error occurred while processing the request. See the error below:")
+            logger.error(f"Error: {error}")
+
+            return jsonify(f"An error occurred while processing the request. Error: {error}"), 500
+
+    @app.route("/OrusDashboard/API/live", methods = ["GET"])
+    def get_live() -> Response:
+        # Create a dictionary with the arguments (measures and chip_id are optional filters, separated by commas).
+        args = {"measures": request.args.get("measures"), "chip_id": request.args.get("chip_id")}
+
+        try:
+            args = args_checker.check_live_args(args) # Check the arguments passed from the web clients.
+
+        except Exception as error:
+            return jsonify(f"An error occurred while processing the request. Error: {error}"), 400
+
+        if not live_slots.acquire(blocking = False):
+            return jsonify("Too many live subscribers, try again later."), 503, {"Retry-After": "30"}
+
+        subscriber = live_feed.subscribe(args["measures"], args["chip_id"])
+
+        def close() -> None: # Called once, when the client disconnects.
+            live_feed.unsubscribe(subscriber)
+            live_slots.release()
+
+        response = Response(stream_live(subscriber), mimetype = "text/event-stream", headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        response.call_on_close(close)
+
+        return response
+
+    @app.route("/OrusDashboard/API/export", methods = ["GET"])
+    def get_export() -> Response:
+        # Create a dictionary with the arguments (tables are separated by commas, cursor resumes an interrupted export).
+        args = {
+            "tables": request.args.get("tables"), "start_date": request.args.get("start_date"), "end_date": request.args.get("end_date"),
+            "format": request.args.get("format"), "cursor": request.args.get("cursor"),
+        }
+
+        logger.info(f"Export requested. Tables: {args['tables']}, Start Date: {args['start_date']}, End Date: {args['end_date']}, Cursor: {args['cursor']}")
+
+        try:
+            args = args_checker.check_export_args(args) # Check the arguments passed from the web clients.
+
+        except Exception as error:
+            return jsonify(f"An error occurred while processing the request. Error: {error}"), 400
+
+        # The exports are sorted and resumed on the ID of the readings, added by the migration V1.0.2.
+        missing = [table_id for table_id in args["tables"] if "ID" not in [name for name, _ in schema_catalog.columns(table_id)]]
+
+        if missing:
+            return jsonify(f"The exports need the ID column of the readings, added by the migration V1.0.2, which is not applied. Tables: {missing}"), 501
+
+        if not export_slots.acquire(blocking = False): # The exports have their own limit, so they cannot take every connection of the pool.
+            metrics.increment("orus_exports_rejected_total")
+
+            return jsonify("Too many exports are running, try again later."), 503, {"Retry-After": "30"}
+
+        try:
+            response = stream_export(args)
+
+        except Exception as error:
+            export_slots.release()
+
+            logger.error(f"An error occurred while starting the export. See the error below:")
+            logger.error(f"Error: {error}")
+
+            return jsonify(f"An error occurred while processing the request. Error: {error}"), 500
+
+        response.call_on_close(export_slots.release) # Free the slot when the download ends (or is interrupted).
+        metrics.increment("orus_exports_total")
+
+        return response
+
+    @app.route("/OrusDashboard/API/schema", methods = ["GET"])
+    def get_schema() -> jsonify:
+        return jsonify(schema_catalog.summary()), 200 # Return the schema catalog.
+
+    @app.route("/OrusDashboard/API/schema/refresh", methods = ["POST"])
+    def post_schema_refresh() -> jsonify:
+        try:
+            refresh_db_schema(logger) # Reload the schema catalog and the registry of chips.
+
+            return jsonify(schema_catalog.summary()), 200
+
+        except Exception as error:
+            return jsonify(f"An error occurred while refreshing the schema. Error: {error}"), 500
+
+    @app.route("/OrusDashboard/API/metrics", methods = ["GET"])
+    def get_metrics() -> Response:
+        # Return the metrics in the Prometheus text format.
+        return Response(metrics.render(), mimetype = "text/plain; version=0.0.4")
+
+    @app.route("/OrusDashboard/API/stats", methods = ["GET"])
+    def get_stats() -> jsonify:
+        # Return the statistics of the DataBase connection pool, the ingest pipeline and the query cache.
+        return jsonify({
+            "db_pool": db_connections.pool_stats(), "ingest": ingest_pipeline.stats(), "cache": query_cache.stats(), "buffer": readings_buffer.stats(),
+            "rollups": db_rollups.stats(), "archive": db_archive.stats(), "live": live_feed.stats(), "write_marks": write_marks.stats(),
+            "supervisor": supervisor.stats(),
+        }), 200
+
+    @app.route("/OrusDashboard/API/health", methods = ["GET"])
+    def get_health() -> jsonify:
+        # The process is alive and serving, whatever the state of the database and the broker (the liveness probe).
+        return jsonify({"status": "ok", "uptime_seconds": supervisor.stats()["uptime_seconds"]}), 200
+
+    @app.route("/OrusDashboard/API/ready", methods = ["GET"])
+    def get_ready() -> jsonify:
+        # The process can answer the requests (the readiness probe), from the state of the last probes of the supervisor, without querying the database.
+        ready, checks = supervisor.ready()
+        stats = supervisor.stats()
+
+        return jsonify({
+            "ready": ready, "checks": checks, "database": stats["database"], "broker": stats["broker"],
+            "db_pool": db_connections.pool_stats(), "ingest_degraded": ingest_pipeline.stats()["degraded"],
+        }), 200 if ready else 503
+
+    try:
+        logger.info("Starting the web services of the API...")
+        # The connections of the pool are closed before forking the workers, each worker opens its own.
+        web_connections.init(app, api, swagger, before_fork = db_connections.close_pool, after_fork = after_fork)
+        logger.info("Web services started successfully!")
+
+    except Exception as error:
+        logger.error(f"An error occurred while starting the web modules. See the error below:")
+        logger.error(f"Error: {error}")
+
+    pass
+
+def register_metrics() -> None:
+    """
+    This function exposes the statistics kept by the pool, the ingest pipeline and the cache as metrics.
+    They are read only when the metrics are scraped.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+    """
+
+    metrics.register_gauge("orus_ready", "1 if this process can answer the requests (database reachable, schema loaded and broker connected).", lambda: int(supervisor.ready()[0]))
+    metrics.register_gauge("orus_live_subscribers", "Subscribers of the live feed.", lambda: live_feed.stats()["subscribers"])
+    metrics.register_gauge("orus_live_delivered_total", "Readings sent to the subscribers of the live feed.", lambda: live_feed.stats()["delivered"], "counter")
+    metrics.register_gauge("orus_live_coalesced_total", "Readings coalesced or dropped for the slow subscribers of the live feed.", lambda: live_feed.stats()["coalesced"] + live_feed.stats()["dropped"], "counter")
+    metrics.register_gauge("orus_ingest_queue_depth", "Messages waiting in the queue of the ingest pipeline.", lambda: ingest_pipeline.stats()["queue_depth"])
+    metrics.register_gauge("orus_messages_written_total", "Messages written to the DataBase.", lambda: ingest_pipeline.stats()["written"], "counter")
+    metrics.register_gauge("orus_messages_dropped_total", "Messages dropped because the ingest queue was full.", lambda: ingest_pipeline.stats()["dropped"], "counter")
+    metrics.register_gauge("orus_messages_failed_total", "Messages lost because their batch could not be written.", lambda: ingest_pipeline.stats()["failed"], "counter")
+    metrics.register_gauge("orus_messages_spooled_total", "Messages written to the spool while the DataBase was unavailable.", lambda: ingest_pipeline.stats()["spooled"], "counter")
+    metrics.register_gauge("orus_messages_replayed_total", "Messages of the spool written to the DataBase.", lambda: ingest_pipeline.stats()["replayed"], "counter")
+    metrics.register_gauge("orus_ingest_degraded", "1 while the ingest writes to the spool because the DataBase is unavailable.", lambda: int(ingest_pipeline.stats()["degraded"]))
+    metrics.register_gauge("orus_ingest_spool_pending_bytes", "Bytes of the spool left to replay.", lambda: ingest_pipeline.stats()["spool"]["pending_bytes"])
+    metrics.register_gauge("orus_db_pool_in_use", "Connections of the DataBase pool in use.", lambda: db_connections.pool_stats()["in_use"])
+    metrics.register_gauge("orus_db_pool_idle", "Idle connections of the DataBase pool.", lambda: db_connections.pool_stats()["idle"])
+    metrics.register_gauge("orus_db_pool_waiters", "Threads waiting for a connection of the DataBase pool.", lambda: db_connections.pool_stats()["waiters"])
+    metrics.register_gauge("orus_db_pool_timeouts_total", "Checkouts of the DataBase pool that timed out.", lambda: db_connections.pool_stats()["timeouts"], "counter")
+    metrics.register_gauge("orus_cache_hits_total", "Requests answered from the query cache.", lambda: query_cache.stats()["hits"], "counter")
+    metrics.register_gauge("orus_cache_misses_total", "Requests that had to query the DataBase.", lambda: query_cache.stats()["misses"], "counter")
+
+def build_query(table_id: str, start_date: str, end_date: str, cursor: tuple = None, limit: int = None) -> tuple:
+    """
+    This function builds the query to get the values of a table between two dates.
+    The arguments must be already checked by the args checker. The measurement tables return their reading columns, the other ones every column.
+    If a page size is given, the rows are sorted by (DATE, CHIP_ID, ID) and the page starts after the cursor (keyset pagination),
+    so each page is a bounded range scan on the date index instead of an OFFSET. The ID breaks the ties of the readings of a chip
+    at the same second, and is returned as the last column of the page.
+
+    Args:
+        - table_id (str): The table to query.
+        - start_date (str): The start date, or None.
+        - end_date (str): The end date, or None.
+        - cursor (tuple): The (DATE, CHIP_ID, ID) of the last row of the previous page, or None for the first page.
+        - limit (int): The page size, or None to get every row.
+
+    Returns:
+        - query (str): The query to be executed on the database.
+        - params (tuple): The values of the placeholders of the query (the values of the cursor are not written in the query), or None.
+    """
+
+    conditions = build_date_conditions(start_date, end_date) # The conditions of the date range.
+    params = None
+
+    if cursor is not None: # Seek after the last row of the previous page.
+        cursor_date, cursor_chip_id, cursor_id = cursor
+        conditions.append("DATE >= %s AND (DATE > %s OR CHIP_ID > %s OR (CHIP_ID = %s AND ID > %s))")
+        params = (cursor_date, cursor_date, cursor_chip_id, cursor_chip_id, int(cursor_id))
+
+    columns = MEASURE_COLUMNS if table_id in schema_catalog.measures() else "*"
+    query = f"SELECT {columns}{', ID' if limit is not None else ''} FROM {table_id}" # Query to get the values from the table.
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    if limit is not None: # Sort the rows by the key of the pagination and bound the page.
+        query += f" ORDER BY DATE, CHIP_ID, ID LIMIT {limit}"
+
+    return query, params
+
+def build_aggregate_query(table_id: str, start_date: str, end_date: str, bucket: str, aggregates: list, by_chip: bool) -> str:
+    """
+    This function builds the query to aggregate the values of a table between two dates in time buckets.
+    The buckets are computed from the indexed DATE column and grouped by the database, so only one row per bucket (and chip) is returned.
+    The arguments must be already checked by the args checker.
+
+    Args:
+        - table_id (str): The table to query.
+        - start_date (str): The start date, or None.
+        - end_date (str): The end date, or None.
+        - bucket (str): The bucket size (one of args_checker.BUCKETS).
+        - aggregates (list): The aggregate functions (of args_checker.AGGREGATES).
+        - by_chip (bool): True to aggregate each chip separately.
+
+    Returns:
+        - query (str): The query to be executed on the database.
+    """
+
+    columns = ["CHIP_ID"] if by_chip else []
+    columns.append(f"{build_bucket_expression(args_checker.BUCKETS[bucket])} AS BUCKET") # The start of the bucket of each value.
+    columns += [f"{aggregate.upper()}(VALUE) AS {aggregate.upper()}" for aggregate in aggregates]
+
+    group_by = "CHIP_ID, BUCKET" if by_chip else "BUCKET"
+
+    query = f"SELECT {', '.join(columns)} FROM {table_id}"
+    conditions = build_date_conditions(start_date, end_date) # The conditions of the date range.
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += f" GROUP BY {group_by} ORDER BY {group_by}"
+
+    return query
+
+def build_rollup_query(table_id: str, start_date: str, end_date: str, bucket: str, aggregates: list, by_chip: bool, rollup: tuple) -> str:
+    """
+    This function builds the query to aggregate the values of a table in time buckets from a rollup table.
+    The hours (or days) covered by the rollup are read from it, the part of the range before its first bucket and after its end
+    (the readings not rolled up yet) are aggregated from the raw table. The partial aggregates of the three parts are combined per bucket.
+    The result has the same columns as the query of build_aggregate_query.
+
+    Args:
+        - table_id (str): The table to query.
+        - start_date (str): The start date, or None.
+        - end_date (str): The end date, or None.
+        - bucket (str): The bucket size (one of args_checker.BUCKETS), a multiple of the granularity of the rollup.
+        - aggregates (list): The aggregate functions (of args_checker.AGGREGATES).
+        - by_chip (bool): True to aggregate each chip separately.
+        - rollup (tuple): The (table, granularity, first bucket, end) returned by db_rollups.route.
+
+    Returns:
+        - query (str): The query to be executed on the database.
+    """
+
+    rollup_table, granularity, first, last = rollup
+    bucket_seconds = args_checker.BUCKETS[bucket]
+    keys = "CHIP_ID, " if by_chip else ""
+    first = first.strftime("%Y-%m-%d %H:%M:%S") if first is not None else None
+    last = last.strftime("%Y-%m-%d %H:%M:%S")
+
+    parts = []
+
+    if start_date is not None and start_date < first: # The head of the range, before the first bucket of the rollup.
+        parts.append(build_raw_partials(table_id, bucket_seconds, by_chip, [f"DATE >= '{start_date}'", f"DATE < '{first}'"]))
+
+    parts.append(build_rollup_partials(table_id, bucket_seconds, by_chip, rollup_table, first, last))
+
+    # The tail, not rolled up yet.
+    parts.append(build_raw_partials(table_id, bucket_seconds, by_chip, [f"DATE >= '{last}'"] + ([f"DATE <= '{end_date}'"] if end_date is not None else [])))
+
+    combined = {"min": "MIN(LOW)", "max": "MAX(HIGH)", "count": "CAST(SUM(N) AS SIGNED)", "sum": "SUM(TOTAL)", "avg": "SUM(TOTAL) / SUM(N)"}
+    columns = [f"{combined[aggregate]} AS {aggregate.upper()}" for aggregate in aggregates]
+
+    return f"SELECT {keys}BUCKET, {', '.join(columns)} FROM ({' UNION ALL '.join(parts)}) AS PARTS GROUP BY {keys}BUCKET ORDER BY {keys}BUCKET"
+
+def build_raw_partials(table_id: str, bucket_seconds: int, by_chip: bool, conditions: list) -> str:
+    """
+    This function builds the query of the partial aggregates of the raw readings of a part of a date range, per bucket (and chip).
+
+    Args:
+        - table_id (str): The table to query.
+        - bucket_seconds (int): The bucket size, in seconds.
+        - by_chip (bool): True to aggregate each chip separately.
+        - conditions (list): The SQL conditions of the part of the range.
+
+    Returns:
+        - query (str): The query, its rows are ([CHIP_ID,] BUCKET, N, LOW, HIGH, TOTAL).
+    """
+
+    keys = "CHIP_ID, " if by_chip else ""
+
+    return (
+        f"SELECT {keys}{build_bucket_expression(bucket_seconds)} AS BUCKET, COUNT(VALUE) AS N, MIN(VALUE) AS LOW, MAX(VALUE) AS HIGH, SUM(VALUE) AS TOTAL "
+        f"FROM {table_id} WHERE {' AND '.join(conditions)} GROUP BY {keys}BUCKET"
+    )
+
+def build_rollup_partials(table_id: str, bucket_seconds: int, by_chip: bool, rollup_table: str, first: str, last: str) -> str:
+    """
+    This function builds the query of the partial aggregates of the rows of a rollup table, per bucket (and chip).
+
+    Args:
+        - table_id (str): The table (and measure) queried.
+        - bucket_seconds (int): The bucket size, in seconds (a multiple of the granularity of the rollup).
+        - by_chip (bool): True to aggregate each chip separately.
+        - rollup_table (str): The rollup table.
+        - first (str): The first bucket of the rollup to read, or None.
+        - last (str): The end (exclusive) of the buckets of the rollup to read.
+
+    Returns:
+        - query (str): The query, its rows are ([CHIP_ID,] BUCKET, N, LOW, HIGH, TOTAL).
+    """
+
+    keys = "CHIP_ID, " if by_chip else ""
+    conditions = [f"MEASURE = '{table_id}'"] + ([f"BUCKET >= '{first}'"] if first is not None else []) + [f"BUCKET < '{last}'"]
+    rollup_bucket = build_bucket_expression(bucket_seconds, "BUCKET")
+
+    return ( # Grouped by the expression, in GROUP BY the name BUCKET is the column of the rollup table.
+        f"SELECT {keys}{rollup_bucket} AS BUCKET, SUM(COUNT) AS N, MIN(MIN) AS LOW, MAX(MAX) AS HIGH, SUM(SUM) AS TOTAL "
+        f"FROM {rollup_table} WHERE {' AND '.join(conditions)} GROUP BY {keys}{rollup_bucket}"
+    )
+
+def build_bucket_expression(bucket_seconds: int, column: str = "DATE") -> str:
+    """
+    This function builds the SQL expression of the start of the time bucket of a date.
+    The buckets are counted from a fixed Monday, so they do not depend on the time zone of the session and the weeks start on Monday.
+
+    Args:
+        - bucket_seconds (int): The bucket size, in seconds.
+        - column (str): The date column.
+
+    Returns:
+        - expression (str): The SQL expression.
+    """
+
+    return f"DATE_ADD(TIMESTAMP('{BUCKET_ORIGIN}'), INTERVAL FLOOR(TIMESTAMPDIFF(SECOND, '{BUCKET_ORIGIN}', {column}) / {bucket_seconds}) * {bucket_seconds} SECOND)"
+
+def build_chips_query(chip_ids: list, measures: list, start_date: str, end_date: str) -> tuple:
+    """
+    This function builds the query to get the values of several measures of some chips between two dates.
+    The measurement tables are combined with UNION ALL, each part is a range scan on the (CHIP_ID, DATE) index.
+    The arguments must be already checked by the args checker.
+
+    Args:
+        - chip_ids (list): The chips to query.
+        - measures (list): The measures (and tables) to query.
+        - start_date (str): The start date, or None.
+        - end_date (str): The end date, or None.
+
+    Returns:
+        - query (str): The query to be executed on the database, its rows are (CHIP_ID, MEASURE, VALUE, DATE) sorted by chip and date.
+        - params (tuple): The values of the placeholders of the query (the chip ids are not written in the query).
+    """
+
+    conditions = [f"CHIP_ID IN ({', '.join(['%s'] * len(chip_ids))})"] + build_date_conditions(start_date, end_date)
+    parts = [f"SELECT CHIP_ID, '{measure}' AS MEASURE, VALUE, DATE FROM {measure} WHERE {' AND '.join(conditions)}" for measure in measures]
+
+    return " UNION ALL ".join(parts) + " ORDER BY CHIP_ID, DATE, MEASURE", tuple(chip_ids) * len(measures) # The order applies to the whole union.
+
+def align_readings(data: list, measures: list) -> list:
+    """
+    This function aligns the readings of several measures on their date: one row per chip and instant, with a column per measure.
+    A measure without a reading at an instant is null.
+
+    Args:
+        - data (list): The rows (CHIP_ID, MEASURE, VALUE, DATE), sorted by chip and date.
+        - measures (list): The measures queried.
+
+    Returns:
+        - result (list): The aligned rows as {"CHIP_ID", "DATE", <measure>: value, ...}.
+    """
+
+    result = []
+    row = None
+
+    for CHIP_ID, MEASURE, VALUE, DATE in data: # Iterate over the rows, the readings of an instant are consecutive.
+        if row is None or row["CHIP_ID"] != CHIP_ID or row["DATE"] != DATE:
+            row = {"CHIP_ID": CHIP_ID, "DATE": DATE}
+            row.update((measure, None) for measure in measures)
+            result.append(row)
+
+        row[MEASURE] = VALUE
+
+    return result
+
+def build_date_conditions(start_date: str, end_date: str) -> list:
+    """
+    This function builds the conditions of the date range of a query.
+
+    Args:
+        - start_date (str): The start date, or None.
+        - end_date (str): The end date, or None.
+
+    Returns:
+        - conditions (list): The SQL conditions (empty if both dates are missing).
+    """
+
+    conditions = []
+
+    if start_date != None: # Get the values from the start date.
+        conditions.append(f"DATE >= '{start_date}'")
+
+    if end_date != None: # Get the values until the end date.
+        conditions.append(f"DATE <= '{end_date}'")
+
+    return conditions
+
+def fetch_data(query: str, params: tuple, args: dict, boundary: str = None, cache: bool = True) -> tuple:
+    """
+    This function gets the result of a query, from the query cache if possible.
+    If the cached result is stale (new readings were written in its open range), only the tail after its last date is queried and appended.
+    If the range reaches into the archive, the archived readings are merged with the live ones (see fetch_archived_data).
+
+    Args:
+        - query (str): The query to be executed on the database.
+        - params (tuple): The values of the placeholders of the query, or None.
+        - args (dict): The checked arguments of the request (they are the cache key).
+        - boundary (str): The date before which the readings are archived, if the range reaches into the archive, or None.
+        - cache (bool): False to always query the database, for the tables whose writes do not invalidate the cache.
+
+    Returns:
+        - column_names (list): The column metadata of the result (cursor description).
+        - data (list): The rows of the result.
+
+    Raises:
+        - Exception: If there is an error in executing the query.
+    """
+
+    cache_key = query_cache.build_key(args)
+    cached = query_cache.get(cache_key) if cache else None
+
+    if cached is not None and not cached["stale"]: # If the result is cached and up to date.
+        return cached["columns"], cached["rows"]
+
+    db_connection, db_cursor = db_connections.init() # Check out a connection from the pool.
+
+    try:
+        if cached is not None: # If only the open tail of the result changed, query it from the last cached date.
+            tail_start = cached["last_date"].strftime("%Y-%m-%d %H:%M:%S") if cached["last_date"] is not None else args["start_date"]
+            tail_rows = db_connections.execute(db_cursor, *build_query(args["table_id"], tail_start, None))
+
+            return cached["columns"], query_cache.extend(cache_key, cached, tail_rows)
+
+        if boundary is not None: # Merge the archived readings with the live ones.
+            column_names, data = fetch_archived_data(db_cursor, args, boundary)
+
+        else:
+            data = [value for value in db_connections.execute(db_cursor, query, params)] # Execute the query to get the values from the table.
+            column_names = db_cursor.description # Get the column names from the metadata of the result.
+
+    finally:
+        db_connections.close(db_connection, db_cursor) # Return the connection to the pool.
+
+    if not cache:
+        return column_names, data
+
+    # Cache the result. The raw rows of an open range can be extended with the new readings, the aggregations and pages cannot.
+    query_cache.put(cache_key, args["table_id"], column_names, data, args["end_date"] is None, args["bucket"] is None and args["limit"] is None)
+
+    return column_names, data
+
+def fetch_archived_data(db_cursor: mysql.connector.cursor, args: dict, boundary: str) -> tuple:
+    """
+    This function gets the result of a request whose range reaches into the archive, merging the archived readings with the live ones.
+    Only the segments of the archive that overlap the range are read. The raw readings before the boundary are read from the archive
+    and the ones after it from the table (a page takes the first archived rows after the cursor and is completed from the table).
+    The aggregations read the rollups as usual, the parts of the range that are not rolled up are aggregated from the archive before
+    the boundary and from the table after it, and the partial aggregates are combined per bucket.
+
+    Args:
+        - db_cursor (mysql.connector.cursor): The cursor object.
+        - args (dict): The checked arguments of the request.
+        - boundary (str): The date before which the readings are archived.
+
+    Returns:
+        - column_names (list): The column metadata of the result (the name is the first item of each column).
+        - data (list): The rows of the result, with the columns of the query of the request.
+
+    Raises:
+        - Exception: If there is an error in reading the archive or executing the queries.
+    """
+
+    table_id = args["table_id"]; start_date = args["start_date"]; end_date = args["end_date"]
+
+    if args["bucket"] is None:
+        if args["limit"] is not None: # The first rows by (DATE, CHIP_ID, ID) after the cursor, the segments are merged in that order.
+            rows = db_archive.read_ordered(table_id, start_date, archive_end(end_date, boundary), args["cursor"])
+            archived = [(*row[1:], row[0]) for row in itertools.islice(rows, args["limit"])] # The ID last, like the columns of a page.
+            limit = args["limit"] - len(archived)
+
+        else:
+            archived = list(db_archive.read(table_id, start_date, archive_end(end_date, boundary)))
+            limit = None
+
+        live = db_connections.execute(db_cursor, *build_query(table_id, boundary, end_date, args["cursor"], limit))
+
+        return db_cursor.description, archived + [row for row in live]
+
+    bucket_seconds = args_checker.BUCKETS[args["bucket"]]
+    end = archive_end(end_date, None) # The end of the range (exclusive).
+    rollup = db_rollups.route(table_id, bucket_seconds, start_date, end_date)
+    parts = []; ranges = [] # The queries of the partial aggregates and the (start, end) of the parts of the range not rolled up.
+
+    if rollup is not None:
+        rollup_table, granularity, first, last = rollup
+        first = first.strftime("%Y-%m-%d %H:%M:%S") if first is not None else None
+        last = last.strftime("%Y-%m-%d %H:%M:%S")
+
+        parts.append(build_rollup_partials(table_id, bucket_seconds, args["by_chip"], rollup_table, first, last))
+        ranges = ([(start_date, first)] if start_date is not None and start_date < first else []) + [(last, end)]
+
+    else:
+        ranges = [(start_date, end)]
+
+    archived = []
+
+    for lower, upper in ranges: # Split each part at the boundary.
+        if lower is None or lower < boundary:
+            archived.append(db_archive.read(table_id, lower, min(upper, boundary) if upper is not None else boundary))
+            lower = boundary
+
+        if upper is None or lower < upper:
+            parts.append(build_raw_partials(table_id, bucket_seconds, args["by_chip"], [f"DATE >= '{lower}'"] + ([f"DATE < '{upper}'"] if upper is not None else [])))
+
+    partials = {} # The [N, LOW, HIGH, TOTAL] of each ([CHIP_ID,] BUCKET).
+
+    def add(key: tuple, count: int, low: float, high: float, total: float) -> None:
+        partial = partials.get(key)
+
+        if partial is None:
+            partials[key] = [count, low, high, total]
+
+        else:
+            partial[0] += count; partial[1] = min(partial[1], low); partial[2] = max(partial[2], high); partial[3] += total
+
+    if parts:
+        for *key, count, low, high, total in db_connections.execute(db_cursor, " UNION ALL ".join(parts)):
+            if count: # SUM returns a DECIMAL.
+                add(tuple(key), int(count), low, high, float(total))
+
+    origin = datetime.strptime(BUCKET_ORIGIN, "%Y-%m-%d %H:%M:%S")
+
+    for rows in archived:
+        for chip_id, _, value, date in rows:
+            bucket_start = origin + timedelta(seconds = (int((date - origin).total_seconds()) // bucket_seconds) * bucket_seconds)
+            add((chip_id, bucket_start) if args["by_chip"] else (bucket_start,), 1, value, value, value)
+
+    combined = {"min": lambda p: p[1], "max": lambda p: p[2], "count": lambda p: p[0], "sum": lambda p: p[3], "avg": lambda p: p[3] / p[0]}
+    names = (["CHIP_ID"] if args["by_chip"] else []) + ["BUCKET"] + [aggregate.upper() for aggregate in args["aggregates"]]
+    data = [key + tuple(combined[aggregate](partial) for aggregate in args["aggregates"]) for key, partial in sorted(partials.items())]
+
+    return [(name,) for name in names], data
+
+def archive_end(end_date: str, boundary: str) -> str:
+    """
+    This function returns the exclusive end of the part of a date range read from the archive.
+
+    Args:
+        - end_date (str): The end date (inclusive) of the range, or None.
+        - boundary (str): The date before which the readings are archived, or None.
+
+    Returns:
+        - end (str): The end (exclusive), or None if the range and the archive are open.
+    """
+
+    end = (datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S") + timedelta(seconds = 1)).strftime("%Y-%m-%d %H:%M:%S") if end_date is not None else None
+
+    if boundary is not None:
+        end = min(end, boundary) if end is not None else boundary
+
+    return end
+
+def delta_range(since: str, start_date: str, end_date: str) -> tuple:
+    """
+    This function returns the date range of a delta, the readings after the last one seen by the client.
+    The range ends some seconds ago (the 'delta_settle' setting), so the readings of its last second that arrive late are not missed:
+    the next delta starts after this end, not after the last reading returned.
+
+    Args:
+        - since (str): The date of the last reading seen by the client (the X-Next-Since of the previous delta).
+        - start_date (str): The start date of the request, or None.
+        - end_date (str): The end date of the request, or None.
+
+    Returns:
+        - start_date (str): The start date of the delta.
+        - end_date (str): The end date of the delta (inclusive).
+        - next_since (str): The 'since' of the next delta.
+    """
+
+    after = (datetime.strptime(since, "%Y-%m-%d %H:%M:%S") + timedelta(seconds = 1)).strftime("%Y-%m-%d %H:%M:%S")
+    settled = (datetime.now() - timedelta(seconds = float(os.environ.get("API_DELTA_SETTLE", "5")))).strftime("%Y-%m-%d %H:%M:%S")
+
+    start_date = max(start_date, after) if start_date is not None else after
+    end_date = min(end_date, settled) if end_date is not None else settled
+
+    return start_date, end_date, max(since, end_date) # The client never goes back, even if the range is empty.
+
+def build_export_query(table_id: str, start_date: str, end_date: str, after: tuple = None) -> tuple:
+    """
+    This function builds the query of an export of a table: its readings between two dates sorted by (DATE, CHIP_ID, ID),
+    the order of its (DATE, CHIP_ID) index, so the rows are streamed without sorting them.
+    The arguments must be already checked by the args checker.
+
+    Args:
+        - table_id (str): The table to export.
+        - start_date (str): The start date, or None.
+        - end_date (str): The end date, or None.
+        - after (tuple): The (DATE, CHIP_ID, ID) of the last row received, to resume an interrupted export, or None.
+
+    Returns:
+        - query (str): The query to be executed on the database.
+        - params (tuple): The values of the placeholders of the query (the values of the cursor are not written in the query).
+    """
+
+    conditions = build_date_conditions(start_date, end_date) # The conditions of the date range.
+    params = ()
+
+    if after is not None: # Seek after the last row received.
+        after_date, after_chip_id, after_id = after
+        conditions.append("DATE >= %s AND (DATE > %s OR CHIP_ID > %s OR (CHIP_ID = %s AND ID > %s))")
+        params = (after_date, after_date, after_chip_id, after_chip_id, int(after_id))
+
+    query = f"SELECT ID, {MEASURE_COLUMNS} FROM {table_id}"
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    return query + " ORDER BY DATE, CHIP_ID, ID", params
+
+def stream_export(args: dict) -> Response:
+    """
+    This function streams an export of some tables as a gzip file, reading each one with an unbuffered cursor,
+    so the memory used does not depend on the size of the export. The archived readings of a table are sent before its live ones.
+    The rows are sorted by table (in the order requested) and (DATE, CHIP_ID, ID). An interrupted download is resumed by passing
+    as the cursor the hexadecimal encoding of 'MEASURE|DATE|CHIP_ID|ID' of the last complete row received.
+    The connection is returned to the pool when the response is closed.
+
+    Args:
+        - args (dict): The checked arguments of the export.
+
+    Returns:
+        - response (flask.Response): The streamed response.
+
+    Raises:
+        - Exception: If there is an error in checking out a connection.
+    """
+
+    db_connection, db_cursor = db_connections.init() # Check out a connection from the pool.
+    tables = args["tables"]
+
+    if args["cursor"] is not None: # Skip the tables already received.
+        tables = tables[tables.index(args["cursor"][0]):]
+
+    def chunks() -> iter:
+        chunk_size = int(os.environ.get("API_DB_STREAM_CHUNK_SIZE", "1000"))
+
+        for table_id in tables:
+            after = args["cursor"][1:] if args["cursor"] is not None and args["cursor"][0] == table_id else None
+            start_date = args["start_date"]
+            boundary = db_archive.boundary(table_id, after[0] if after is not None else start_date)
+
+            if boundary is not None: # The archived readings first, in the same order.
+                rows = db_archive.read_ordered(table_id, start_date, archive_end(args["end_date"], boundary), after)
+
+                while True:
+                    chunk = [(table_id, *row) for row in itertools.islice(rows, chunk_size)]
+
+                    if not chunk:
+                        break
+
+                    yield chunk
+
+                start_date = boundary
+
+            query, params = build_export_query(table_id, start_date, args["end_date"], after)
+
+            for chunk in db_connections.stream(db_cursor, query, chunk_size, params):
+                yield [(table_id, *row) for row in chunk]
+
+    parts = response_encoder.compress_stream(encode_stream(EXPORT_COLUMNS, chunks(), args["format"]), "gzip")
+    file_name = f"orus_export.{args['format']}.gz"
+
+    response = Response(stream_with_context(parts), mimetype = "application/gzip", headers = {"Content-Disposition": f"attachment; filename={file_name}"})
+    response.call_on_close(lambda: db_connections.close(db_connection, db_cursor)) # Return the connection to the pool when the response is closed.
+
+    return response
+
+def stream_live(subscriber: dict) -> iter:
+    """
+    This function encodes the readings pushed to a subscriber of the live feed as Server-Sent Events, as they are committed.
+    The readings received while the previous event was sent are grouped in a single 'readings' event (a JSON list of
+    {CHIP_ID, MEASURE, VALUE, DATE}). A 'coalesced' event tells how many readings a slow client skipped, and an idle
+    subscription sends a comment every 'live_heartbeat' seconds, so the proxies and the server keep it open.
+
+    Args:
+        - subscriber (dict): The subscriber, as returned by live_feed.subscribe.
+
+    Returns:
+        - parts (iter): An iterator over the events.
+    """
+
+    heartbeat = float(os.environ.get("API_LIVE_HEARTBEAT", "15"))
+
+    yield "retry: 5000\n\n" # The milliseconds the client waits before reconnecting.
+
+    while True:
+        readings, coalesced = live_feed.wait(subscriber, heartbeat)
+
+        if coalesced:
+            yield f"event: coalesced\ndata: {coalesced}\n\n"
+
+        if readings:
+            yield f"event: readings\ndata: [{','.join(readings)}]\n\n"
+
+        elif not coalesced:
+            yield ": keepalive\n\n"
+
+def stream_data(query: str, params: tuple, output_format: str, head_chunks: iter = None) -> Response:
+    """
+    This function streams the results of a query to the client.
+    The rows are read with an unbuffered cursor in chunks and encoded as they are sent, so the memory used does not depend on the size of the result.
+    The connection is returned to the pool when the response is closed.
+
+    Args:
+        - query (str): The query to be executed on the database.
+        - params (tuple): The values of the placeholders of the query, or None.
+        - output_format (str): The output format ('json', 'ndjson' or 'csv').
+        - head_chunks (iter): The chunks of rows sent before the ones of the query (the archived readings), or None.
+
+    Returns:
+        - response (flask.Response): The streamed response.
+
+    Raises:
+        - Exception: If there is an error in executing the query.
+    """
+
+    db_connection, db_cursor = db_connections.init() # Check out a connection from the pool.
+
+    try:
+        chunks = db_connections.stream(db_cursor, query, params = params) # Execute the query, the rows are read while streaming.
+
+        if head_chunks is not None:
+            chunks = itertools.chain(head_chunks, chunks)
+        column_names = [column[0] for column in db_cursor.description] # Get the column names from the metadata of the result.
+
+    except Exception as error:
+        db_connections.close(db_connection, db_cursor) # Return the connection to the pool.
+        raise error
+
+    response = Response(stream_with_context(encode_stream(column_names, chunks, output_format)), mimetype = response_encoder.MIMETYPES[output_format])
+    response.call_on_close(lambda: db_connections.close(db_connection, db_cursor)) # Return the connection to the pool when the response is closed.
+
+    return response
+
+def encode_stream(column_names: list, chunks: iter, output_format: str) -> iter:
+    """
+    This function encodes the chunks of rows of a result incrementally.
+
+    Args:
+        - column_names (list): The column names of the result.
+        - chunks (iter): An iterator over the lists of rows of the result.
+        - output_format (str): The output format ('json', 'ndjson' or 'csv').
+
+    Returns:
+        - parts (iter): An iterator over the encoded parts of the response.
+    """
+
+    if output_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(column_names) # Write the header.
+
+        for chunk in chunks:
+            writer.writerows(chunk)
+            metrics.increment("orus_rows_returned_total", len(chunk))
+
+            yield buffer.getvalue()
+
+            buffer.seek(0); buffer.truncate(0) # Empty the buffer for the next chunk.
+
+        if buffer.tell(): # If there are no rows, send only the header.
+            yield buffer.getvalue()
+
+        return
+
+    json_provider = current_app.json # The same encoder used by jsonify.
+
+    if output_format == "json":
+        yield "["
+
+    separator = ""
+
+    for chunk in chunks:
+        # Encode each row as {column_name: value}, compact like jsonify.
+        lines = [json_provider.dumps({column_names[i]: row[i] for i in range(len(row))}, separators = (",", ":")) for row in chunk]
+        metrics.increment("orus_rows_returned_total", len(chunk))
+
+        if output_format == "json":
+            yield separator + ",".join(lines)
+            separator = ","
+
+        else:
+            yield "\n".join(lines) + "\n"
+
+    if output_format == "json":
+        yield "]"
+
+def warm_readings_buffer(logger: logging.Logger) -> None:
+    """
+    This function loads the latest readings of every chip from the database into the in-memory buffer.
+
+    Args:
+        - logger (logging.Logger): The logger object.
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    try:
+        logger.info("Loading the latest readings in memory...")
+
+        db_connection, db_cursor = db_connections.init() # Check out a connection from the pool.
+
+        try:
+            readings_buffer.warm(db_cursor, list(schema_catalog.measures())) # Load the readings of every measurement table.
+
+        finally:
+            db_connections.close(db_connection, db_cursor) # Return the connection to the pool.
+
+        logger.info(f"Latest readings loaded successfully! Stats: {readings_buffer.stats()}")
+
+    except Exception as error:
+        logger.error(f"An error occurred while loading the latest readings. See the error below:")
+        logger.error(f"Error: {error}")
+
+def refresh_db_schema(logger: logging.Logger) -> None:
+    """
+    This function (re)loads the schema catalog and the registry of chips and data types, and empties the query cache.
+
+    Args:
+        - logger (logging.Logger): The logger object.
+
+    Returns:
+        - None
+
+    Raises:
+        - Exception: If there is an error in reading the schema.
+    """
+
+    logger.info("Loading the schema catalog and the registry of chips...")
+
+    db_connection, db_cursor = db_connections.init() # Check out a connection from the pool.
+
+    try:
+        schema_catalog.load(db_cursor) # Load the tables, columns and measures.
+        db_connections.load_registry(db_cursor) # Load the chips and data types used by the ingest path.
+
+    finally:
+        db_connections.close(db_connection, db_cursor) # Return the connection to the pool.
+
+    data_checker.compiled() # Compile the validator of the payloads for the new catalog.
+
+    query_cache.clear() # The cached results may not match the new schema.
+
+    logger.info(f"Schema catalog loaded successfully! Tables: {sorted(schema_catalog.tables())}")
+
+def broker_on_message(client, userdata, message) -> None:
+    """
+    This function is called by the mqtt client thread when a new message is received from the broker.
+    With QoS 1, the message is acknowledged once it is committed to the database, or when it is rejected or dropped (it will never be written).
+
+    Args:
+        - client (paho.mqtt.client.Client): The client object.
+        - userdata: The user data.
+        - message (paho.mqtt.client.MQTTMessage): The message object.
+
+    Returns:
+        - None
+    """
+
+    logger = logs_handler.init("ingest") # Get the logger of the ingest path.
+    metrics.increment("orus_messages_received_total")
+
+    try:
+
+        logger.debug("New message received from the MQTT broker, processing the message...")
+
+        with metrics.timer("orus_ingest_parse_seconds"):
+            data = data_checker.parse_data(message.payload) # Parse the data received from the broker.
+
+        ack = lambda: broker_connections.acknowledge(client, message) # Acknowledge the message once its batch is committed.
+
+        if ingest_pipeline.enqueue(data, ack, client if message.qos > 0 else None): # Queue the data for the writer thread, which writes it to the database in batches.
+            logger.debug("Data parsed and queued to be written to the database.")
+
+        else:
+            logger.warning(f"The ingest queue is full, the message was dropped. Message: {data}")
+
+    except Exception as error:
+        metrics.increment("orus_messages_rejected_total")
+        broker_connections.acknowledge(client, message) # A rejected message must not be delivered again.
+
         logger.error(f"An error occurred while processing the message. See the error below:")
         logger.error(f"Error: {error}")
 
@@ -1,46 +1,321 @@
 from paho.mqtt import client as mqtt
 import time
+import socket
 import threading
 from utils import data_checker
 import os
 
-def init(broker_on_message: callable) -> mqtt.Client:
+# State of the connections of this process to the broker mqtt.
+broker_loops = {} # The network thread of each client, indexed by the id of the client.
+broker_subscribing = threading.Event() # Set once the messages can be processed (the schema is loaded), the workers only subscribe then.
+
+def init(broker_on_message: callable, worker: int = 0, process: int = 0) -> mqtt.Client:
     """
-    This function initializes the connection to the broker mqtt.
+    This function initializes a connection (an ingest worker) to the broker mqtt.
+    Every worker has its own client id and network thread. With several workers (in one or several processes or hosts),
+    they subscribe to a shared subscription, so the broker splits the messages of the topic between them.
+    With QoS 1 the messages are acknowledged manually, with acknowledge, once they are committed to the database.
+    The connection is opened in the background, so the caller does not wait for it (see wait_connected), and the worker only subscribes
+    once open_subscriptions is called. The client reconnects and subscribes again automatically, with an exponential backoff between the attempts.
 
     Args:
         - broker_on_message (function): The function to be called when a message is received from the broker mqtt.
+        - worker (int): The index of the worker in its process.
+        - process (int): The index of the ingest process.
 
     Returns:
         - broker_connection (paho.mqtt.client.Client): The client object.
 
     Raises:
-        - mysql.connector.Error: If there is an error in connecting to the database.
+        - Exception: If the client cannot be set up (e.g. the settings of the broker are missing).
     """
 
     # Get the credentials from the environment variables.
     host = str(os.environ["API_MQTT_HOST"]); port = int(os.environ["API_MQTT_PORT"])
     user = str(os.environ["API_MQTT_USER"]); password = str(os.environ["API_MQTT_PASSWORD"])
+    topic = subscription_topic(); qos = int(os.environ.get("API_MQTT_QOS", "1"))
+
+    def on_connect(client, userdata, flags, rc) -> None:
+        if rc == 0 and broker_subscribing.is_set(): # Subscribe (again) on every connection, once the messages can be processed.
+            client.subscribe(topic, qos)
+
+    try:
+        # Initialize the connection to the broker mqtt. The session is kept by the broker (the client id is stable),
+        # so the messages not acknowledged before a disconnection are delivered again.
+        mqtt_client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION1, client_id = client_id(worker, process), clean_session = False, manual_ack = qos > 0
+        )
+
+        mqtt_client.username_pw_set(user, password) # Set the credentials for the broker server.
+        mqtt_client.tls_set() # Set the tls for the broker server.
+        mqtt_client.reconnect_delay_set( # Set the backoff between the reconnection attempts.
+            min_delay = int(os.environ.get("API_MQTT_RECONNECT_MIN_DELAY", "1")), max_delay = int(os.environ.get("API_MQTT_RECONNECT_MAX_DELAY", "60"))
+        )
+        mqtt_client.on_connect = on_connect
+        mqtt_client.on_message = broker_on_message # Set the on_message function.
+        mqtt_client.connect_async(host, port) # Connect to the broker server from the network thread.
+
+        start_loop(mqtt_client, f"mqtt-worker-{worker}") # Start the thread for the mqtt client in loop forever (it connects and reconnects).
+
+        return mqtt_client
+
+    except Exception as error: # If there is an error in connecting to the broker server.
+        raise error
+
+def init_workers(broker_on_message: callable, process: int = 0) -> list:
+    """
+    This function initializes the ingest workers of this process, as set in the 'workers' setting of the broker mqtt.
+
+    Args:
+        - broker_on_message (function): The function to be called when a message is received from the broker mqtt.
+        - process (int): The index of the ingest process.
+
+    Returns:
+        - broker_connections (list): The client objects, connecting in the background.
+
+    Raises:
+        - Exception: If a client cannot be set up.
+    """
+
+    broker_connections = []
+
+    try:
+        for worker in range(int(os.environ.get("API_MQTT_WORKERS", "1"))):
+            broker_connections.append(init(broker_on_message, worker, process))
+
+        return broker_connections
+
+    except Exception as error: # Disconnect the workers already connected.
+        for broker_connection in broker_connections:
+            broker_connection.disconnect()
+
+        raise error
+
+def start_loop(mqtt_client: mqtt.Client, name: str) -> None:
+    """
+    This function starts the network thread of a client, which connects (retrying the first connection too) and reconnects with the backoff of the client.
+
+    Args:
+        - mqtt_client (paho.mqtt.client.Client): The client object.
+        - name (str): The name of the thread.
+
+    Returns:
+        - None
+    """
+
+    thread = threading.Thread(target = mqtt_client.loop_forever, kwargs = {"retry_first_connection": True}, name = name, daemon = True)
+    broker_loops[id(mqtt_client)] = thread
+
+    thread.start()
+
+def loop_alive(mqtt_client: mqtt.Client) -> bool:
+    """
+    This function checks if the network thread of a client is running (a client whose thread ended does not reconnect anymore).
+
+    Args:
+        - mqtt_client (paho.mqtt.client.Client): The client object.
+
+    Returns:
+        - bool: True if the thread is running.
+    """
+
+    thread = broker_loops.get(id(mqtt_client))
+
+    return thread is not None and thread.is_alive()
+
+def restart_loop(mqtt_client: mqtt.Client) -> None:
+    """
+    This function reconnects a client whose network thread has ended (e.g. after an unexpected error) and starts the thread again.
+
+    Args:
+        - mqtt_client (paho.mqtt.client.Client): The client object.
+
+    Returns:
+        - None
+
+    Raises:
+        - OSError: If the broker server cannot be reached, the caller retries later.
+    """
+
+    mqtt_client.reconnect()
+
+    thread = broker_loops.get(id(mqtt_client))
+    start_loop(mqtt_client, thread.name if thread is not None else "mqtt-client")
+
+def wait_connected(broker_connections: list, timeout: float) -> bool:
+    """
+    This function waits for some clients to be connected to the broker mqtt.
+
+    Args:
+        - broker_connections (list): The client objects.
+        - timeout (float): The maximum seconds to wait.
+
+    Returns:
+        - bool: True if every client is connected, False if the timeout expired first (they keep connecting in the background).
+    """
+
+    deadline = time.monotonic() + timeout
+
+    while not all(broker_connection.is_connected() for broker_connection in broker_connections):
+        if time.monotonic() >= deadline:
+            return False
+
+        time.sleep(0.05)
+
+    return True
+
+def open_subscriptions(broker_connections: list) -> None:
+    """
+    This function lets the ingest workers subscribe to the topic, once the messages can be processed.
+    The workers already connected subscribe now, the other ones when they connect.
+
+    Args:
+        - broker_connections (list): The client objects.
+
+    Returns:
+        - None
+    """
+
+    if broker_subscribing.is_set():
+        return
+
+    broker_subscribing.set()
+
+    for broker_connection in broker_connections:
+        if broker_connection.is_connected(): # A worker connecting at the same time may subscribe twice, which has no effect.
+            broker_connection.subscribe(subscription_topic(), int(os.environ.get("API_MQTT_QOS", "1")))
+
+def client_id(worker: int, process: int) -> str:
+    """
+    This function returns the client id of an ingest worker: unique for each worker, process and host, and stable between restarts.
+
+    Args:
+        - worker (int): The index of the worker in its process.
+        - process (int): The index of the ingest process.
+
+    Returns:
+        - client_id (str): The client id.
+    """
+
+    prefix = os.environ.get("API_MQTT_CLIENT_ID", "ORUS_API")
+
+    if not os.environ.get("API_MQTT_SHARED_GROUP") and worker == 0 and process == 0: # A single worker keeps the client id of the API.
+        return prefix
+
+    return f"{prefix}-{socket.gethostname()}-{process}-{worker}"
+
+def notify_topic() -> str:
+    """
+    This function returns the topic on which the ingest processes relay the committed batches to the web processes, by default
+    '<topic>/committed'. It must not have wildcards (it is published to), nor match the topic of the ingest workers (they would
+    receive the batches as readings), so it must be set when the topic has wildcards.
+
+    Args:
+        - None
+
+    Returns:
+        - topic (str): The topic.
+
+    Raises:
+        - ValueError: If the topic is not set and cannot be derived, or it is not valid.
+    """
+
+    topic = str(os.environ["API_MQTT_TOPIC"])
+    relay_topic = os.environ.get("API_MQTT_NOTIFY_TOPIC", "")
+
+    if not relay_topic:
+        if "#" in topic or "+" in topic:
+            raise ValueError(f"The topic {topic} has wildcards, set the 'notify_topic' of the MQTT settings to a topic without wildcards that it does not match.")
+
+        relay_topic = f"{topic}/committed"
+
+    if "#" in relay_topic or "+" in relay_topic:
+        raise ValueError(f"Invalid notify_topic ({relay_topic}). It cannot have wildcards.")
+
+    if mqtt.topic_matches_sub(topic, relay_topic):
+        raise ValueError(f"Invalid notify_topic ({relay_topic}). It matches the topic of the ingest workers ({topic}), they would receive the batches they relay.")
+
+    return relay_topic
+
+def subscription_topic() -> str:
+    """
+    This function returns the topic the ingest workers subscribe to.
+    With a shared group (set, or implicit when there are several workers), it is the shared subscription of the topic.
+
+    Args:
+        - None
+
+    Returns:
+        - topic (str): The topic.
+    """
+
     topic = str(os.environ["API_MQTT_TOPIC"])
+    group = os.environ.get("API_MQTT_SHARED_GROUP", "")
+    workers = int(os.environ.get("API_MQTT_WORKERS", "1")) * int(os.environ.get("API_SERVER_INGEST_PROCESSES", "1"))
+
+    if not group and workers > 1:
+        group = "orus_api"
+
+    return f"$share/{group}/{topic}" if group else topic
+
+def acknowledge(client: mqtt.Client, message: mqtt.MQTTMessage) -> None:
+    """
+    This function acknowledges a message received with QoS 1, so the broker does not deliver it again.
+
+    Args:
+        - client (paho.mqtt.client.Client): The client object that received the message.
+        - message (paho.mqtt.client.MQTTMessage): The message object.
+
+    Returns:
+        - None
+    """
+
+    if client is not None and message.qos > 0:
+        client.ack(message.mid, message.qos)
+
+def init_observer(on_message: callable, topic: str, on_status: callable = None) -> mqtt.Client:
+    """
+    This function initializes a connection to the broker mqtt that only observes a topic, with a client id unique to this process.
+    It is used by the web processes to receive the batches committed by a separate ingest process.
+    The connection is opened in the background, and the client reconnects with the backoff of the ingest workers.
+
+    Args:
+        - on_message (function): The function to be called when a message is received from the broker mqtt.
+        - topic (str): The topic to subscribe to.
+        - on_status (function): The function called with True when the client is subscribed, and with False when it is disconnected.
+
+    Returns:
+        - observer_connection (paho.mqtt.client.Client): The client object.
+
+    Raises:
+        - Exception: If the client cannot be set up (e.g. the settings of the broker are missing).
+    """
+
+    # Get the credentials from the environment variables.
+    host = str(os.environ["API_MQTT_HOST"]); port = int(os.environ["API_MQTT_PORT"])
+    user = str(os.environ["API_MQTT_USER"]); password = str(os.environ["API_MQTT_PASSWORD"])
 
     try:
         # Initialize the connection to the broker mqtt.
-        mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id = "ORUS_API")
+        mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id = f"ORUS_API-observer-{os.getpid()}")
 
         mqtt_client.username_pw_set(user, password) # Set the credentials for the broker server.
         mqtt_client.tls_set() # Set the tls for the broker server.
-        mqtt_client.connect(host, port) # Connect to the broker server.
-        mqtt_client.subscribe(topic) # Subscribe to the topic.
-        mqtt_client.on_message = broker_on_message # Set the on_message function.
+        mqtt_client.reconnect_delay_set( # Set the backoff between the reconnection attempts.
+            min_delay = int(os.environ.get("API_MQTT_RECONNECT_MIN_DELAY", "1")), max_delay = int(os.environ.get("API_MQTT_RECONNECT_MAX_DELAY", "60"))
+        )
+        mqtt_client.on_connect = lambda client, userdata, flags, rc: client.subscribe(topic, 1) if rc == 0 else None # Subscribe (again) on every connection, with the QoS of the relay.
+        mqtt_client.on_message = on_message # Set the on_message function.
+
+        if on_status is not None: # The batches committed while the client was not subscribed are not received.
+            mqtt_client.on_subscribe = lambda client, userdata, mid, granted_qos: on_status(True)
+            mqtt_client.on_disconnect = lambda client, userdata, rc: on_status(False)
 
-        threading.Thread(target = mqtt_client.loop_forever).start() # Start the thread for the mqtt client in loop forever.
-        time.sleep(0.5) # Sleep for 0.5 seconds for the connection to be established.
+        mqtt_client.connect_async(host, port) # Connect to the broker server from the network thread.
 
-        if mqtt_client.is_connected() is False:
-            raise ConnectionRefusedError("Connection refused by the broker server.")
+        start_loop(mqtt_client, "mqtt-observer") # Start the thread of the mqtt client (it connects and reconnects).
 
-        else:
-            return mqtt_client
+        return mqtt_client
 
     except Exception as error: # If there is an error in connecting to the broker server.
         raise error
\ No newline at end of file
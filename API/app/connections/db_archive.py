@@ -0,0 +1,577 @@
+# Importing the required modules
+from connections import db_connections, db_migrations, db_rollups
+from utils import logs_handler, schema_catalog
+# Importing the required libraries
+from datetime import date, datetime
+import threading
+import heapq
+import gzip
+import json
+import time
+import csv
+import os
+import re
+
+ARCHIVE_COLUMNS = ("ID", "CHIP_ID", "DATA_ID", "VALUE", "DATE") # The columns of the segment files (the ID finds the readings already archived).
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# State of the archive.
+archive_lock = threading.Lock() # Guards the state below.
+archive_state = {
+    "thread": None, # The background thread that archives the old readings.
+    "indexes": {}, # The (modification time, index) of each measure, as read by this process.
+    "runs": 0, # Number of runs of the archival.
+    "archived_rows": 0, # Number of readings moved to the archive.
+    "archived_segments": 0, # Number of segment files written.
+    "last_run_seconds": 0.0, # The duration of the last run.
+}
+archive_stopping = threading.Event() # Set to stop the background thread.
+
+def enabled() -> bool:
+    """
+    This function checks if the archival of the old readings is enabled.
+
+    Args:
+        - None
+
+    Returns:
+        - bool: True if the readings older than the 'after_months' setting are moved to the archive.
+    """
+
+    return os.environ.get("API_ARCHIVE", "false").lower() in ("true", "1", "yes")
+
+def directory(measure: str) -> str:
+    """
+    This function returns the directory of the archive of a measure.
+
+    Args:
+        - measure (str): The measure (and measurement table).
+
+    Returns:
+        - directory (str): The directory of its segment files and index.
+    """
+
+    return f"{os.environ.get('data_dir')}/archive/{measure}"
+
+def start() -> None:
+    """
+    This function starts the background thread that archives the old readings every 'interval' seconds.
+    It must run in a single process: the one with the ingest pipeline (the first one if there are several).
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    with archive_lock:
+        if archive_state["thread"] is not None or not enabled():
+            return
+
+        archive_stopping.clear()
+
+        archive_state["thread"] = threading.Thread(target = archive_loop, name = "archive", daemon = True)
+        archive_state["thread"].start()
+
+def stop(timeout: float = 30) -> None:
+    """
+    This function stops the background thread, after the chunk it is writing or deleting.
+
+    Args:
+        - timeout (float): The maximum seconds to wait for the thread.
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    with archive_lock:
+        thread = archive_state["thread"]
+        archive_state["thread"] = None
+
+    if thread is not None:
+        archive_stopping.set()
+        thread.join(timeout)
+
+def archive_loop() -> None:
+    """
+    This function is the body of the background thread: it archives the old readings of every measure, then waits for the interval.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    logger = logs_handler.init("archive") # Get the logger of the archive.
+
+    while not archive_stopping.is_set():
+        start = time.monotonic()
+
+        for measure in list(schema_catalog.measures()):
+            if archive_stopping.is_set():
+                break
+
+            if measure not in schema_catalog.tables(): # A measure without its measurement table.
+                continue
+
+            try:
+                db_connection, db_cursor = db_connections.init() # Check out a connection from the pool.
+
+                try:
+                    archived = archive(db_cursor, measure)
+
+                finally:
+                    db_connections.close(db_connection, db_cursor) # Return the connection to the pool.
+
+                if archived:
+                    logger.info(f"Readings of {measure} archived. Readings: {archived}")
+
+            except Exception as error:
+                logger.error(f"An error occurred while archiving the readings of {measure}. See the error below:")
+                logger.error(f"Error: {error}")
+
+        with archive_lock:
+            archive_state["runs"] += 1
+            archive_state["last_run_seconds"] = round(time.monotonic() - start, 3)
+
+        archive_stopping.wait(float(os.environ.get("API_ARCHIVE_INTERVAL", "3600")))
+
+def archive(db_cursor, measure: str) -> int:
+    """
+    This function moves the readings of a measure older than the 'after_months' setting to the archive, a month at a time.
+    The readings of each month are written to a compressed segment file, the segment is added to the index and then they are deleted
+    from the table (dropping its monthly partition if it has one), so an interrupted run continues where it stopped.
+    If the rollups are enabled, only the months already rolled up are archived: the aggregations of the archived months are answered from them.
+
+    Args:
+        - db_cursor (mysql.connector.cursor): The cursor object.
+        - measure (str): The measure (and measurement table), of the schema catalog.
+
+    Returns:
+        - rows (int): The number of readings archived.
+
+    Raises:
+        - Exception: If there is an error in reading or deleting the readings, or in writing the segments.
+    """
+
+    try:
+        today = datetime.now().date()
+        cutoff = db_migrations.add_months(date(today.year, today.month, 1), -int(os.environ.get("API_ARCHIVE_AFTER_MONTHS", "12")))
+
+        if db_rollups.enabled(): # Keep the months that are not rolled up yet.
+            db_cursor.execute("select WATERMARK from rollup_watermarks where MEASURE = %s", (measure,))
+            rows = db_cursor.fetchall()
+
+            if not rows:
+                return 0
+
+            watermark = rows[0][0]
+            cutoff = min(cutoff, date(watermark.year, watermark.month, 1))
+
+        archive_index = load_index(measure)
+        archived = 0
+
+        while not archive_stopping.is_set():
+            db_cursor.execute(f"select min(DATE) from {measure} where DATE < %s", (cutoff,))
+            first = db_cursor.fetchall()[0][0]
+
+            if first is None: # Every reading before the cutoff is archived.
+                break
+
+            month = date(first.year, first.month, 1)
+            next_month = db_migrations.add_months(month, 1)
+
+            archived += archive_month(db_cursor, measure, archive_index, month, next_month)
+
+        return archived
+
+    except Exception as error:
+        raise error
+
+def archive_month(db_cursor, measure: str, archive_index: dict, month: date, next_month: date) -> int:
+    """
+    This function moves the readings of a month of a measure to a new segment file of the archive, sorted by (DATE, CHIP_ID, ID).
+    Only the readings with an ID after the ones already archived of the month are written (the readings that arrived late),
+    and up to the last ID when the month is read, so the readings written meanwhile are left to the next run and none is archived twice.
+
+    Args:
+        - db_cursor (mysql.connector.cursor): The cursor object.
+        - measure (str): The measure (and measurement table).
+        - archive_index (dict): The index of the archive of the measure, updated in place.
+        - month (datetime.date): The first day of the month.
+        - next_month (datetime.date): The first day of the next month.
+
+    Returns:
+        - rows (int): The number of readings archived.
+
+    Raises:
+        - Exception: If there is an error in reading or deleting the readings, or in writing the segment.
+    """
+
+    try:
+        chunk_size = int(os.environ.get("API_ARCHIVE_CHUNK_SIZE", "10000"))
+        label = month.strftime("%Y-%m")
+        last_id = max((segment["last_id"] for segment in archive_index["segments"] if segment["month"] == label), default = 0)
+
+        os.makedirs(directory(measure), exist_ok = True)
+
+        sequence = max((int(name.split(".")[1]) for name in os.listdir(directory(measure)) if re.fullmatch(rf"{label}\.\d+\.csv\.gz", name)), default = 0) + 1
+        file_name = f"{label}.{sequence}.csv.gz"
+        path = f"{directory(measure)}/{file_name}"
+        db_cursor.execute(f"select max(ID) from {measure}")
+        upper_id = db_cursor.fetchall()[0][0] or 0
+
+        segment = {"file": file_name, "month": label, "rows": 0, "min_date": None, "max_date": None, "last_id": upper_id}
+        key = None # The (DATE, CHIP_ID, ID) of the last reading written.
+
+        with gzip.open(f"{path}.tmp", "wt", newline = "", compresslevel = int(os.environ.get("API_ARCHIVE_COMPRESSION", "6"))) as segment_file:
+            writer = csv.writer(segment_file)
+            writer.writerow(ARCHIVE_COLUMNS)
+
+            while True: # Read the readings of the month in chunks, in the order of the (DATE, CHIP_ID) index.
+                query = f"select ID, CHIP_ID, DATA_ID, VALUE, DATE from {measure} where DATE >= %s and DATE < %s and ID > %s and ID <= %s"
+                params = (month, next_month, last_id, upper_id)
+
+                if key is not None: # Seek after the last reading written.
+                    query += " and DATE >= %s and (DATE > %s or CHIP_ID > %s or (CHIP_ID = %s and ID > %s))"
+                    params += (key[0], key[0], key[1], key[1], key[2])
+
+                db_cursor.execute(f"{query} order by DATE, CHIP_ID, ID limit {chunk_size}", params)
+                rows = db_cursor.fetchall()
+
+                if not rows:
+                    break
+
+                writer.writerows((row[0], row[1], row[2], row[3], row[4].strftime(DATE_FORMAT)) for row in rows)
+
+                segment["min_date"] = segment["min_date"] or rows[0][4].strftime(DATE_FORMAT)
+                segment["max_date"] = rows[-1][4].strftime(DATE_FORMAT)
+                segment["rows"] += len(rows)
+                key = (rows[-1][4], rows[-1][1], rows[-1][0])
+
+        if segment["rows"]:
+            with open(f"{path}.tmp", "rb") as segment_file:
+                os.fsync(segment_file.fileno())
+
+            os.replace(f"{path}.tmp", path)
+
+            segment["bytes"] = os.path.getsize(path)
+            archive_index["segments"].append(segment)
+
+        else:
+            os.remove(f"{path}.tmp")
+
+        # The readings before the next month are read from the archive from now on (the older months are already archived).
+        archive_index["boundary"] = max(archive_index["boundary"] or "", f"{next_month} 00:00:00")
+        save_index(measure, archive_index) # The segment is in the index before its readings are deleted.
+
+        # Drop the partition of the month if it holds no other reading than the ones exported (no late reading of the month,
+        # nor of the earlier months of its range, which are already archived), else delete the archived readings in chunks.
+        # The table is locked from the check to the drop, so no reading is written in between (the writers wait for the drop).
+        partition = db_migrations.month_partition(db_cursor, measure, month)
+
+        if partition is not None:
+            partition_name, partition_lower = partition
+
+            db_cursor.execute(f"lock tables {measure} write")
+
+            try:
+                db_cursor.execute(
+                    f"select count(*) from {measure} where DATE >= %s and DATE < %s and (DATE < %s or ID > %s)",
+                    (partition_lower, next_month, month, upper_id)
+                )
+
+                if db_cursor.fetchall()[0][0] == 0:
+                    db_cursor.execute(f"alter table {measure} drop partition {partition_name}")
+
+            finally:
+                db_cursor.execute("unlock tables")
+
+        while not archive_stopping.is_set():
+            db_cursor.execute(f"delete from {measure} where DATE >= %s and DATE < %s and ID <= %s limit {chunk_size}", (month, next_month, upper_id))
+
+            if db_cursor.rowcount < chunk_size:
+                break
+
+        with archive_lock:
+            archive_state["archived_rows"] += segment["rows"]
+            archive_state["archived_segments"] += 1 if segment["rows"] else 0
+
+        return segment["rows"]
+
+    except Exception as error:
+        raise error
+
+def load_index(measure: str) -> dict:
+    """
+    This function reads the index of the archive of a measure.
+
+    Args:
+        - measure (str): The measure.
+
+    Returns:
+        - index (dict): The 'segments' (file, month, rows, min_date, max_date, last_id and bytes of each one) and the 'boundary',
+          the date before which the readings are read from the archive (None if nothing is archived).
+    """
+
+    try:
+        with open(f"{directory(measure)}/index.json", "r") as index_file:
+            return json.load(index_file)
+
+    except FileNotFoundError:
+        return {"segments": [], "boundary": None}
+
+def save_index(measure: str, index: dict) -> None:
+    """
+    This function saves the index of the archive of a measure. It is replaced atomically, so a crash leaves the previous one or the new one.
+
+    Args:
+        - measure (str): The measure.
+        - index (dict): The index.
+
+    Returns:
+        - None
+
+    Raises:
+        - OSError: If the index cannot be written.
+    """
+
+    index_path = f"{directory(measure)}/index.json"
+
+    with open(f"{index_path}.tmp", "w") as index_file:
+        json.dump(index, index_file, indent = 2)
+        index_file.flush()
+        os.fsync(index_file.fileno())
+
+    os.replace(f"{index_path}.tmp", index_path)
+
+def index(measure: str) -> dict:
+    """
+    This function returns the index of the archive of a measure, reading it again only if the file changed.
+
+    Args:
+        - measure (str): The measure.
+
+    Returns:
+        - index (dict): The index, as returned by load_index. It must not be modified.
+    """
+
+    try:
+        modified = os.stat(f"{directory(measure)}/index.json").st_mtime_ns
+
+    except FileNotFoundError:
+        return {"segments": [], "boundary": None}
+
+    with archive_lock:
+        cached = archive_state["indexes"].get(measure)
+
+    if cached is not None and cached[0] == modified:
+        return cached[1]
+
+    current = load_index(measure)
+
+    with archive_lock:
+        archive_state["indexes"][measure] = (modified, current)
+
+    return current
+
+def boundary(measure: str, start_date: str) -> str:
+    """
+    This function checks if a date range reaches into the archive of a measure.
+
+    Args:
+        - measure (str): The measure.
+        - start_date (str): The start date of the range, or None.
+
+    Returns:
+        - boundary (str): The date before which the readings are read from the archive, or None if the range starts after it.
+    """
+
+    current = index(measure)["boundary"]
+
+    if current is not None and (start_date is None or start_date < current):
+        return current
+
+    return None
+
+def overlapping(measure: str, start_date: str, before: str) -> list:
+    """
+    This function returns the segments of the archive of a measure whose dates overlap a date range, from the index.
+
+    Args:
+        - measure (str): The measure.
+        - start_date (str): The start date (inclusive), or None.
+        - before (str): The end date (exclusive), or None.
+
+    Returns:
+        - segments (list): The entries of the index of the segments, sorted by their first date.
+    """
+
+    return sorted(
+        (segment for segment in index(measure)["segments"]
+         if (start_date is None or segment["max_date"] >= start_date) and (before is None or segment["min_date"] < before)),
+        key = lambda segment: segment["min_date"]
+    )
+
+def read_segment(measure: str, segment: dict, start_date: str, before: str) -> iter:
+    """
+    This function reads the readings of a segment of the archive in a date range, in the order of the segment (DATE, CHIP_ID, ID).
+
+    Args:
+        - measure (str): The measure.
+        - segment (dict): The entry of the index of the segment.
+        - start_date (str): The start date (inclusive), or None.
+        - before (str): The end date (exclusive), or None.
+
+    Returns:
+        - rows (iter): An iterator over the rows (ID, CHIP_ID, DATA_ID, VALUE, DATE), with the types of the rows of the database.
+    """
+
+    with gzip.open(f"{directory(measure)}/{segment['file']}", "rt", newline = "") as segment_file:
+        reader = csv.reader(segment_file)
+        next(reader) # Skip the header.
+
+        for reading_id, chip_id, data_id, value, date_text in reader:
+            if before is not None and date_text >= before: # The dates compare as text, and the rows are sorted by date.
+                break
+
+            if start_date is None or date_text >= start_date:
+                yield (int(reading_id), chip_id, int(data_id), float(value), datetime.fromisoformat(date_text))
+
+def read_chunks(measure: str, start_date: str, before: str, chunk_size: int = 1000) -> iter:
+    """
+    This function reads the archived readings of a measure in a date range, sorted by (DATE, CHIP_ID, ID).
+    Only the segments whose dates overlap the range are read.
+
+    Args:
+        - measure (str): The measure.
+        - start_date (str): The start date (inclusive), or None.
+        - before (str): The end date (exclusive), or None.
+        - chunk_size (int): The number of rows of each chunk.
+
+    Returns:
+        - chunks (iter): An iterator over the lists of rows (CHIP_ID, DATA_ID, VALUE, DATE), with the types of the rows of the database.
+    """
+
+    chunk = []
+
+    for row in read_merged(measure, start_date, before):
+        chunk.append(row[1:])
+
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+def read(measure: str, start_date: str, before: str) -> iter:
+    """
+    This function reads the archived readings of a measure in a date range, one row at a time.
+
+    Args:
+        - measure (str): The measure.
+        - start_date (str): The start date (inclusive), or None.
+        - before (str): The end date (exclusive), or None.
+
+    Returns:
+        - rows (iter): An iterator over the rows (CHIP_ID, DATA_ID, VALUE, DATE), sorted by (DATE, CHIP_ID, ID).
+    """
+
+    for chunk in read_chunks(measure, start_date, before):
+        yield from chunk
+
+def read_ordered(measure: str, start_date: str, before: str, after: tuple = None) -> iter:
+    """
+    This function reads the archived readings of a measure in a date range sorted by (DATE, CHIP_ID, ID), like the index of the tables.
+    The segments that overlap are merged as they are read, so the memory used does not depend on the size of the range.
+
+    Args:
+        - measure (str): The measure.
+        - start_date (str): The start date (inclusive), or None.
+        - before (str): The end date (exclusive), or None.
+        - after (tuple): The (DATE, CHIP_ID, ID) after which the readings are read, or None.
+
+    Returns:
+        - rows (iter): An iterator over the rows (ID, CHIP_ID, DATA_ID, VALUE, DATE).
+    """
+
+    if after is not None: # Skip the segments before the date of the key.
+        start_date = max(start_date or "", after[0])
+        after = (datetime.fromisoformat(after[0]), after[1], after[2])
+
+    for row in read_merged(measure, start_date, before):
+        if after is None or (row[4], row[1], row[0]) > after:
+            yield row
+
+def read_merged(measure: str, start_date: str, before: str) -> iter:
+    """
+    This function reads the archived readings of a measure in a date range sorted by (DATE, CHIP_ID, ID).
+    The segments whose dates overlap (e.g. the readings of a month that arrived late) are merged as they are read,
+    and the groups of segments that do not overlap are read one after the other, so only the files of a group are open at once.
+
+    Args:
+        - measure (str): The measure.
+        - start_date (str): The start date (inclusive), or None.
+        - before (str): The end date (exclusive), or None.
+
+    Returns:
+        - rows (iter): An iterator over the rows (ID, CHIP_ID, DATA_ID, VALUE, DATE).
+    """
+
+    groups = [] # The segments sorted by their first date, grouped while they overlap.
+
+    for segment in overlapping(measure, start_date, before):
+        if groups and segment["min_date"] <= max(grouped["max_date"] for grouped in groups[-1]):
+            groups[-1].append(segment)
+
+        else:
+            groups.append([segment])
+
+    for group in groups:
+        segments = [read_segment(measure, segment, start_date, before) for segment in group]
+
+        yield from heapq.merge(*segments, key = lambda row: (row[4], row[1], row[0]))
+
+def stats() -> dict:
+    """
+    This function returns the statistics of the archive.
+
+    Args:
+        - None
+
+    Returns:
+        - stats (dict): The runs of the archival in this process and the boundary, segments and readings of the archive of each measure.
+    """
+
+    measures = {}
+
+    for measure in schema_catalog.measures():
+        current = index(measure)
+
+        if current["boundary"] is not None:
+            measures[measure] = {
+                "boundary": current["boundary"], "segments": len(current["segments"]),
+                "rows": sum(segment["rows"] for segment in current["segments"]), "bytes": sum(segment["bytes"] for segment in current["segments"]),
+            }
+
+    with archive_lock:
+        return {
+            "enabled": enabled(),
+            "runs": archive_state["runs"],
+            "archived_rows": archive_state["archived_rows"],
+            "archived_segments": archive_state["archived_segments"],
+            "last_run_seconds": archive_state["last_run_seconds"],
+            "measures": measures,
+        }
@@ -1,22 +1,43 @@
 # Importing the required libraries
-from utils import logs_handler
+from utils import logs_handler, metrics
 
 import mysql.connector
+import threading
+import time
 import os
 
-def init() -> mysql.connector.MySQLConnection:
+# State of the connection pool shared by the web and the ingest paths.
+pool_condition = threading.Condition() # Guards every variable of the pool below.
+pool_idle = [] # The idle connections ready to be checked out (used as a stack).
+pool_connections = {} # The metadata of every open connection, indexed by the id of the connection.
+pool_settings = {} # The settings of the pool, loaded from the environment variables in init_pool.
+pool_stats_counters = {
+    "checkouts": 0, # Number of connections checked out from the pool.
+    "timeouts": 0, # Number of checkouts that timed out waiting for a free connection.
+    "discarded": 0, # Number of connections discarded because they were dead, too old or used too many times.
+    "waiters": 0, # Number of threads currently waiting for a free connection.
+    "opening": 0, # Number of connections being opened outside of the lock.
+    "checkout_time_total": 0.0, # Total time spent checking out connections (seconds).
+    "checkout_time_max": 0.0, # Maximum time spent checking out a connection (seconds).
+}
+
+# Registry of the chips and data types known by the database, so the ingest path does not look them up per message.
+registry_lock = threading.Lock() # Guards the registry below.
+registry_chip_ids = set() # The CHIP_ID of every chip in the iot_chips table.
+registry_data_ids = {} # The DATA_ID of every measure in the data_types table, indexed by MEASURE_NAME.
+
+def connect() -> mysql.connector.MySQLConnection:
     """
-    This function initializes the connection to the database.
+    This function opens a new connection to the database, outside of the pool.
 
     Args:
         - None
 
     Returns:
         - db_connection (mysql.connector.MySQLConnection): The connection object.
-        - db_cursor (mysql.connector.cursor): The cursor object.
 
     Raises:
-        - Exception: If there is an unexpected error.
+        - mysql.connector.Error: If there is an error in connecting to the database.
     """
 
     # Get the credentials from the environment variables.
@@ -30,13 +51,13 @@ def init() -> mysql.connector.MySQLConnection:
             port = port,
             user = user,
             password = password,
+            database = table, # Use the database table (saves the 'use' round trip).
+            autocommit = True, # Reads must not keep a transaction (and a stale snapshot) open in the pool.
+            connection_timeout = int(os.environ.get("API_DB_CONNECT_TIMEOUT", "5")), # An unreachable server fails fast, the supervisor retries.
         )
 
         if db_connection.is_connected():
-            db_cursor = db_connection.cursor() # Create a cursor object.
-            db_cursor.execute(f"use {table}") # Use the database table.
-
-            return db_connection, db_cursor
+            return db_connection
 
         else:
             raise mysql.connector.Error("Error in connecting to the database.")
@@ -44,9 +65,270 @@ def init() -> mysql.connector.MySQLConnection:
     except mysql.connector.Error as error: # If there is an error in connecting to the database.
         raise error
 
+def init_pool() -> None:
+    """
+    This function initializes the connection pool to the database and pre-warms it.
+    The settings are read from the environment variables set by the credentials manager.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - mysql.connector.Error: If there is an error in connecting to the database.
+    """
+
+    with pool_condition:
+        if pool_settings: # If the pool is already initialized.
+            return
+
+        pool_settings["size"] = int(os.environ.get("API_DB_POOL_SIZE", "10")) # Maximum number of open connections.
+        pool_settings["min_size"] = min(int(os.environ.get("API_DB_POOL_MIN_SIZE", "2")), pool_settings["size"]) # Connections opened at startup.
+        pool_settings["timeout"] = float(os.environ.get("API_DB_POOL_TIMEOUT", "10")) # Seconds to wait for a free connection.
+        pool_settings["max_uses"] = int(os.environ.get("API_DB_POOL_MAX_USES", "1000")) # Checkouts before a connection is recycled.
+        pool_settings["max_age"] = float(os.environ.get("API_DB_POOL_MAX_AGE", "3600")) # Seconds before a connection is recycled.
+        pool_settings["ping_after"] = float(os.environ.get("API_DB_POOL_PING_AFTER", "1")) # Idle seconds before checking the liveness again.
+
+        try:
+            for _ in range(pool_settings["min_size"]): # Pre-warm the pool.
+                db_connection = open_pooled_connection()
+                pool_connections[id(db_connection)]["in_use"] = False
+                pool_idle.append(db_connection)
+
+        except Exception as error:
+            for db_connection in pool_idle: # Close the connections opened before the error.
+                discard_connection(db_connection)
+
+            pool_idle.clear()
+            pool_settings.clear()
+
+            raise error
+
+def close_pool() -> None:
+    """
+    This function closes every idle connection of the pool and resets it.
+    The connections in use are closed when they are returned to the pool.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    with pool_condition:
+        for db_connection in pool_idle: # Close the idle connections.
+            discard_connection(db_connection)
+
+        pool_idle.clear()
+        pool_settings.clear()
+        pool_condition.notify_all() # Wake up the waiters, they will fail on the closed pool.
+
+def discard_idle() -> int:
+    """
+    This function closes the idle connections of the pool, keeping the pool open, e.g. when the database stopped answering:
+    they are likely broken, and the next checkouts open new ones instead of failing on them.
+
+    Args:
+        - None
+
+    Returns:
+        - discarded (int): The number of connections closed.
+
+    Raises:
+        - None
+    """
+
+    with pool_condition:
+        discarded = len(pool_idle)
+
+        for db_connection in pool_idle: # Close the idle connections.
+            discard_connection(db_connection)
+
+        pool_idle.clear()
+
+    return discarded
+
+def open_pooled_connection() -> mysql.connector.MySQLConnection:
+    """
+    This function opens a new connection and registers it in the pool. It must be called holding the pool lock.
+    The lock is released while the connection is being opened, so other threads are not blocked by the handshake.
+
+    Args:
+        - None
+
+    Returns:
+        - db_connection (mysql.connector.MySQLConnection): The connection object.
+
+    Raises:
+        - mysql.connector.Error: If there is an error in connecting to the database.
+    """
+
+    pool_stats_counters["opening"] += 1 # Reserve the slot of the connection in the pool.
+    pool_condition.release()
+
+    try:
+        db_connection = connect() # Open the connection to the database.
+
+    finally:
+        pool_condition.acquire()
+        pool_stats_counters["opening"] -= 1
+
+        pool_condition.notify() # Let a waiter retry if the connection could not be opened.
+
+    now = time.monotonic()
+
+    # Register the connection in the pool.
+    pool_connections[id(db_connection)] = {"created": now, "last_used": now, "uses": 0, "in_use": True}
+
+    return db_connection
+
+def discard_connection(db_connection: mysql.connector.MySQLConnection) -> None:
+    """
+    This function removes a connection from the pool and closes it. It must be called holding the pool lock.
+
+    Args:
+        - db_connection (mysql.connector.MySQLConnection): The connection object.
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    pool_connections.pop(id(db_connection), None) # Unregister the connection from the pool.
+    pool_stats_counters["discarded"] += 1
+
+    pool_condition.notify() # The slot is free, let a waiter open a new connection.
+
+    try:
+        db_connection.close() # Close the connection object.
+
+    except Exception: # The connection may already be broken, there is nothing else to do with it.
+        pass
+
+def is_alive(db_connection: mysql.connector.MySQLConnection) -> bool:
+    """
+    This function checks the liveness of an idle connection before it is checked out.
+    The ping round trip is only done if the connection has been idle longer than the 'ping_after' setting.
+
+    Args:
+        - db_connection (mysql.connector.MySQLConnection): The connection object.
+
+    Returns:
+        - bool: True if the connection can be used, False otherwise.
+
+    Raises:
+        - None
+    """
+
+    metadata = pool_connections[id(db_connection)]
+    now = time.monotonic()
+
+    if metadata["uses"] >= pool_settings["max_uses"] or now - metadata["created"] >= pool_settings["max_age"]:
+        return False # The connection must be recycled.
+
+    if now - metadata["last_used"] < pool_settings["ping_after"]:
+        return True # The connection was used recently, skip the ping.
+
+    try:
+        db_connection.ping(reconnect = False) # Check that the server is still answering.
+
+        return True
+
+    except Exception:
+        return False
+
+def init() -> mysql.connector.MySQLConnection:
+    """
+    This function checks out a connection from the pool to the database.
+    If the pool is not initialized yet, it is initialized first.
+
+    Args:
+        - None
+
+    Returns:
+        - db_connection (mysql.connector.MySQLConnection): The connection object.
+        - db_cursor (mysql.connector.cursor): The cursor object.
+
+    Raises:
+        - TimeoutError: If there is no free connection in the pool after the wait timeout.
+        - mysql.connector.Error: If there is an error in connecting to the database.
+    """
+
+    init_pool() # Initialize the pool if it is not initialized yet.
+
+    start = time.monotonic()
+    db_connection = None
+
+    while db_connection is None:
+        with pool_condition:
+            if not pool_settings: # If the pool was closed.
+                raise mysql.connector.Error("The DataBase connection pool is closed.")
+
+            deadline = start + pool_settings["timeout"]
+
+            while db_connection is None:
+                if pool_idle: # If there is an idle connection, check it out.
+                    db_connection = pool_idle.pop()
+                    pool_connections[id(db_connection)]["in_use"] = True
+
+                    reused = True
+
+                elif len(pool_connections) + pool_stats_counters["opening"] < pool_settings["size"]: # If the pool can grow, open a new connection.
+                    db_connection = open_pooled_connection()
+
+                    reused = False
+
+                else: # Wait for a connection to be returned to the pool.
+                    remaining = deadline - time.monotonic()
+
+                    if remaining <= 0:
+                        pool_stats_counters["timeouts"] += 1
+                        raise TimeoutError(f"No free connection in the DataBase pool after {pool_settings['timeout']} seconds.")
+
+                    pool_stats_counters["waiters"] += 1
+
+                    try:
+                        pool_condition.wait(remaining)
+
+                    finally:
+                        pool_stats_counters["waiters"] -= 1
+
+                    if not pool_settings: # If the pool was closed while waiting.
+                        raise mysql.connector.Error("The DataBase connection pool is closed.")
+
+        if reused and not is_alive(db_connection): # If the connection is dead or must be recycled (checked outside of the lock).
+            with pool_condition:
+                discard_connection(db_connection)
+
+            db_connection = None
+
+    with pool_condition:
+        metadata = pool_connections[id(db_connection)]
+        metadata["uses"] += 1
+
+        elapsed = time.monotonic() - start
+        pool_stats_counters["checkouts"] += 1
+        pool_stats_counters["checkout_time_total"] += elapsed
+        pool_stats_counters["checkout_time_max"] = max(pool_stats_counters["checkout_time_max"], elapsed)
+
+    metrics.observe("orus_db_checkout_seconds", elapsed)
+
+    db_cursor = db_connection.cursor() # Create a cursor object.
+
+    return db_connection, db_cursor
+
 def close(db_connection: mysql.connector.MySQLConnection, db_cursor: mysql.connector.cursor) -> None:
     """
-    This function closes the connection to the database.
+    This function returns the connection to the pool.
+    Pending transactions are rolled back, and the connection is closed instead if it is broken or it does not belong to the pool.
 
     Args:
         - db_connection (mysql.connector.MySQLConnection): The connection object.
@@ -56,23 +338,79 @@ def close(db_connection: mysql.connector.MySQLConnection, db_cursor: mysql.conne
         - None
 
     Raises:
-        - Exception: If there is an unexpected error.
+        - None
     """
 
-    try: # Try to close the connection to the database.
+    healthy = True
+
+    try: # Try to leave the connection clean for the next checkout.
         db_cursor.close() # Close the cursor object.
-        db_connection.close() # Close the connection object.
 
-    except Exception as error: # If there is an error in closing the connection to the database.
-        raise error
+        if db_connection.in_transaction: # If a failed write left a transaction open.
+            db_connection.rollback()
+
+    except Exception: # If the connection is broken, it is discarded below.
+        healthy = False
+
+    with pool_condition:
+        metadata = pool_connections.get(id(db_connection))
+
+        if metadata is None: # If the connection does not belong to the pool (or the pool was closed).
+            try:
+                db_connection.close() # Close the connection object.
 
-def write_data(db_cursor: mysql.connector.cursor, data: dict) -> None:
+            except Exception:
+                pass
+
+        elif healthy and pool_settings:
+            metadata["in_use"] = False; metadata["last_used"] = time.monotonic()
+            pool_idle.append(db_connection) # Return the connection to the pool.
+
+        else:
+            discard_connection(db_connection)
+
+        pool_condition.notify() # Wake up one of the waiters.
+
+def pool_stats() -> dict:
     """
-    This function writes the data to the database.
+    This function returns the statistics of the connection pool.
+
+    Args:
+        - None
+
+    Returns:
+        - stats (dict): The size, idle and in use connections, waiters and checkout latency of the pool.
+
+    Raises:
+        - None
+    """
+
+    with pool_condition:
+        checkouts = pool_stats_counters["checkouts"]
+
+        stats = {
+            "size": pool_settings.get("size", 0),
+            "open": len(pool_connections),
+            "idle": len(pool_idle),
+            "in_use": len(pool_connections) - len(pool_idle),
+            "waiters": pool_stats_counters["waiters"],
+            "checkouts": checkouts,
+            "timeouts": pool_stats_counters["timeouts"],
+            "discarded": pool_stats_counters["discarded"],
+            "checkout_latency_avg_ms": round(1000 * pool_stats_counters["checkout_time_total"] / checkouts, 3) if checkouts else 0.0,
+            "checkout_latency_max_ms": round(1000 * pool_stats_counters["checkout_time_max"], 3),
+        }
+
+    return stats
+
+def write_batch(db_cursor: mysql.connector.cursor, batch: list) -> None:
+    """
+    This function writes the data of several messages to the database in a single transaction.
+    The rows are grouped per target table and inserted with one multi-row insert per table.
 
     Args:
         - db_cursor (mysql.connector.cursor): The cursor object.
-        - data (dict): The data to be written to the database.
+        - batch (list): The data of the messages to be written to the database.
 
     Returns:
         - None
@@ -82,35 +420,94 @@ def write_data(db_cursor: mysql.connector.cursor, data: dict) -> None:
     """
 
     try: # Try to write the data to the database.
-        CHIP_ID = data["CLIENT_ID"] # Get the CHIP_ID from the data.
-        DATE = data["timestamp"] # Get the DATE from the data.
+        with registry_lock:
+            data_ids = registry_data_ids
+            known_chip_ids = registry_chip_ids
+
+        if not data_ids: # If the registry is not loaded yet.
+            load_registry(db_cursor)
+
+            with registry_lock:
+                data_ids = registry_data_ids
+                known_chip_ids = registry_chip_ids
+
+        chip_ids = set() # The CHIP_ID of every message of the batch.
+        rows = {} # The rows to insert, grouped by table.
+
+        for data in batch: # Iterate over the messages.
+            CHIP_ID = data["CLIENT_ID"] # Get the CHIP_ID from the data.
+            DATE = data["timestamp"] # Get the DATE from the data.
 
-        db_cursor.execute("select CHIP_ID from iot_chips") # Select the CHIP_ID from the iot_chips table.
-        chips = db_cursor.fetchall() # Fetch all the chips from the table.
+            chip_ids.add(CHIP_ID)
 
-        if (CHIP_ID,) not in chips: # If the CHIP_ID is not in the chips.
-            db_cursor.execute("insert into iot_chips (CHIP_ID) values (%s)", (CHIP_ID,)) # Insert the CHIP_ID into the iot_chips table.
-            db_cursor.execute("commit") # Commit the changes to the database.
+            for key, value in data.items(): # Iterate over the data.
+                if key != "CLIENT_ID" and key != "timestamp":
+                    if key not in data_ids: # If the measure is new, reload the data types once.
+                        load_registry(db_cursor)
 
-        for key, value in data.items(): # Iterate over the data.
-            if key != "CLIENT_ID" and key != "timestamp":
-                db_cursor.execute(f"select DATA_ID from data_types where MEASURE_NAME = '{key}'") # Select the DATA_ID from the data_types table.
-                DATA_ID = db_cursor.fetchone()[0] # Fetch the DATA_ID from the table.
+                        with registry_lock:
+                            data_ids = registry_data_ids
 
-                # Insert the data into the table.
-                db_cursor.execute(f"insert into {key} (CHIP_ID, DATA_ID, VALUE, DATE) values (%s, %s, %s, %s)", (CHIP_ID, DATA_ID, value, DATE))
-                db_cursor.execute('commit') # Commit the changes to the database.
+                    rows.setdefault(key, []).append((CHIP_ID, data_ids[key], value, DATE))
+
+        new_chip_ids = chip_ids - known_chip_ids # The chips that are not registered yet.
+
+        db_cursor.execute("start transaction") # Start the transaction of the batch.
+
+        if new_chip_ids: # Insert the CHIP_ID of the new chips into the iot_chips table (idempotent if another writer inserted them).
+            db_cursor.executemany("insert ignore into iot_chips (CHIP_ID) values (%s)", [(CHIP_ID,) for CHIP_ID in new_chip_ids])
+
+        for table, table_rows in rows.items(): # Insert the data into each table.
+            db_cursor.executemany(f"insert into {table} (CHIP_ID, DATA_ID, VALUE, DATE) values (%s, %s, %s, %s)", table_rows)
+
+        db_cursor.execute("commit") # Commit the changes to the database.
+
+        if new_chip_ids: # Register the new chips once they are committed.
+            with registry_lock:
+                registry_chip_ids.update(new_chip_ids)
 
     except Exception as error: # If there is an error in writing the data to the database.
+        metrics.increment("orus_db_errors_total")
         raise error
 
-def execute(db_cursor: mysql.connector.cursor, query: str) -> list:
+def load_registry(db_cursor: mysql.connector.cursor) -> None:
+    """
+    This function loads the registry of chips and data types from the database, replacing the previous one.
+
+    Args:
+        - db_cursor (mysql.connector.cursor): The cursor object.
+
+    Returns:
+        - None
+
+    Raises:
+        - Exception: If there is an error in reading the tables.
+    """
+
+    global registry_chip_ids, registry_data_ids
+
+    try:
+        db_cursor.execute("select CHIP_ID from iot_chips") # Select the CHIP_ID of every chip.
+        chip_ids = {CHIP_ID for (CHIP_ID,) in db_cursor.fetchall()}
+
+        db_cursor.execute("select MEASURE_NAME, DATA_ID from data_types") # Select the DATA_ID of every measure.
+        data_ids = {MEASURE_NAME: DATA_ID for MEASURE_NAME, DATA_ID in db_cursor.fetchall()}
+
+        with registry_lock: # Swap the registry (the readers keep the objects they already took).
+            registry_chip_ids = chip_ids
+            registry_data_ids = data_ids
+
+    except Exception as error:
+        raise error
+
+def execute(db_cursor: mysql.connector.cursor, query: str, params: tuple = None) -> list:
     """
     This function executes the query on the database.
 
     Args:
         - db_cursor (mysql.connector.cursor): The cursor object.
         - query (str): The query to be executed on the database.
+        - params (tuple): The values of the %s placeholders of the query (escaped by the driver), or None.
 
     Returns:
         - db_cursor.fetchall(): The results of the query.
@@ -120,9 +517,63 @@ def execute(db_cursor: mysql.connector.cursor, query: str) -> list:
     """
 
     try: # Try to execute the query on the database.
-        db_cursor.execute(query) # Execute the query on the database.
+        with metrics.timer("orus_db_query_seconds"):
+            db_cursor.execute(query, params or None) # Execute the query on the database (without parameters, a literal % is kept).
+
+            return db_cursor.fetchall() # Return the results of the query.
+
+    except Exception as error: # If there is an error in executing the query on the database.
+        metrics.increment("orus_db_errors_total")
+        raise error
 
-        return db_cursor.fetchall() # Return the results of the query.
+def stream(db_cursor: mysql.connector.cursor, query: str, chunk_size: int = None, params: tuple = None) -> iter:
+    """
+    This function executes the query on the database and returns an iterator over its results in chunks.
+    The cursor must be unbuffered, so the rows are read from the server as the chunks are consumed and the whole result is never held in memory.
+
+    Args:
+        - db_cursor (mysql.connector.cursor): The cursor object (unbuffered).
+        - query (str): The query to be executed on the database.
+        - chunk_size (int): The number of rows of each chunk. By default, the 'API_DB_STREAM_CHUNK_SIZE' setting.
+        - params (tuple): The values of the %s placeholders of the query (escaped by the driver), or None.
+
+    Returns:
+        - chunks (iter): An iterator over the lists of rows of the result.
+
+    Raises:
+        - Exception: If there is an error in executing the query.
+    """
+
+    try: # Try to execute the query on the database (before streaming, so the errors are raised to the caller).
+        db_cursor.execute(query, params or None) # Execute the query on the database (without parameters, a literal % is kept).
+
+        if chunk_size is None:
+            chunk_size = int(os.environ.get("API_DB_STREAM_CHUNK_SIZE", "1000"))
+
+        return fetch_chunks(db_cursor, chunk_size)
 
     except Exception as error: # If there is an error in executing the query on the database.
-        raise error
\ No newline at end of file
+        metrics.increment("orus_db_errors_total")
+        raise error
+
+def fetch_chunks(db_cursor: mysql.connector.cursor, chunk_size: int) -> iter:
+    """
+    This function reads the results of the last query of the cursor in chunks.
+
+    Args:
+        - db_cursor (mysql.connector.cursor): The cursor object.
+        - chunk_size (int): The number of rows of each chunk.
+
+    Returns:
+        - chunks (iter): An iterator over the lists of rows of the result.
+
+    Raises:
+        - Exception: If there is an error in reading the results.
+    """
+
+    rows = db_cursor.fetchmany(chunk_size)
+
+    while rows: # Until the result is exhausted.
+        yield rows
+
+        rows = db_cursor.fetchmany(chunk_size)
@@ -0,0 +1,352 @@
+# Importing the required modules
+from connections import db_connections
+from utils import logs_handler
+# Importing the required libraries
+from datetime import date, datetime
+import mysql.connector
+import threading
+import os
+import re
+
+# The directory with the versioned migration files of the database ('V<version>__<name>.sql').
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))), "DataBase", "migrations")
+
+MEASUREMENT_TABLES = ("ambient_temperature", "ambient_moisture", "soil_moisture") # The tables partitioned by month.
+
+# State of the maintenance of the partitions.
+partitions_lock = threading.Lock() # Guards the state below.
+partitions_state = {
+    "thread": None, # The background thread that creates the next monthly partitions.
+}
+partitions_stopping = threading.Event() # Set to stop the background thread.
+
+def list_migrations() -> list:
+    """
+    This function lists the migration files, sorted by version.
+
+    Args:
+        - None
+
+    Returns:
+        - migrations (list): The (version, name, path) of each migration file.
+
+    Raises:
+        - None
+    """
+
+    migrations = []
+
+    if not os.path.isdir(MIGRATIONS_DIR): # If there are no migrations.
+        return migrations
+
+    for file_name in os.listdir(MIGRATIONS_DIR): # Iterate over the migration files.
+        match = re.fullmatch(r"V(\d+(?:\.\d+)*)__(\w+)\.sql", file_name)
+
+        if match:
+            migrations.append((match.group(1), match.group(2), os.path.join(MIGRATIONS_DIR, file_name)))
+
+    migrations.sort(key = lambda migration: tuple(int(part) for part in migration[0].split("."))) # Sort by version number.
+
+    return migrations
+
+def pending(db_cursor: mysql.connector.cursor) -> list:
+    """
+    This function lists the migrations not applied to the database yet.
+
+    Args:
+        - db_cursor (mysql.connector.cursor): The cursor object.
+
+    Returns:
+        - migrations (list): The (version, name, path) of each pending migration, sorted by version.
+
+    Raises:
+        - Exception: If there is an error in reading the applied migrations.
+    """
+
+    try:
+        # Create the table with the applied migrations if it does not exist.
+        db_cursor.execute(
+            "create table if not exists schema_migrations ("
+            "VERSION varchar(20) NOT NULL COMMENT 'The version of the migration', "
+            "NAME varchar(100) NOT NULL COMMENT 'The name of the migration', "
+            "APPLIED_AT datetime NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT 'The date in which the migration was applied', "
+            "PRIMARY KEY (VERSION)"
+            ") COMMENT='This table stores the migrations applied to the database.'"
+        )
+
+        db_cursor.execute("select VERSION from schema_migrations") # Select the applied versions.
+        applied = {VERSION for (VERSION,) in db_cursor.fetchall()}
+
+        return [migration for migration in list_migrations() if migration[0] not in applied]
+
+    except Exception as error:
+        raise error
+
+def apply(db_cursor: mysql.connector.cursor, migration: tuple) -> None:
+    """
+    This function applies a migration to the database and records it in the schema_migrations table.
+    MySQL commits DDL statements implicitly, so a migration that fails half way must be fixed by hand before it is retried.
+
+    Args:
+        - db_cursor (mysql.connector.cursor): The cursor object.
+        - migration (tuple): The (version, name, path) of the migration.
+
+    Returns:
+        - None
+
+    Raises:
+        - Exception: If there is an error in executing the migration.
+    """
+
+    version, name, path = migration
+
+    try:
+        with open(path, "r", encoding = "utf-8") as file:
+            script = file.read()
+
+        for statement in split_statements(script): # Execute each statement of the migration.
+            db_cursor.execute(statement)
+
+        db_cursor.execute("insert into schema_migrations (VERSION, NAME) values (%s, %s)", (version, name)) # Record the migration.
+
+    except Exception as error:
+        raise error
+
+def split_statements(script: str) -> list:
+    """
+    This function splits a SQL script in statements, removing the comment lines.
+    The statements must end with ';' at the end of a line.
+
+    Args:
+        - script (str): The SQL script.
+
+    Returns:
+        - statements (list): The statements of the script.
+
+    Raises:
+        - None
+    """
+
+    lines = [line for line in script.splitlines() if not line.strip().startswith("--")] # Remove the comment lines.
+    statements = re.split(r";\s*$", "\n".join(lines), flags = re.MULTILINE)
+
+    return [statement.strip() for statement in statements if statement.strip()]
+
+def partitions(db_cursor: mysql.connector.cursor, table: str) -> list:
+    """
+    This function lists the partitions of a table partitioned by RANGE (TO_DAYS(DATE)).
+
+    Args:
+        - db_cursor (mysql.connector.cursor): The cursor object.
+        - table (str): The table.
+
+    Returns:
+        - partitions (list): The (name, upper bound) of each partition, sorted. The upper bound is a date, or None for MAXVALUE.
+          The list is empty if the table is not partitioned.
+
+    Raises:
+        - Exception: If there is an error in reading the partitions.
+    """
+
+    try:
+        db_cursor.execute(
+            "select PARTITION_NAME, PARTITION_DESCRIPTION from information_schema.partitions "
+            "where TABLE_SCHEMA = database() and TABLE_NAME = %s and PARTITION_NAME is not null "
+            "order by PARTITION_ORDINAL_POSITION", (table,)
+        )
+
+        result = []
+
+        for name, description in db_cursor.fetchall():
+            if description == "MAXVALUE":
+                result.append((name, None))
+
+            else: # TO_DAYS counts the days from the year 0, the ordinal of Python from the year 1.
+                result.append((name, date.fromordinal(int(description) - 365)))
+
+        return result
+
+    except Exception as error:
+        raise error
+
+def ensure_partitions(db_cursor: mysql.connector.cursor, table: str, months_ahead: int) -> list:
+    """
+    This function creates the monthly partitions of a table up to some months after the current one, splitting its 'p_future' partition.
+
+    Args:
+        - db_cursor (mysql.connector.cursor): The cursor object.
+        - table (str): The table.
+        - months_ahead (int): The number of months after the current one that must have a partition.
+
+    Returns:
+        - created (list): The names of the created partitions.
+
+    Raises:
+        - Exception: If there is an error in creating the partitions.
+    """
+
+    try:
+        table_partitions = partitions(db_cursor, table)
+        bounds = [bound for name, bound in table_partitions if bound is not None]
+
+        if not table_partitions or not bounds: # If the table is not partitioned.
+            return []
+
+        today = datetime.now().date()
+        target = add_months(date(today.year, today.month, 1), months_ahead + 1) # The upper bound of the last partition needed.
+
+        definitions = []; created = []
+        lower = max(bounds)
+
+        while lower < target: # Create one partition per month after the last one.
+            upper = add_months(lower, 1)
+            name = f"p_{lower.strftime('%Y%m')}"
+
+            definitions.append(f"PARTITION {name} VALUES LESS THAN (TO_DAYS('{upper.isoformat()}'))")
+            created.append(name)
+
+            lower = upper
+
+        if definitions:
+            definitions.append("PARTITION p_future VALUES LESS THAN MAXVALUE")
+            db_cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION p_future INTO ({', '.join(definitions)})")
+
+        return created
+
+    except Exception as error:
+        raise error
+
+def start_partitions() -> None:
+    """
+    This function starts the background thread that creates the next monthly partitions of the measurement tables
+    every 'partitions_interval' seconds, so a process running for months never writes the new readings to 'p_future'.
+    It must run in a single process: the one that maintains the rollups and the archive. Nothing is done if the migrations are 'off'.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    with partitions_lock:
+        if partitions_state["thread"] is not None or os.environ.get("API_DB_MIGRATIONS", "check") == "off":
+            return
+
+        partitions_stopping.clear()
+
+        partitions_state["thread"] = threading.Thread(target = partitions_loop, name = "partitions", daemon = True)
+        partitions_state["thread"].start()
+
+def stop_partitions(timeout: float = 30) -> None:
+    """
+    This function stops the background thread.
+
+    Args:
+        - timeout (float): The maximum seconds to wait for the thread.
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    with partitions_lock:
+        thread = partitions_state["thread"]
+        partitions_state["thread"] = None
+
+    if thread is not None:
+        partitions_stopping.set()
+        thread.join(timeout)
+
+def partitions_loop() -> None:
+    """
+    This function is the body of the background thread: it creates the partitions missing in the next 'partitions_ahead' months
+    of each measurement table, then waits for the interval.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    logger = logs_handler.init("migrations") # Get the logger of the migrations.
+
+    while not partitions_stopping.is_set():
+        try:
+            db_connection, db_cursor = db_connections.init() # Check out a connection from the pool.
+
+            try:
+                for table in MEASUREMENT_TABLES:
+                    created = ensure_partitions(db_cursor, table, int(os.environ.get("API_DB_PARTITIONS_AHEAD", "3")))
+
+                    if created:
+                        logger.info(f"Partitions created in the table {table}: {created}")
+
+            finally:
+                db_connections.close(db_connection, db_cursor) # Return the connection to the pool.
+
+        except Exception as error:
+            logger.error(f"An error occurred while creating the next partitions. See the error below:")
+            logger.error(f"Error: {error}")
+
+        partitions_stopping.wait(float(os.environ.get("API_DB_PARTITIONS_INTERVAL", "86400")))
+
+def month_partition(db_cursor: mysql.connector.cursor, table: str, month: date) -> tuple:
+    """
+    This function finds the monthly partition of a table that ends with a month. Once the partition of the previous month is dropped,
+    the next partition also spans the range of the dropped one, so its lower bound can be before the month: the caller checks that
+    the partition holds no other reading than the ones archived before dropping it. The 'p_history' partition is never returned.
+
+    Args:
+        - db_cursor (mysql.connector.cursor): The cursor object.
+        - table (str): The table.
+        - month (datetime.date): The first day of the month.
+
+    Returns:
+        - partition (tuple): The name and the lower bound (a date) of the partition, or None if the month has no partition of its own.
+
+    Raises:
+        - Exception: If there is an error in reading the partitions.
+    """
+
+    try:
+        lower = None # The lower bound of each partition is the upper bound of the previous one.
+
+        for name, bound in partitions(db_cursor, table):
+            if name == f"p_{month.strftime('%Y%m')}" and lower is not None and lower <= month and bound == add_months(month, 1):
+                return name, lower
+
+            lower = bound
+
+        return None
+
+    except Exception as error:
+        raise error
+
+def add_months(day: date, months: int) -> date:
+    """
+    This function adds some months to the first day of a month.
+
+    Args:
+        - day (datetime.date): The first day of a month.
+        - months (int): The number of months to add.
+
+    Returns:
+        - day (datetime.date): The first day of the resulting month.
+
+    Raises:
+        - None
+    """
+
+    month_index = day.year * 12 + day.month - 1 + months
+
+    return date(month_index // 12, month_index % 12 + 1, 1)
@@ -0,0 +1,385 @@
+# Importing the required modules
+from connections import db_connections
+from utils import logs_handler, schema_catalog
+# Importing the required libraries
+from datetime import datetime, timedelta
+import threading
+import time
+import os
+
+# The rollup tables, from the finest to the coarsest: (table, granularity in seconds).
+ROLLUPS = (("rollup_hourly", 3600), ("rollup_daily", 86400))
+ROLLUP_TABLES = ("rollup_hourly", "rollup_daily", "rollup_watermarks") # The tables created by the migration V1.0.3.
+HOUR_EXPRESSION = "timestamp(date(DATE), maketime(hour(DATE), 0, 0))" # The start of the hour of a reading (without '%', the parameters use it).
+
+# State of the rollups.
+rollup_lock = threading.Lock() # Guards the state below.
+rollup_state = {
+    "thread": None, # The background thread that maintains the rollups.
+    "watermarks": {}, # The watermark of each measure, as read by this process for the routing of the queries.
+    "loaded": 0.0, # The time (time.monotonic) the watermarks were read.
+    "runs": 0, # Number of runs of the maintenance.
+    "rolled_hours": 0, # Number of hours (of a measure) rolled up.
+    "last_run_seconds": 0.0, # The duration of the last run.
+}
+rollup_stopping = threading.Event() # Set to stop the background thread.
+
+def enabled() -> bool:
+    """
+    This function checks if the rollups are enabled and their tables exist (the migration V1.0.3 is applied).
+
+    Args:
+        - None
+
+    Returns:
+        - bool: True if the rollups can be used.
+    """
+
+    return os.environ.get("API_ROLLUPS", "true").lower() in ("true", "1", "yes") and schema_catalog.tables().issuperset(ROLLUP_TABLES)
+
+def start() -> None:
+    """
+    This function starts the background thread that maintains the rollups every 'interval' seconds.
+    It must run in a single process: the one with the ingest pipeline (the first one if there are several).
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    with rollup_lock:
+        if rollup_state["thread"] is not None or not enabled():
+            return
+
+        rollup_stopping.clear()
+
+        rollup_state["thread"] = threading.Thread(target = rollup_loop, name = "rollups", daemon = True)
+        rollup_state["thread"].start()
+
+def stop(timeout: float = 30) -> None:
+    """
+    This function stops the background thread, after the chunk it is writing.
+
+    Args:
+        - timeout (float): The maximum seconds to wait for the thread.
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    with rollup_lock:
+        thread = rollup_state["thread"]
+        rollup_state["thread"] = None
+
+    if thread is not None:
+        rollup_stopping.set()
+        thread.join(timeout)
+
+def rollup_loop() -> None:
+    """
+    This function is the body of the background thread: it rolls up the new readings of every measure, then waits for the interval.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    logger = logs_handler.init("rollups") # Get the logger of the rollups.
+
+    while not rollup_stopping.is_set():
+        start = time.monotonic()
+
+        for measure in list(schema_catalog.measures()):
+            if rollup_stopping.is_set():
+                break
+
+            if measure not in schema_catalog.tables(): # A measure without its measurement table.
+                continue
+
+            try:
+                db_connection, db_cursor = db_connections.init() # Check out a connection from the pool.
+
+                try:
+                    rolled = refresh(db_cursor, measure)
+
+                finally:
+                    db_connections.close(db_connection, db_cursor) # Return the connection to the pool.
+
+                if rolled:
+                    logger.debug(f"Rollups of {measure} updated. Hours rolled up: {rolled}")
+
+            except Exception as error:
+                logger.error(f"An error occurred while updating the rollups of {measure}. See the error below:")
+                logger.error(f"Error: {error}")
+
+        with rollup_lock:
+            rollup_state["runs"] += 1
+            rollup_state["last_run_seconds"] = round(time.monotonic() - start, 3)
+
+        rollup_stopping.wait(float(os.environ.get("API_ROLLUPS_INTERVAL", "60")))
+
+def refresh(db_cursor, measure: str) -> int:
+    """
+    This function rolls up the readings of a measure written since the last run.
+    The hours from the watermark to the last complete hour (minus the 'lag' setting, for the readings that arrive late) are rolled up
+    in chunks of a day, each one in its own transaction with the new watermark, so an interrupted run continues where it stopped.
+    The readings written since the last run with a DATE before the watermark (e.g. replayed from the spool of the ingest)
+    are found by their ID, and their hours are rolled up again. The daily rollup of a day is computed from its hours once the day is complete.
+
+    Args:
+        - db_cursor (mysql.connector.cursor): The cursor object.
+        - measure (str): The measure (and measurement table), of the schema catalog.
+
+    Returns:
+        - hours (int): The number of hours rolled up.
+
+    Raises:
+        - Exception: If there is an error in reading or writing the tables.
+    """
+
+    try:
+        db_cursor.execute("select WATERMARK, LAST_ID from rollup_watermarks where MEASURE = %s", (measure,))
+        rows = db_cursor.fetchall()
+        watermark, last_id = rows[0] if rows else (None, 0)
+
+        db_cursor.execute(f"select max(ID) from {measure}")
+        max_id = db_cursor.fetchall()[0][0] or 0 # The readings written after this are left to the next run.
+
+        if watermark is None: # Start from the first reading.
+            db_cursor.execute(f"select min(DATE) from {measure}")
+            first = db_cursor.fetchall()[0][0]
+
+            if first is None: # There are no readings yet.
+                return 0
+
+            start = floor_date(first, 3600)
+
+        else:
+            start = watermark
+
+            if max_id > last_id: # Find the oldest reading written since the last run with a DATE already rolled up.
+                db_cursor.execute(f"select min(DATE) from {measure} where ID > %s and ID <= %s and DATE < %s", (last_id, max_id, watermark))
+                late = db_cursor.fetchall()[0][0]
+
+                if late is not None:
+                    start = floor_date(late, 3600)
+
+        target = floor_date(datetime.now() - timedelta(seconds = float(os.environ.get("API_ROLLUPS_LAG", "300"))), 3600)
+        hours = 0
+
+        while start < target and not rollup_stopping.is_set(): # Roll up a day (or the part of it up to the target) per transaction.
+            end = min(floor_date(start, 86400) + timedelta(days = 1), target)
+
+            db_cursor.execute("start transaction")
+
+            try:
+                db_cursor.execute(
+                    "insert into rollup_hourly (MEASURE, CHIP_ID, BUCKET, COUNT, MIN, MAX, SUM) "
+                    f"select %s, CHIP_ID, {HOUR_EXPRESSION}, count(*), min(VALUE), max(VALUE), sum(VALUE) from {measure} "
+                    f"where DATE >= %s and DATE < %s group by CHIP_ID, {HOUR_EXPRESSION} "
+                    "on duplicate key update COUNT = values(COUNT), MIN = values(MIN), MAX = values(MAX), SUM = values(SUM)",
+                    (measure, start, end)
+                )
+
+                if end == floor_date(end, 86400): # The day is complete, roll it up from its hours.
+                    day = end - timedelta(days = 1)
+
+                    db_cursor.execute(
+                        "insert into rollup_daily (MEASURE, CHIP_ID, BUCKET, COUNT, MIN, MAX, SUM) "
+                        "select MEASURE, CHIP_ID, %s, sum(COUNT), min(MIN), max(MAX), sum(SUM) from rollup_hourly "
+                        "where MEASURE = %s and BUCKET >= %s and BUCKET < %s group by CHIP_ID "
+                        "on duplicate key update COUNT = values(COUNT), MIN = values(MIN), MAX = values(MAX), SUM = values(SUM)",
+                        (day, measure, day, end)
+                    )
+
+                save_watermark(db_cursor, measure, end, last_id)
+
+                db_cursor.execute("commit")
+
+            except Exception as error:
+                db_cursor.execute("rollback")
+                raise error
+
+            hours += int((end - start).total_seconds() // 3600)
+            start = end
+
+        if not rollup_stopping.is_set() and max_id > last_id: # Every reading up to max_id is rolled up (or after the watermark).
+            save_watermark(db_cursor, measure, max(start, watermark or start), max_id)
+
+        with rollup_lock:
+            rollup_state["rolled_hours"] += hours
+
+        return hours
+
+    except Exception as error:
+        raise error
+
+def save_watermark(db_cursor, measure: str, watermark: datetime, last_id: int) -> None:
+    """
+    This function saves the watermark of a measure.
+
+    Args:
+        - db_cursor (mysql.connector.cursor): The cursor object.
+        - measure (str): The measure.
+        - watermark (datetime.datetime): The readings before this date are rolled up.
+        - last_id (int): The last reading ID rolled up.
+
+    Returns:
+        - None
+
+    Raises:
+        - Exception: If there is an error in writing the table.
+    """
+
+    db_cursor.execute(
+        "insert into rollup_watermarks (MEASURE, WATERMARK, LAST_ID) values (%s, %s, %s) "
+        "on duplicate key update WATERMARK = values(WATERMARK), LAST_ID = values(LAST_ID)",
+        (measure, watermark, last_id)
+    )
+
+def route(measure: str, bucket_seconds: int, start_date: str, end_date: str) -> tuple:
+    """
+    This function chooses the rollup that answers an aggregation: the coarsest one whose granularity divides the bucket size
+    and that covers a part of the date range. The watermarks are read from the database at most once per 'interval' seconds.
+
+    Args:
+        - measure (str): The measure (and measurement table) queried.
+        - bucket_seconds (int): The bucket size of the aggregation, in seconds.
+        - start_date (str): The start date, or None.
+        - end_date (str): The end date, or None.
+
+    Returns:
+        - rollup (tuple): The (table, granularity, first bucket, end) of the rollup rows to read, or None if the raw table must be queried.
+          The first bucket is None if the range has no start. The readings before the first bucket and from the end are read from the raw table.
+
+    Raises:
+        - None
+    """
+
+    if bucket_seconds % ROLLUPS[0][1] != 0 or not enabled():
+        return None
+
+    watermark = watermarks().get(measure)
+
+    if watermark is None: # The measure is not rolled up yet.
+        return None
+
+    start = datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S") if start_date is not None else None
+    end = datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S") + timedelta(seconds = 1) if end_date is not None else None # Exclusive.
+
+    for table, granularity in reversed(ROLLUPS): # From the coarsest.
+        if bucket_seconds % granularity != 0:
+            continue
+
+        first = ceil_date(start, granularity) if start is not None else None
+        last = floor_date(watermark, granularity) # The end of the rows of the rollup.
+
+        if end is not None:
+            last = min(last, floor_date(end, granularity))
+
+        if first is None or first < last:
+            return (table, granularity, first, last)
+
+    return None
+
+def watermarks() -> dict:
+    """
+    This function returns the watermark of each measure, reading them from the database if they are older than the interval.
+
+    Args:
+        - None
+
+    Returns:
+        - watermarks (dict): The watermark (datetime.datetime) of each measure. Empty if they cannot be read.
+    """
+
+    with rollup_lock:
+        if time.monotonic() - rollup_state["loaded"] < float(os.environ.get("API_ROLLUPS_INTERVAL", "60")):
+            return rollup_state["watermarks"]
+
+        rollup_state["loaded"] = time.monotonic() # Do not retry on every request if the database cannot be read.
+
+    try:
+        db_connection, db_cursor = db_connections.init() # Check out a connection from the pool.
+
+        try:
+            current = dict(db_connections.execute(db_cursor, "select MEASURE, WATERMARK from rollup_watermarks"))
+
+        finally:
+            db_connections.close(db_connection, db_cursor) # Return the connection to the pool.
+
+    except Exception as error:
+        logs_handler.init("rollups").warning(f"The watermarks of the rollups could not be read. Error: {error}")
+
+        current = {}
+
+    with rollup_lock:
+        rollup_state["watermarks"] = current
+
+    return current
+
+def stats() -> dict:
+    """
+    This function returns the statistics of the rollups.
+
+    Args:
+        - None
+
+    Returns:
+        - stats (dict): The runs of the maintenance in this process and the watermarks read for the routing.
+    """
+
+    with rollup_lock:
+        return {
+            "enabled": rollup_state["thread"] is not None or bool(rollup_state["watermarks"]),
+            "runs": rollup_state["runs"],
+            "rolled_hours": rollup_state["rolled_hours"],
+            "last_run_seconds": rollup_state["last_run_seconds"],
+            "watermarks": {measure: str(watermark) for measure, watermark in rollup_state["watermarks"].items()},
+        }
+
+def floor_date(date: datetime, granularity: int) -> datetime:
+    """
+    This function rounds a date down to the start of its hour or day.
+
+    Args:
+        - date (datetime.datetime): The date.
+        - granularity (int): 3600 or 86400.
+
+    Returns:
+        - date (datetime.datetime): The start of the hour or day.
+    """
+
+    if granularity == 86400:
+        return date.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+
+    return date.replace(minute = 0, second = 0, microsecond = 0)
+
+def ceil_date(date: datetime, granularity: int) -> datetime:
+    """
+    This function rounds a date up to the start of the next hour or day (a date already at the start is kept).
+
+    Args:
+        - date (datetime.datetime): The date.
+        - granularity (int): 3600 or 86400.
+
+    Returns:
+        - date (datetime.datetime): The rounded date.
+    """
+
+    floored = floor_date(date, granularity)
+
+    return floored if floored == date else floored + timedelta(seconds = granularity)
@@ -0,0 +1,691 @@
+# Importing the required modules
+from connections import db_connections, ingest_spool
+from utils import logs_handler, metrics
+# Importing the required libraries
+import mysql.connector
+import atexit
+import json
+import queue
+import threading
+import time
+import os
+
+# State of the ingest pipeline.
+ingest_queue = None # The bounded queue between the MQTT threads and the writer thread, of (reception time, data, acknowledgement, window).
+ingest_thread = None # The writer thread.
+ingest_replayer = None # The thread that replays the spool into the database.
+ingest_degraded = threading.Event() # Set while the database is unavailable: the batches are written to the spool, not to the database.
+ingest_replay_wakeup = threading.Event() # Wakes the replayer up before its retry interval (to stop it).
+ingest_stopping = threading.Event() # Set to stop the replayer.
+ingest_settings = {} # The settings of the pipeline, loaded from the environment variables in init.
+ingest_stats_counters = {
+    "enqueued": 0, # Number of messages accepted in the queue.
+    "dropped": 0, # Number of messages dropped because the queue was full.
+    "written": 0, # Number of messages written to the database.
+    "failed": 0, # Number of messages lost because their batch could not be written (nor spooled).
+    "spooled": 0, # Number of messages written to the spool because the database was unavailable.
+    "replayed": 0, # Number of messages of the spool written to the database.
+    "quarantined": 0, # Number of messages rejected by the database (e.g. a value out of range), written to the quarantine file.
+    "batches": 0, # Number of batches written to the database.
+}
+ingest_stats_lock = threading.Lock() # Guards the counters above.
+ingest_listeners = [] # The functions called with each batch after it is committed.
+ingest_relayed_stats = {} # The last statistics relayed by each separate ingest process, by index, as (time.monotonic of reception, stats).
+
+STOP = object() # Sentinel put in the queue to stop the writer thread.
+OVERFLOW_POLICIES = ("block", "drop_newest", "drop_oldest") # The supported backpressure policies when the queue is full.
+UNAVAILABLE_ERRORS = ( # The errors of an unavailable database: the batch is spooled (or retried), any other error comes from its messages.
+    mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError, mysql.connector.errors.PoolError, TimeoutError,
+)
+
+def init(process: int = 0) -> None:
+    """
+    This function initializes the ingest pipeline and starts the writer thread.
+    If the spool is enabled, it is opened and the replayer thread is started, replaying first the messages left by the previous run.
+    The settings are read from the environment variables set by the credentials manager.
+
+    Args:
+        - process (int): The index of the ingest process, each process has its own spool.
+
+    Returns:
+        - None
+
+    Raises:
+        - ValueError: If the overflow policy is not supported.
+    """
+
+    global ingest_queue, ingest_thread, ingest_replayer
+
+    if ingest_thread is not None: # If the pipeline is already running.
+        return
+
+    ingest_settings["queue_size"] = int(os.environ.get("API_INGEST_QUEUE_SIZE", "10000")) # Maximum number of messages waiting to be written.
+    ingest_settings["batch_size"] = int(os.environ.get("API_INGEST_BATCH_SIZE", "200")) # Messages written per transaction.
+    ingest_settings["flush_interval"] = float(os.environ.get("API_INGEST_FLUSH_INTERVAL", "1")) # Maximum seconds a message waits in a batch.
+    ingest_settings["overflow_policy"] = str(os.environ.get("API_INGEST_OVERFLOW_POLICY", "block")) # What to do when the queue is full.
+    ingest_settings["block_timeout"] = float(os.environ.get("API_INGEST_BLOCK_TIMEOUT", "5")) # Seconds to block the MQTT thread before dropping.
+    ingest_settings["receive_maximum"] = int(os.environ.get("API_MQTT_RECEIVE_MAXIMUM", "20")) # Unacknowledged messages the broker sends to a client (0: no limit).
+    ingest_settings["spool"] = os.environ.get("API_INGEST_SPOOL", "true").lower() in ("true", "1", "yes") # Spool the batches while the database is unavailable.
+    ingest_settings["retry_interval"] = float(os.environ.get("API_INGEST_SPOOL_RETRY_INTERVAL", "5")) # Seconds between two attempts to replay the spool.
+    ingest_settings["quarantine"] = f"{os.environ.get('data_dir')}/quarantine/{process}.jsonl" # The messages rejected by the database.
+
+    if ingest_settings["overflow_policy"] not in OVERFLOW_POLICIES:
+        raise ValueError(f"Invalid ingest overflow policy: {ingest_settings['overflow_policy']}. Valid policies: {OVERFLOW_POLICIES}")
+
+    if ingest_settings["spool"]:
+        ingest_spool.init(f"{os.environ.get('data_dir')}/spool/{process}")
+
+        ingest_stopping.clear()
+        ingest_degraded.clear()
+
+        if ingest_spool.pending(): # Replay the messages spooled by the previous run before writing the new ones.
+            ingest_degraded.set()
+
+        ingest_replayer = threading.Thread(target = replay_loop, name = "ingest-replayer", daemon = True)
+        ingest_replayer.start()
+
+    ingest_queue = queue.Queue(maxsize = ingest_settings["queue_size"])
+    ingest_thread = threading.Thread(target = writer_loop, name = "ingest-writer", daemon = True)
+    ingest_thread.start() # Start the writer thread.
+
+    atexit.register(shutdown) # Drain the queue if the process exits without calling shutdown.
+
+def add_listener(listener: callable) -> None:
+    """
+    This function registers a function to be called by the writer thread with each batch after it is committed.
+    The listeners must be fast, they run before the next batch is written.
+
+    Args:
+        - listener (function): The function, called with the list of the data of the messages written.
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    if listener not in ingest_listeners:
+        ingest_listeners.append(listener)
+
+def enqueue(data: dict, ack: callable = None, window = None) -> bool:
+    """
+    This function puts a parsed message in the queue of the writer thread, applying the backpressure policy if the queue is full.
+    The acknowledgement of the message is called once it is committed, or when it is dropped (it will not be written).
+    If its batch cannot be written, it is not called, so the broker can deliver the message again.
+
+    Args:
+        - data (dict): The data parsed by the data checker.
+        - ack (function): The function that acknowledges the message to the broker, or None.
+        - window: The in-flight window of the message (its MQTT client), or None. The broker stops sending to a client once
+          'receive_maximum' of its messages are not acknowledged, so the batch is written as soon as a window is full.
+
+    Returns:
+        - bool: True if the message was accepted, False if it was dropped.
+
+    Raises:
+        - RuntimeError: If the pipeline is not running.
+    """
+
+    if ingest_queue is None:
+        raise RuntimeError("The ingest pipeline is not running.")
+
+    policy = ingest_settings["overflow_policy"]
+    accepted = True
+    item = (time.monotonic(), data, ack, window if ack is not None else None) # Keep the reception time, to measure the ingest lag.
+
+    try:
+        if policy == "block": # Block the MQTT thread (and so the broker) until there is room, up to the timeout.
+            ingest_queue.put(item, timeout = ingest_settings["block_timeout"])
+
+        else:
+            ingest_queue.put_nowait(item)
+
+    except queue.Full:
+        if policy == "drop_oldest": # Make room by dropping the oldest message.
+            try:
+                dropped = ingest_queue.get_nowait()
+
+                if dropped is STOP: # The writer is stopping: keep its sentinel, and drop the new message instead.
+                    ingest_queue.put(STOP) # Waits if another thread took the room meanwhile, the writer still empties the queue.
+                    accepted = False
+
+                else:
+                    ingest_queue.put_nowait(item)
+                    acknowledge([dropped[2]])
+
+            except (queue.Empty, queue.Full):
+                accepted = False
+
+        else:
+            accepted = False
+
+        if not accepted:
+            acknowledge([ack])
+
+        with ingest_stats_lock:
+            ingest_stats_counters["dropped"] += 1
+
+    if accepted:
+        with ingest_stats_lock:
+            ingest_stats_counters["enqueued"] += 1
+
+    return accepted
+
+def writer_loop() -> None:
+    """
+    This function is the body of the writer thread.
+    It groups the messages of the queue in batches, which are written when they reach the batch size or the flush interval,
+    or when the messages not acknowledged of a client reach the receive maximum (the broker would not send more until the flush interval).
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    stopping = False
+
+    while not stopping:
+        item = ingest_queue.get() # Wait for the first message of the batch.
+
+        if item is STOP:
+            break
+
+        batch = [item[1]]; received = [item[0]]; acks = [item[2]]
+        deadline = time.monotonic() + ingest_settings["flush_interval"]
+        in_flight = {item[3]: 1} # The messages of the batch not acknowledged, by window.
+
+        while len(batch) < ingest_settings["batch_size"] and not window_full(in_flight, item[3]): # Fill the batch until it is full or the flush interval expires.
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                break
+
+            try:
+                item = ingest_queue.get(timeout = remaining)
+
+            except queue.Empty:
+                break
+
+            if item is STOP:
+                stopping = True
+                break
+
+            batch.append(item[1]); received.append(item[0]); acks.append(item[2])
+            in_flight[item[3]] = in_flight.get(item[3], 0) + 1
+
+        flush(batch, received, acks)
+
+def window_full(in_flight: dict, window) -> bool:
+    """
+    This function checks if the in-flight window of the last message of a batch is full, so the broker does not send more messages to its client.
+
+    Args:
+        - in_flight (dict): The number of messages of the batch not acknowledged, by window.
+        - window: The window of the last message, or None.
+
+    Returns:
+        - bool: True if the batch must be written now.
+    """
+
+    return window is not None and 0 < ingest_settings["receive_maximum"] <= in_flight[window]
+
+def flush(batch: list, received: list = (), acks: list = ()) -> None:
+    """
+    This function writes a batch of messages to the database in a single transaction.
+    If the database is unavailable, the batch is written to the spool and the pipeline switches to the degraded mode:
+    the next batches go straight to the spool, without trying the database, until the replayer drains it.
+    If the spool is disabled or cannot be written, the error is logged and the messages are lost (unless the broker delivers them again).
+    If the database rejects the batch, the messages it accepts are written and the other ones are quarantined (see isolate).
+
+    Args:
+        - batch (list): The data of the messages, as parsed by the data checker.
+        - received (list): The reception time (time.monotonic) of each message, to measure the ingest lag.
+        - acks (list): The acknowledgement of each message, called once the batch is committed.
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    logger = logs_handler.init("ingest") # Get the logger of the ingest path.
+
+    if ingest_degraded.is_set() and spool(batch, acks): # The database is unavailable, do not try it for each batch.
+        return
+
+    written = batch
+
+    try:
+        write(batch)
+
+    except UNAVAILABLE_ERRORS as error:
+        if ingest_settings["spool"] and spool(batch, acks):
+            logger.warning(f"The database is unavailable, the messages are spooled until it is back. Error: {error}")
+
+            ingest_degraded.set() # The replayer tries the database again after the retry interval.
+
+            return
+
+        with ingest_stats_lock:
+            ingest_stats_counters["failed"] += len(batch)
+
+        logger.error(f"An error occurred while writing a batch of {len(batch)} messages to the database. See the error below:")
+        logger.error(f"Error: {error}")
+
+        return
+
+    except Exception as error: # Some messages are rejected, e.g. a value out of range.
+        written, remaining = isolate(batch, error)
+
+        if remaining: # The database became unavailable meanwhile.
+            done = len(batch) - len(remaining) # The remaining messages are the last ones of the batch.
+
+            if ingest_settings["spool"] and spool(remaining, acks[done:]): # Their acknowledgements are called once they are on disk.
+                ingest_degraded.set()
+
+            else:
+                with ingest_stats_lock:
+                    ingest_stats_counters["failed"] += len(remaining)
+
+                logger.error(f"{len(remaining)} messages could not be written to the database nor spooled, the broker may deliver them again.")
+
+            acks = acks[:done] # Only the messages committed or quarantined are acknowledged below.
+
+    with ingest_stats_lock:
+        ingest_stats_counters["written"] += len(written)
+        ingest_stats_counters["batches"] += 1
+
+    committed = time.monotonic()
+
+    for reception_time in received: # Record the time from the reception of each message to the commit.
+        metrics.observe("orus_ingest_lag_seconds", committed - reception_time)
+
+    acknowledge(acks) # The messages are committed (or quarantined), the broker must not deliver them again.
+
+    if written:
+        notify_listeners(written) # Notify the listeners of the committed batch.
+
+def write(batch: list) -> None:
+    """
+    This function writes a batch of messages to the database in a single transaction.
+
+    Args:
+        - batch (list): The data of the messages, as parsed by the data checker.
+
+    Returns:
+        - None
+
+    Raises:
+        - mysql.connector.errors.InterfaceError: If no connection can be checked out (whatever the error, the messages are not the cause).
+        - Exception: If the batch cannot be written.
+    """
+
+    try: # Check out a connection from the pool.
+        db_connection, db_cursor = db_connections.init()
+
+    except mysql.connector.Error as error:
+        if isinstance(error, UNAVAILABLE_ERRORS):
+            raise error
+
+        raise mysql.connector.errors.InterfaceError(f"No connection to the database. Error: {error}")
+
+    try:
+        with metrics.timer("orus_ingest_write_seconds"):
+            db_connections.write_batch(db_cursor, batch) # Write the batch to the database.
+
+    finally:
+        db_connections.close(db_connection, db_cursor) # Return the connection to the pool.
+
+def isolate(batch: list, error: Exception) -> tuple:
+    """
+    This function writes a batch rejected by the database in halves, splitting again the halves rejected, until the messages rejected are alone.
+    They are written to the quarantine file, so one bad message does not hold back (or lose) the other ones of its batch.
+
+    Args:
+        - batch (list): The data of the messages, as parsed by the data checker.
+        - error (Exception): The error of the whole batch.
+
+    Returns:
+        - written (list): The messages written to the database, in their order.
+        - remaining (list): The last messages of the batch, not tried because the database became unavailable, or an empty list.
+
+    Raises:
+        - None
+    """
+
+    written = []; rejected = []
+    parts = [batch[:len(batch) // 2], batch[len(batch) // 2:]] if len(batch) > 1 else []
+
+    if len(batch) == 1:
+        rejected.append((batch[0], error))
+
+    while parts:
+        part = parts.pop(0)
+
+        if not part:
+            continue
+
+        try:
+            write(part)
+            written.extend(part)
+
+        except UNAVAILABLE_ERRORS:
+            quarantine(rejected)
+
+            return written, [data for remaining_part in [part] + parts for data in remaining_part]
+
+        except Exception as part_error:
+            if len(part) == 1:
+                rejected.append((part[0], part_error))
+
+            else: # Split the part, its halves are tried before the next parts to keep the order.
+                parts[:0] = [part[:len(part) // 2], part[len(part) // 2:]]
+
+    quarantine(rejected)
+
+    return written, []
+
+def quarantine(rejected: list) -> None:
+    """
+    This function appends the messages rejected by the database to the quarantine file, one JSON line each with the error.
+
+    Args:
+        - rejected (list): The (data, error) of each message.
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    if not rejected:
+        return
+
+    logger = logs_handler.init("ingest") # Get the logger of the ingest path.
+
+    with ingest_stats_lock:
+        ingest_stats_counters["quarantined"] += len(rejected)
+
+    try:
+        os.makedirs(os.path.dirname(ingest_settings["quarantine"]), exist_ok = True)
+
+        with open(ingest_settings["quarantine"], "a") as quarantine_file:
+            for data, error in rejected:
+                quarantine_file.write(json.dumps({"data": data, "error": str(error)}, separators = (",", ":")) + "\n")
+
+    except Exception as error:
+        logger.error(f"An error occurred while writing {len(rejected)} rejected messages to the quarantine file. Error: {error}")
+
+    logger.warning(f"{len(rejected)} messages were rejected by the database and quarantined in {ingest_settings['quarantine']}. First error: {rejected[0][1]}")
+
+def spool(batch: list, acks: list = ()) -> bool:
+    """
+    This function writes a batch of messages to the spool. Once spooled, the messages are acknowledged, the replayer writes them to the database.
+
+    Args:
+        - batch (list): The data of the messages, as parsed by the data checker.
+        - acks (list): The acknowledgement of each message.
+
+    Returns:
+        - bool: True if the batch was spooled.
+
+    Raises:
+        - None
+    """
+
+    try:
+        ingest_spool.append(batch)
+
+    except Exception as error:
+        logs_handler.init("ingest").error(f"An error occurred while writing a batch of {len(batch)} messages to the spool. Error: {error}")
+
+        return False
+
+    with ingest_stats_lock:
+        ingest_stats_counters["spooled"] += len(batch)
+
+    acknowledge(acks) # The messages are on disk, the broker must not deliver them again.
+
+    return True
+
+def replay_loop() -> None:
+    """
+    This function is the body of the replayer thread.
+    Every retry interval (or when the writer spools a batch) it tries to replay the spool into the database,
+    and leaves the degraded mode once the spool is drained.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    logger = logs_handler.init("ingest") # Get the logger of the ingest path.
+
+    while not ingest_stopping.is_set():
+        ingest_replay_wakeup.wait(ingest_settings["retry_interval"])
+        ingest_replay_wakeup.clear()
+
+        if ingest_stopping.is_set() or not ingest_spool.pending():
+            continue
+
+        try:
+            replay()
+
+        except Exception as error:
+            logger.warning(f"The spool could not be replayed, retrying in {ingest_settings['retry_interval']} seconds. Error: {error}")
+
+            continue
+
+        if ingest_degraded.is_set() and not ingest_spool.pending():
+            logger.info("The spool was replayed, the database is available again.")
+
+            ingest_degraded.clear()
+
+def replay() -> None:
+    """
+    This function writes the spooled messages to the database in batches of the batch size, keeping the timestamp of their reception.
+    The checkpoint of the spool is saved after each batch, so a restart replays at most the last batch again.
+    The messages rejected by the database are quarantined (see isolate), so they do not block the spool.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - Exception: If the database is unavailable, the rest of the spool is replayed in the next attempt.
+    """
+
+    while ingest_spool.pending() and not ingest_stopping.is_set():
+        records, positions = ingest_spool.read()
+
+        for start in range(0, len(records), ingest_settings["batch_size"]):
+            batch = records[start:start + ingest_settings["batch_size"]]
+
+            written = batch
+
+            try:
+                write(batch)
+
+            except UNAVAILABLE_ERRORS as error:
+                raise error
+
+            except Exception as error: # Some messages are rejected, e.g. a value out of range.
+                written, remaining = isolate(batch, error)
+
+                if remaining: # The database became unavailable meanwhile, the whole batch is replayed in the next attempt.
+                    raise ConnectionError(f"The database became unavailable while replaying a batch of {len(batch)} messages.")
+
+            ingest_spool.commit(positions[start + len(batch) - 1]) # The rejected messages are quarantined, the checkpoint moves past them.
+
+            with ingest_stats_lock:
+                ingest_stats_counters["replayed"] += len(written)
+                ingest_stats_counters["batches"] += 1
+
+            if written:
+                notify_listeners(written) # Notify the listeners of the committed batch.
+
+        if not records: # A segment was finished (or skipped).
+            ingest_spool.commit(positions[-1])
+
+def acknowledge(acks: list) -> None:
+    """
+    This function calls the acknowledgements of some messages.
+
+    Args:
+        - acks (list): The acknowledgements (functions or None).
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    for ack in acks:
+        if ack is not None:
+            try:
+                ack()
+
+            except Exception as error: # If the client is disconnected, the broker delivers the message again.
+                logs_handler.init("ingest").warning(f"A message could not be acknowledged. Error: {error}")
+
+def notify_listeners(batch: list) -> None:
+    """
+    This function calls the listeners with a committed batch.
+    It is called by the writer thread, or by the web processes when the batches are relayed from a separate ingest process.
+
+    Args:
+        - batch (list): The data of the messages written, as parsed by the data checker.
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    for listener in ingest_listeners: # Iterate over the listeners.
+        try:
+            listener(batch)
+
+        except Exception as error:
+            logger = logs_handler.init("ingest") # Get the logger of the ingest path.
+            logger.error(f"An error occurred in a listener of the ingest pipeline. See the error below:")
+            logger.error(f"Error: {error}")
+
+def shutdown(timeout: float = 30) -> None:
+    """
+    This function stops the writer thread after it writes every message already in the queue.
+    The MQTT clients must stop receiving messages first, so no new messages are enqueued during the drain.
+
+    Args:
+        - timeout (float): The maximum seconds to wait for the queue to be drained.
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    global ingest_queue, ingest_thread, ingest_replayer
+
+    if ingest_thread is None: # If the pipeline is not running.
+        return
+
+    ingest_queue.put(STOP) # The sentinel is queued after the pending messages, so they are written first (or spooled).
+    ingest_thread.join(timeout)
+
+    if ingest_replayer is not None: # Stop the replayer, the messages left in the spool are replayed on the next start.
+        ingest_stopping.set()
+        ingest_replay_wakeup.set()
+        ingest_replayer.join(timeout)
+
+        ingest_spool.close()
+
+    ingest_queue = None; ingest_thread = None; ingest_replayer = None
+
+def record_relayed_stats(process: int, stats: dict) -> None:
+    """
+    This function keeps the statistics relayed by a separate ingest process, so the web processes report the ingest that actually runs.
+
+    Args:
+        - process (int): The index of the ingest process.
+        - stats (dict): The statistics of its pipeline, as returned by stats.
+
+    Returns:
+        - None
+    """
+
+    with ingest_stats_lock:
+        ingest_relayed_stats[process] = (time.monotonic(), stats)
+
+def stats() -> dict:
+    """
+    This function returns the statistics of the ingest pipeline.
+    If the pipeline does not run in this process and the ingest processes relay their statistics, they are combined:
+    the counters, depths and bytes are added up, and the ingest is degraded if any process is.
+
+    Args:
+        - None
+
+    Returns:
+        - stats (dict): The counters of the pipeline, the current depth of the queue and the state of the spool.
+
+    Raises:
+        - None
+    """
+
+    if ingest_thread is None and ingest_relayed_stats:
+        return combined_relayed_stats()
+
+    with ingest_stats_lock:
+        stats = dict(ingest_stats_counters)
+
+    stats["queue_depth"] = ingest_queue.qsize() if ingest_queue is not None else 0
+    stats["degraded"] = ingest_degraded.is_set()
+    stats["spool"] = ingest_spool.stats() if ingest_replayer is not None else None
+
+    return stats
+
+def combined_relayed_stats() -> dict:
+    """
+    This function combines the last statistics relayed by the ingest processes.
+
+    Args:
+        - None
+
+    Returns:
+        - stats (dict): The statistics of every process together, with the number of processes and the age of the oldest statistics.
+    """
+
+    now = time.monotonic()
+
+    with ingest_stats_lock:
+        relayed = list(ingest_relayed_stats.values())
+
+    stats = {key: sum(process_stats.get(key, 0) for _, process_stats in relayed) for key in list(ingest_stats_counters) + ["queue_depth"]}
+    stats["degraded"] = any(process_stats.get("degraded", False) for _, process_stats in relayed)
+
+    spools = [process_stats["spool"] for _, process_stats in relayed if process_stats.get("spool") is not None]
+    stats["spool"] = {key: sum(spool[key] for spool in spools) for key in ("bytes", "pending_bytes")} if spools else None
+
+    stats["processes"] = len(relayed)
+    stats["relayed_seconds_ago"] = round(max(now - received for received, _ in relayed), 1)
+
+    return stats
@@ -0,0 +1,352 @@
+# Importing the required libraries
+import threading
+import struct
+import mmap
+import json
+import zlib
+import time
+import os
+
+# State of the spool of the ingest pipeline.
+spool_lock = threading.Lock() # Guards the state below and the writes to the files.
+spool_state = {
+    "directory": None, # The directory of the segments and the checkpoint.
+    "file": None, # The active segment, the only one written.
+    "segment": None, # The sequence number of the active segment.
+    "size": 0, # The bytes written to the active segment.
+    "position": None, # The (segment, offset) of the next record to replay, saved in the checkpoint.
+    "bytes": 0, # The bytes of every segment on disk.
+    "synced": 0.0, # The time (time.monotonic) of the last fsync of the active segment.
+}
+spool_settings = {} # The settings of the spool, loaded from the environment variables in init.
+
+RECORD_HEADER = struct.Struct(">II") # The length and the CRC32 of the payload of each record, the payload is the data of a message in JSON.
+FSYNC_POLICIES = ("always", "interval", "never") # When the active segment is synced to the disk.
+
+def init(directory: str) -> None:
+    """
+    This function opens the spool of the ingest pipeline: an append-only log of the messages that could not be written to the database,
+    split in segment files. The position of the next record to replay is kept in a checkpoint file, so the spool survives the restarts.
+    A new segment is started on each start, the previous ones are only read.
+
+    Args:
+        - directory (str): The directory of the spool, created if it does not exist.
+
+    Returns:
+        - None
+
+    Raises:
+        - ValueError: If the fsync policy is not supported.
+        - OSError: If the directory cannot be used.
+    """
+
+    spool_settings["segment_bytes"] = int(os.environ.get("API_INGEST_SPOOL_SEGMENT_BYTES", "16777216")) # Size of a segment before the next one is started.
+    spool_settings["max_bytes"] = int(os.environ.get("API_INGEST_SPOOL_MAX_BYTES", "1073741824")) # Maximum size of the spool on disk.
+    spool_settings["fsync"] = str(os.environ.get("API_INGEST_SPOOL_FSYNC", "interval")) # When the records are synced to the disk.
+    spool_settings["fsync_interval"] = float(os.environ.get("API_INGEST_SPOOL_FSYNC_INTERVAL", "1")) # Minimum seconds between two syncs with 'interval'.
+    spool_settings["mmap"] = os.environ.get("API_INGEST_SPOOL_MMAP", "false").lower() in ("true", "1", "yes") # Read the segments memory-mapped.
+
+    if spool_settings["fsync"] not in FSYNC_POLICIES:
+        raise ValueError(f"Invalid spool fsync policy: {spool_settings['fsync']}. Valid policies: {FSYNC_POLICIES}")
+
+    os.makedirs(directory, exist_ok = True)
+
+    with spool_lock:
+        spool_state["directory"] = directory
+
+        segments = list_segments()
+        checkpoint = load_checkpoint()
+        active = max(segments + ([checkpoint[0]] if checkpoint else []), default = 0) + 1
+        position = checkpoint or ((segments[0], 0) if segments else (active, 0))
+
+        for segment in segments: # Remove the segments already replayed.
+            if segment < position[0]:
+                os.remove(segment_path(segment))
+
+        spool_state.update(
+            file = open(segment_path(active), "ab"), segment = active, size = 0, position = position, synced = time.monotonic(),
+            bytes = sum(os.path.getsize(segment_path(segment)) for segment in list_segments()),
+        )
+
+def append(batch: list) -> None:
+    """
+    This function appends the data of some messages to the active segment, syncing it to the disk as set in the fsync policy.
+    With the 'interval' and 'never' policies, the records written since the last sync survive a crash of the process but not of the system.
+
+    Args:
+        - batch (list): The data of the messages, as parsed by the data checker (with the timestamp of their reception).
+
+    Returns:
+        - None
+
+    Raises:
+        - OSError: If the spool is full or the records cannot be written.
+    """
+
+    payloads = [json.dumps(data, separators = (",", ":")).encode("utf-8") for data in batch]
+    records = b"".join(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload for payload in payloads)
+
+    with spool_lock:
+        spool_file = spool_state["file"]
+
+        if spool_file is None:
+            raise OSError("The ingest spool is not open.")
+
+        if spool_state["bytes"] + len(records) > spool_settings["max_bytes"]:
+            raise OSError(f"The ingest spool is full. Size: {spool_state['bytes']} bytes.")
+
+        try:
+            spool_file.write(records)
+            spool_file.flush()
+
+        except Exception as error:
+            spool_file.truncate(spool_state["size"]) # Do not leave a partial record before the next ones.
+            raise error
+
+        spool_state["size"] += len(records); spool_state["bytes"] += len(records)
+
+        now = time.monotonic()
+
+        if spool_settings["fsync"] == "always" or (spool_settings["fsync"] == "interval" and now - spool_state["synced"] >= spool_settings["fsync_interval"]):
+            os.fsync(spool_file.fileno())
+            spool_state["synced"] = now
+
+        if spool_state["size"] >= spool_settings["segment_bytes"]: # Start the next segment.
+            os.fsync(spool_file.fileno())
+            spool_file.close()
+
+            spool_state.update(file = open(segment_path(spool_state["segment"] + 1), "ab"), segment = spool_state["segment"] + 1, size = 0)
+
+def pending() -> bool:
+    """
+    This function checks if there are records left to replay.
+
+    Args:
+        - None
+
+    Returns:
+        - bool: True if there are records after the position of the checkpoint.
+    """
+
+    with spool_lock:
+        return spool_state["file"] is not None and spool_state["position"] != (spool_state["segment"], spool_state["size"])
+
+def read(max_bytes: int = 1048576) -> tuple:
+    """
+    This function reads the records after the position of the checkpoint, up to about max_bytes.
+    A record that is truncated or does not match its checksum (a write interrupted by a crash) ends its segment.
+
+    Args:
+        - max_bytes (int): The bytes to read, a single record larger than this is read entirely.
+
+    Returns:
+        - records (list): The data of the messages.
+        - positions (list): The position after each record, to be saved with commit once it is replayed.
+                            It may hold a position without a record, when a segment is finished or skipped.
+
+    Raises:
+        - OSError: If the segment cannot be read.
+    """
+
+    with spool_lock:
+        segment, offset = spool_state["position"]
+        active = spool_state["segment"]; active_size = spool_state["size"]
+
+    path = segment_path(segment)
+
+    if segment == active:
+        end = active_size # The bytes after this are not written yet.
+
+    else:
+        end = os.path.getsize(path) if os.path.exists(path) else 0
+
+    skip = (segment, end) if segment == active else (next_segment(segment), 0) # The position after this segment.
+
+    if offset >= end:
+        return [], ([] if segment == active else [skip])
+
+    records = []; positions = []
+
+    with open(path, "rb") as segment_file:
+        if spool_settings["mmap"]: # Parse the records straight from the page cache, without copying the segment.
+            buffer = mmap.mmap(segment_file.fileno(), end, access = mmap.ACCESS_READ); base = 0
+            cursor = offset; limit = min(end, offset + max_bytes)
+
+        else:
+            segment_file.seek(offset)
+            buffer = segment_file.read(min(end - offset, max_bytes)); base = offset
+            cursor = 0; limit = len(buffer)
+
+        try:
+            while base + cursor + RECORD_HEADER.size <= end:
+                if cursor + RECORD_HEADER.size > limit:
+                    break
+
+                length, checksum = RECORD_HEADER.unpack_from(buffer, cursor)
+                stop = cursor + RECORD_HEADER.size + length
+
+                if base + stop > end: # The record was not written entirely.
+                    break
+
+                if stop > limit:
+                    if records: # Read it in the next call.
+                        break
+
+                    if not spool_settings["mmap"]: # A single record larger than max_bytes.
+                        buffer += segment_file.read(stop - len(buffer))
+
+                    limit = stop
+
+                payload = bytes(buffer[cursor + RECORD_HEADER.size:stop])
+
+                if zlib.crc32(payload) != checksum: # The record is corrupted.
+                    break
+
+                records.append(json.loads(payload))
+                cursor = stop
+                positions.append((segment, base + cursor))
+
+        finally:
+            if spool_settings["mmap"]:
+                buffer.close()
+
+    if not records: # The rest of the segment cannot be read.
+        return [], [skip]
+
+    return records, positions
+
+def commit(position: tuple) -> None:
+    """
+    This function saves the position of the next record to replay in the checkpoint file and removes the segments already replayed.
+    The checkpoint is replaced atomically, so a crash leaves the previous one or the new one.
+
+    Args:
+        - position (tuple): The (segment, offset) returned by read.
+
+    Returns:
+        - None
+
+    Raises:
+        - OSError: If the checkpoint cannot be written.
+    """
+
+    with spool_lock:
+        checkpoint_path = f"{spool_state['directory']}/checkpoint.json"
+
+        with open(f"{checkpoint_path}.tmp", "w") as checkpoint_file:
+            json.dump({"segment": position[0], "offset": position[1]}, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+
+        os.replace(f"{checkpoint_path}.tmp", checkpoint_path)
+
+        spool_state["position"] = tuple(position)
+
+        for segment in list_segments():
+            if segment < position[0] and segment != spool_state["segment"]:
+                spool_state["bytes"] -= os.path.getsize(segment_path(segment))
+                os.remove(segment_path(segment))
+
+def close() -> None:
+    """
+    This function syncs and closes the active segment. It is removed if it is empty.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    with spool_lock:
+        spool_file = spool_state["file"]
+
+        if spool_file is None:
+            return
+
+        os.fsync(spool_file.fileno())
+        spool_file.close()
+
+        if spool_state["size"] == 0:
+            os.remove(segment_path(spool_state["segment"]))
+
+        spool_state["file"] = None
+
+def stats() -> dict:
+    """
+    This function returns the statistics of the spool.
+
+    Args:
+        - None
+
+    Returns:
+        - stats (dict): The bytes of the segments on disk and the bytes left to replay.
+    """
+
+    with spool_lock:
+        return {
+            "bytes": spool_state["bytes"],
+            "pending_bytes": max(spool_state["bytes"] - spool_state["position"][1], 0) if spool_state["position"] else 0,
+        }
+
+def list_segments() -> list:
+    """
+    This function lists the segments of the spool.
+
+    Args:
+        - None
+
+    Returns:
+        - segments (list): The sequence numbers of the segments, sorted.
+    """
+
+    return sorted(int(name.split(".")[0]) for name in os.listdir(spool_state["directory"]) if name.endswith(".spool"))
+
+def next_segment(segment: int) -> int:
+    """
+    This function finds the segment after another one.
+
+    Args:
+        - segment (int): The sequence number of the segment.
+
+    Returns:
+        - segment (int): The sequence number of the next segment on disk, or of the active segment.
+    """
+
+    return min((other for other in list_segments() if other > segment), default = spool_state["segment"])
+
+def segment_path(segment: int) -> str:
+    """
+    This function returns the path to a segment.
+
+    Args:
+        - segment (int): The sequence number of the segment.
+
+    Returns:
+        - path (str): The path to the segment file.
+    """
+
+    return f"{spool_state['directory']}/{segment:012d}.spool"
+
+def load_checkpoint() -> tuple:
+    """
+    This function loads the position saved in the checkpoint file.
+
+    Args:
+        - None
+
+    Returns:
+        - position (tuple): The (segment, offset) of the next record to replay, or None if there is no checkpoint.
+    """
+
+    try:
+        with open(f"{spool_state['directory']}/checkpoint.json", "r") as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+
+        return (int(checkpoint["segment"]), int(checkpoint["offset"]))
+
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,285 @@
+# Importing the required modules
+from connections import broker_connections, db_connections
+from utils import logs_handler, schema_catalog
+
+import threading
+import time
+import os
+
+# State of the supervisor of the connections of this process.
+supervisor_lock = threading.Lock() # Guards the state below.
+supervisor_state = {
+    "thread": None, # The background thread that probes and reconnects the database and the broker.
+    "on_database_up": None, # Called by the thread when the database answers after being down (or never reached).
+    "broker_clients": [], # The MQTT clients watched (the ingest workers or the observer of this process).
+    "started": time.time(), # When this process started.
+}
+supervisor_components = {
+    component: {
+        "up": False, # True if the last probe succeeded.
+        "since": None, # When the component went up or down (seconds since the epoch).
+        "failures": 0, # Consecutive failed probes (or reconnections), they set the backoff.
+        "retry_at": 0.0, # The monotonic time of the next probe.
+        "recoveries": 0, # Number of times the component went up again after being down.
+        "last_error": None, # The last error, as text.
+    }
+    for component in ("database", "broker")
+}
+supervisor_stopping = threading.Event() # Set to stop the background thread.
+
+def start(on_database_up: callable = None, broker_clients: list = (), database_up: bool = False) -> None:
+    """
+    This function starts the background thread that supervises the connections of this process.
+    Every 'supervisor_interval' seconds, it checks the MQTT clients and probes the database (only every 'probe_interval' seconds while it is up).
+    A component that fails is retried with an exponential backoff, between the 'reconnect_min_delay' and 'reconnect_max_delay' settings.
+
+    Args:
+        - on_database_up (function): The function called when the database answers after being down, e.g. to load the schema.
+        - broker_clients (list): The MQTT clients to watch.
+        - database_up (bool): True if the startup already reached the database (and loaded the schema), so the next probe is not due yet.
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    with supervisor_lock:
+        supervisor_state["on_database_up"] = on_database_up
+        supervisor_state["broker_clients"] = [broker_client for broker_client in broker_clients if broker_client is not None]
+
+        if database_up:
+            supervisor_components["database"].update(up = True, since = time.time(), retry_at = time.monotonic() + float(os.environ.get("API_SERVER_PROBE_INTERVAL", "5")))
+
+        if supervisor_state["thread"] is not None:
+            return
+
+        supervisor_stopping.clear()
+
+        supervisor_state["thread"] = threading.Thread(target = supervise_loop, name = "supervisor", daemon = True)
+        supervisor_state["thread"].start()
+
+def stop(timeout: float = 10) -> None:
+    """
+    This function stops the background thread. It must be stopped before the MQTT clients are disconnected, so they are not reconnected.
+
+    Args:
+        - timeout (float): The maximum seconds to wait for the thread.
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    with supervisor_lock:
+        thread = supervisor_state["thread"]
+        supervisor_state["thread"] = None
+
+    if thread is not None:
+        supervisor_stopping.set()
+        thread.join(timeout)
+
+def supervise_loop() -> None:
+    """
+    This function is the body of the background thread: it checks each component when its next probe is due, then waits for the interval.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    logger = logs_handler.init("supervisor") # Get the logger of the supervisor.
+
+    while not supervisor_stopping.is_set():
+        now = time.monotonic()
+
+        if now >= supervisor_components["database"]["retry_at"]:
+            check_database(logger)
+
+        if now >= supervisor_components["broker"]["retry_at"]:
+            check_broker(logger)
+
+        supervisor_stopping.wait(float(os.environ.get("API_SERVER_SUPERVISOR_INTERVAL", "1")))
+
+def check_database(logger) -> None:
+    """
+    This function probes the database with a connection of the pool (initializing the pool if the database was not reached at startup).
+    If the probe fails, the idle connections are closed, so once the database answers again the requests and the ingest get new ones.
+
+    Args:
+        - logger (logging.Logger): The logger object.
+
+    Returns:
+        - None
+    """
+
+    was_up = supervisor_components["database"]["up"]
+
+    try:
+        db_connection, db_cursor = db_connections.init() # Check out a connection from the pool (it is opened if needed).
+
+        try:
+            db_connections.execute(db_cursor, "select 1")
+
+        finally:
+            db_connections.close(db_connection, db_cursor) # Return the connection to the pool.
+
+        if not was_up or schema_catalog.version() == 0: # The state loaded from the database may be missing.
+            on_database_up = supervisor_state["on_database_up"]
+
+            if on_database_up is not None:
+                on_database_up()
+
+        record(logger, "database", None, float(os.environ.get("API_SERVER_PROBE_INTERVAL", "5")))
+
+    except Exception as error:
+        db_connections.discard_idle() # The idle connections are likely broken too, the next checkouts open new ones.
+
+        record(logger, "database", error, backoff("database", "API_DB_RECONNECT_MIN_DELAY", "API_DB_RECONNECT_MAX_DELAY"))
+
+def check_broker(logger) -> None:
+    """
+    This function checks the MQTT clients watched. They reconnect by themselves (with the backoff set in broker_connections),
+    but a client whose network loop has ended is reconnected here, and its loop started again (with the backoff of the supervisor).
+
+    Args:
+        - logger (logging.Logger): The logger object.
+
+    Returns:
+        - None
+    """
+
+    broker_clients = supervisor_state["broker_clients"]
+    error = None; restart_failed = False
+
+    if not broker_clients: # This process has no connection to the broker.
+        return
+
+    for broker_client in broker_clients:
+        if broker_client.is_connected():
+            continue
+
+        error = error or ConnectionError("An MQTT client is not connected to the broker.")
+
+        if broker_connections.loop_alive(broker_client): # The client is reconnecting by itself.
+            continue
+
+        try:
+            broker_connections.restart_loop(broker_client)
+            logger.warning("The network loop of an MQTT client had ended, it was reconnected and started again.")
+
+        except Exception as restart_error:
+            error = restart_error; restart_failed = True
+
+    if restart_failed: # Wait longer before each new reconnection.
+        record(logger, "broker", error, backoff("broker", "API_MQTT_RECONNECT_MIN_DELAY", "API_MQTT_RECONNECT_MAX_DELAY"))
+
+    else: # The state of the clients is in memory, so it is checked on every interval.
+        record(logger, "broker", error, float(os.environ.get("API_SERVER_SUPERVISOR_INTERVAL", "1")))
+
+def backoff(component: str, min_delay_variable: str, max_delay_variable: str) -> float:
+    """
+    This function returns the delay before the next attempt of a failed component: it doubles on each consecutive failure.
+
+    Args:
+        - component (str): The component ('database' or 'broker').
+        - min_delay_variable (str): The environment variable of the first delay.
+        - max_delay_variable (str): The environment variable of the maximum delay.
+
+    Returns:
+        - delay (float): The seconds before the next attempt.
+    """
+
+    min_delay = float(os.environ.get(min_delay_variable, "1")); max_delay = float(os.environ.get(max_delay_variable, "30"))
+
+    return min(min_delay * 2 ** min(supervisor_components[component]["failures"], 16), max_delay)
+
+def record(logger, component: str, error: Exception, delay: float) -> None:
+    """
+    This function records the result of a check and schedules the next one, logging the changes of state.
+
+    Args:
+        - logger (logging.Logger): The logger object.
+        - component (str): The component ('database' or 'broker').
+        - error (Exception): The error of the check, or None if it succeeded.
+        - delay (float): The seconds before the next check.
+
+    Returns:
+        - None
+    """
+
+    with supervisor_lock:
+        state = supervisor_components[component]
+        up = error is None
+
+        if up != state["up"] or state["since"] is None:
+            if up:
+                if state["since"] is not None:
+                    state["recoveries"] += 1
+
+                logger.info(f"The {component} is available again." if state["since"] is not None else f"The {component} is available.")
+
+            else:
+                logger.error(f"The {component} is not available, retrying in {delay:.1f} seconds. Error: {error}")
+
+            state["up"] = up; state["since"] = time.time()
+
+        state["failures"] = 0 if up else state["failures"] + 1
+        state["retry_at"] = time.monotonic() + delay
+        state["last_error"] = None if up else str(error)
+
+def ready() -> tuple:
+    """
+    This function checks if this process can answer the requests: the database is reachable, the schema is loaded
+    and the MQTT clients watched (if any) are connected. It only reads the state of the last probes.
+
+    Args:
+        - None
+
+    Returns:
+        - ready (bool): True if this process is ready.
+        - checks (dict): The result of each check.
+    """
+
+    checks = {
+        "database": supervisor_components["database"]["up"],
+        "schema": schema_catalog.version() > 0,
+        "broker": all(broker_client.is_connected() for broker_client in supervisor_state["broker_clients"]),
+    }
+
+    return all(checks.values()), checks
+
+def stats() -> dict:
+    """
+    This function returns the statistics of the supervisor.
+
+    Args:
+        - None
+
+    Returns:
+        - stats (dict): The uptime of this process and the state of each component.
+    """
+
+    now = time.time()
+
+    with supervisor_lock:
+        return {
+            "uptime_seconds": round(now - supervisor_state["started"], 1),
+            "running": supervisor_state["thread"] is not None,
+            "broker_clients": len(supervisor_state["broker_clients"]),
+            **{
+                component: {
+                    "up": state["up"], "for_seconds": round(now - state["since"], 1) if state["since"] is not None else None,
+                    "failures": state["failures"], "recoveries": state["recoveries"], "last_error": state["last_error"],
+                }
+                for component, state in supervisor_components.items()
+            },
+        }
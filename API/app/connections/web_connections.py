@@ -3,15 +3,23 @@ from flask import Flask, jsonify, request
 from flask_restful import Api, Resource
 from flasgger import Swagger
 import waitress
+import signal
+import socket
+import time
+import os
 
-def init(app: Flask, api: Api, swagger: Swagger) -> Flask:
+def init(app: Flask, api: Api, swagger: Swagger, before_fork: callable = None, after_fork: callable = None) -> Flask:
     """
     This function initializes the web connections for the API.
+    The server settings are read from the environment variables set by the credentials manager.
+    With more than one worker (on platforms with os.fork), the listening socket is opened once and shared by worker processes forked from this one.
 
     Args:
         - app (flask.Flask): The Flask app object.
         - api (flask_restful.Api): The API object.
         - swagger (flasgger.Swagger): The Swagger object.
+        - before_fork (function): The function called before the workers are forked (e.g. to close the connections of this process).
+        - after_fork (function): The function called in each worker after it is forked (e.g. to start its own connections).
 
     Returns:
         - app (flask.Flask): The Flask app object.
@@ -20,10 +28,164 @@ def init(app: Flask, api: Api, swagger: Swagger) -> Flask:
         - Exception: If there is an unexpected error.
     """
 
+    # Get the server settings from the environment variables.
+    host = str(os.environ.get("API_SERVER_HOST", "127.0.0.1")); port = int(os.environ.get("API_SERVER_PORT", "80"))
+    workers = int(os.environ.get("API_SERVER_WORKERS", "1"))
+
     try:
-        waitress.serve(app, host = "127.0.0.1", port = 80) # Start the server.
+        if workers <= 1 or not hasattr(os, "fork"): # Serve from this process.
+            waitress.serve(app, host = host, port = port, **server_settings()) # Start the server.
+
+        else: # Serve from several worker processes sharing the listening socket.
+            listen_socket = socket.create_server((host, port), backlog = int(os.environ.get("API_SERVER_BACKLOG", "1024")))
+
+            if before_fork is not None:
+                before_fork()
+
+            serve_workers(app, listen_socket, workers, after_fork)
 
         return app
 
     except Exception as error:
         raise error
+
+def server_settings() -> dict:
+    """
+    This function returns the settings of waitress for each worker.
+
+    Args:
+        - None
+
+    Returns:
+        - settings (dict): The keyword arguments of waitress.serve.
+
+    Raises:
+        - None
+    """
+
+    live_subscribers = live_max_subscribers() # Each subscriber of the live feed keeps a thread and a connection, so they are added to the settings.
+
+    return {
+        "threads": int(os.environ.get("API_SERVER_THREADS", "8")) + live_subscribers, # Threads serving requests in each worker.
+        "connection_limit": int(os.environ.get("API_SERVER_CONNECTION_LIMIT", "100")) + live_subscribers, # Open connections accepted by each worker.
+        "channel_timeout": int(os.environ.get("API_SERVER_CHANNEL_TIMEOUT", "120")), # Seconds before an inactive connection is closed.
+        "backlog": int(os.environ.get("API_SERVER_BACKLOG", "1024")), # Connections waiting to be accepted.
+    }
+
+def live_max_subscribers() -> int:
+    """
+    This function returns the maximum subscribers of the live feed in each worker. The server keeps a thread for each of them
+    (its stack reserves 8 MiB of virtual memory on Linux, of which a few tens of KiB are resident), on top of the threads serving the other requests.
+
+    Args:
+        - None
+
+    Returns:
+        - live_max_subscribers (int): The subscribers accepted at once by each worker.
+
+    Raises:
+        - None
+    """
+
+    return max(int(os.environ.get("API_LIVE_MAX_SUBSCRIBERS", "200")), 0)
+
+def serve_workers(app: Flask, listen_socket: socket.socket, workers: int, after_fork: callable) -> None:
+    """
+    This function forks the worker processes and supervises them, forking a new worker when one dies,
+    until this process receives SIGINT or SIGTERM, which is forwarded to the workers.
+
+    Args:
+        - app (flask.Flask): The Flask app object.
+        - listen_socket (socket.socket): The listening socket shared by the workers.
+        - workers (int): The number of worker processes.
+        - after_fork (function): The function called in each worker after it is forked.
+
+    Returns:
+        - None
+
+    Raises:
+        - Exception: If there is an unexpected error.
+    """
+
+    children = set() # The pids of the running workers.
+    stopping = []
+
+    def stop(signum, frame) -> None:
+        stopping.append(signum)
+
+        for pid in children: # Forward the signal to the workers.
+            try:
+                os.kill(pid, signal.SIGTERM)
+
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for _ in range(workers): # Fork the workers.
+        children.add(fork_worker(app, listen_socket, after_fork))
+
+    while children: # Supervise the workers (only them, the other children of this process, e.g. the ingest processes, have their own supervisor).
+        for pid in list(children):
+            try:
+                waited_pid, status = os.waitpid(pid, os.WNOHANG)
+
+            except ChildProcessError: # Already reaped.
+                waited_pid = pid
+
+            except InterruptedError:
+                continue
+
+            if waited_pid != pid: # Still running.
+                continue
+
+            children.discard(pid)
+
+            if not stopping: # If a worker died, fork a new one (after a pause, so a worker that cannot start does not spin).
+                time.sleep(1)
+                children.add(fork_worker(app, listen_socket, after_fork))
+
+        time.sleep(0.2)
+
+    listen_socket.close()
+
+def fork_worker(app: Flask, listen_socket: socket.socket, after_fork: callable) -> int:
+    """
+    This function forks a worker process, which serves the app on the shared listening socket until it receives SIGTERM.
+
+    Args:
+        - app (flask.Flask): The Flask app object.
+        - listen_socket (socket.socket): The listening socket shared by the workers.
+        - after_fork (function): The function called in the worker after it is forked.
+
+    Returns:
+        - pid (int): The pid of the worker (in the parent process).
+
+    Raises:
+        - OSError: If the process cannot be forked.
+    """
+
+    pid = os.fork()
+
+    if pid != 0: # In the parent process.
+        return pid
+
+    exit_code = 0
+
+    try: # In the worker process.
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, lambda signum, frame: os._exit(0))
+
+        if after_fork is not None:
+            after_fork()
+
+        waitress.serve(app, sockets = [listen_socket], **server_settings()) # Start the server on the shared socket.
+
+    except KeyboardInterrupt:
+        pass
+
+    except Exception:
+        exit_code = 1
+
+    os._exit(exit_code) # Never return to the code of the parent process.
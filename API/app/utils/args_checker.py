@@ -1,7 +1,13 @@
 from datetime import datetime
+from utils import response_encoder, schema_catalog
 import os
 import re
 
+OUTPUT_FORMATS = ("json", "ndjson", "csv", "columnar", "msgpack") # The output formats supported by the query API.
+BUCKETS = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600, "6h": 21600, "1d": 86400, "1w": 604800} # The bucket sizes of the aggregations, in seconds.
+AGGREGATES = ("min", "avg", "max", "count", "sum") # The aggregate functions supported by the aggregations.
+EXPORT_FORMATS = ("csv", "ndjson") # The output formats supported by the exports.
+
 def check(args: dict) -> None:
     """
     Checks that the arguments passed from the web clients are correct.
@@ -17,8 +23,7 @@ def check(args: dict) -> None:
     """
 
     try:
-        API_DB_TABLES = os.environ.get("API_DB_TABLES") # Get the tables from the environment variables.
-        db_tables = API_DB_TABLES.split() # Split the tables into a list.
+        db_tables = schema_catalog.tables() # Get the tables from the schema catalog.
 
         for key, value in args.items(): # Iterate over the arguments.
             if value is not None: # If the argument's value is not missing.
@@ -28,26 +33,283 @@ def check(args: dict) -> None:
                     if value not in db_tables:
                         raise ValueError(f"Invalid table_id. Table ID: {value}")
 
-                elif key == "start_date" or key == "end_date":
-                    value = check_date(value) # Check the date format.
+                elif key == "start_date" or key == "end_date" or key == "since":
+                    value = check_date(value, open_ended = key == "end_date") # Check the date format (an end date in the future is an open range).
 
                     args[key] = value # Update the argument with the checked and converted value.
 
+                elif key == "stream":
+                    args[key] = check_boolean(key, value) # Convert the flag to a boolean.
+
+                elif key == "format":
+                    if value not in OUTPUT_FORMATS:
+                        raise ValueError(f"Invalid format. Format: {value}. Valid formats: {OUTPUT_FORMATS}")
+
+                    if value == "msgpack" and response_encoder.msgpack is None: # Before the query, not once it is executed.
+                        raise ValueError("The format 'msgpack' is not available, the msgpack library is not installed.")
+
+                elif key == "limit":
+                    args[key] = check_limit(value) # Check and convert the page size.
+
+                elif key == "cursor":
+                    args[key] = check_cursor(value) # Decode the continuation token.
+
+                elif key == "bucket":
+                    if value not in BUCKETS:
+                        raise ValueError(f"Invalid bucket. Bucket: {value}. Valid buckets: {tuple(BUCKETS)}")
+
+                elif key == "aggregates":
+                    args[key] = check_aggregates(value) # Split and check the aggregate functions.
+
+                elif key == "by_chip":
+                    args[key] = check_boolean(key, value) # Convert the flag to a boolean.
+
             else: # If the argument is missing.
                 if key == "table_id": # If the argument is 'table_id' and it is missing.
                     raise ValueError("The argument 'table_id' is missing.")
 
+                elif key == "stream": # The responses are not streamed by default.
+                    args[key] = False
+
+                elif key == "format": # The responses are returned as JSON by default.
+                    args[key] = "json"
+
+                elif key == "aggregates": # The minimum, average and maximum are returned by default.
+                    args[key] = ["min", "avg", "max"]
+
+                elif key == "by_chip": # The aggregations are not grouped by chip by default.
+                    args[key] = False
+
+        if args["table_id"] not in schema_catalog.measures(): # The other tables (e.g. iot_chips) are read whole, they are not written by date.
+            for key in ("limit", "cursor", "bucket", "since"):
+                if args.get(key) is not None:
+                    raise ValueError(f"The argument '{key}' can only be used with the measurement tables. Table ID: {args['table_id']}")
+
+            if (args.get("start_date") is not None or args.get("end_date") is not None) and "DATE" not in [name for name, _ in schema_catalog.columns(args["table_id"])]:
+                raise ValueError(f"The table {args['table_id']} has no DATE column, the arguments 'start_date' and 'end_date' cannot be used.")
+
+        elif args.get("limit") is not None and "ID" not in [name for name, _ in schema_catalog.columns(args["table_id"])]: # The key of the pages.
+            raise ValueError(f"The argument 'limit' needs the ID column of the readings, added by the migration V1.0.2, which is not applied. Table ID: {args['table_id']}")
+
+        if args.get("cursor") is not None and args.get("limit") is None: # A continuation token is only valid with a page size.
+            raise ValueError("The argument 'cursor' requires the argument 'limit'.")
+
+        if args.get("bucket") is not None and args.get("limit") is not None: # The aggregations are already bounded by the bucket size.
+            raise ValueError("The argument 'limit' cannot be used with the argument 'bucket'.")
+
+        if args.get("since") is not None and (args.get("bucket") is not None or args.get("limit") is not None): # A delta returns every new raw reading.
+            raise ValueError("The argument 'since' cannot be used with the arguments 'bucket' or 'limit'.")
+
         return args
 
     except Exception as error:
         raise error
 
-def check_date(arg: str) -> str:
+def check_buffer_args(args: dict) -> dict:
+    """
+    Checks the arguments of the requests answered from the buffer of the latest readings.
+    Every argument is optional: 'table_id' (a measure), 'chip_id' and 'window' (seconds).
+
+    Args:
+        - args (dict): The arguments passed from the web clients.
+
+    Returns:
+        - args (dict): The arguments after checking and converting.
+
+    Raises:
+        - ValueError: If an argument is not valid.
+    """
+
+    for key, value in args.items(): # Iterate over the arguments.
+        if value is not None:
+            sanitizeSQL(value) # Sanitize the argument to prevent SQL injection.
+
+            if key == "table_id" and value not in schema_catalog.measures():
+                raise ValueError(f"Invalid table_id. Table ID: {value}")
+
+            elif key == "window":
+                try:
+                    args[key] = float(value)
+
+                except Exception as error:
+                    raise ValueError(f"Invalid window ({value}). The window must be a number of seconds.")
+
+                if args[key] <= 0:
+                    raise ValueError(f"Invalid window ({value}). The window must be positive.")
+
+        elif key == "window": # The last hour is returned by default.
+            args[key] = 3600.0
+
+    return args
+
+def check_chip_args(args: dict) -> dict:
+    """
+    Checks the arguments of the requests of several measures of some chips.
+    The arguments are 'chip_id' (required) and 'measures' (by default, every measure), separated by commas,
+    'start_date', 'end_date' and 'align' (one row per chip and instant, with a column per measure).
+
+    Args:
+        - args (dict): The arguments passed from the web clients.
+
+    Returns:
+        - args (dict): The arguments after checking and converting ('chip_id' and 'measures' as lists).
+
+    Raises:
+        - ValueError: If an argument is not valid.
+    """
+
+    db_measures = schema_catalog.measures() # Get the measures from the schema catalog.
+
+    for key, value in args.items(): # Iterate over the arguments.
+        if value is not None:
+            sanitizeSQL(value) # Sanitize the argument to prevent SQL injection.
+
+            if key == "chip_id":
+                args[key] = check_list(key, value)
+
+            elif key == "measures":
+                args[key] = check_list(key, value)
+
+                for measure in args[key]:
+                    if measure not in db_measures:
+                        raise ValueError(f"Invalid measure. Measure: {measure}. Valid measures: {tuple(db_measures)}")
+
+            elif key == "start_date" or key == "end_date":
+                args[key] = check_date(value, open_ended = key == "end_date") # Check the date format (an end date in the future is an open range).
+
+            elif key == "align":
+                args[key] = check_boolean(key, value) # Convert the flag to a boolean.
+
+        else:
+            if key == "chip_id":
+                raise ValueError("The argument 'chip_id' is missing.")
+
+            elif key == "measures": # Every measure is returned by default.
+                args[key] = sorted(db_measures)
+
+            elif key == "align": # The readings are not aligned by default.
+                args[key] = False
+
+    return args
+
+def check_live_args(args: dict) -> dict:
+    """
+    Checks the arguments of the subscriptions to the live feed of the readings.
+    Every argument is optional: 'measures' and 'chip_id' (by default, every measure and chip), separated by commas.
+
+    Args:
+        - args (dict): The arguments passed from the web clients.
+
+    Returns:
+        - args (dict): The arguments after checking and converting ('measures' and 'chip_id' as lists, or None).
+
+    Raises:
+        - ValueError: If an argument is not valid.
+    """
+
+    db_measures = schema_catalog.measures() # Get the measures from the schema catalog.
+
+    for key, value in args.items(): # Iterate over the arguments.
+        if value is not None:
+            sanitizeSQL(value) # Sanitize the argument to prevent SQL injection.
+
+            args[key] = check_list(key, value)
+
+            if key == "measures":
+                for measure in args[key]:
+                    if measure not in db_measures:
+                        raise ValueError(f"Invalid measure. Measure: {measure}. Valid measures: {tuple(db_measures)}")
+
+    return args
+
+def check_export_args(args: dict) -> dict:
+    """
+    Checks the arguments of the exports of the full history of some measures.
+    The arguments are 'tables' (by default, every measure), separated by commas, 'start_date', 'end_date',
+    'format' ('csv' by default or 'ndjson') and 'cursor' (the continuation token of an interrupted export).
+
+    Args:
+        - args (dict): The arguments passed from the web clients.
+
+    Returns:
+        - args (dict): The arguments after checking and converting ('tables' as a list and 'cursor' as a tuple).
+
+    Raises:
+        - ValueError: If an argument is not valid.
+    """
+
+    db_measures = schema_catalog.measures() # Get the measures from the schema catalog.
+
+    for key, value in args.items(): # Iterate over the arguments.
+        if value is not None:
+            sanitizeSQL(value) # Sanitize the argument to prevent SQL injection.
+
+            if key == "tables":
+                args[key] = check_list(key, value)
+
+                for measure in args[key]:
+                    if measure not in db_measures:
+                        raise ValueError(f"Invalid table. Table: {measure}. Valid tables: {tuple(db_measures)}")
+
+            elif key == "start_date" or key == "end_date":
+                args[key] = check_date(value, open_ended = key == "end_date") # Check the date format (an end date in the future is an open range).
+
+            elif key == "format":
+                if value not in EXPORT_FORMATS:
+                    raise ValueError(f"Invalid format. Format: {value}. Valid formats: {EXPORT_FORMATS}")
+
+            elif key == "cursor":
+                args[key] = check_export_cursor(value) # Decode the continuation token.
+
+        else:
+            if key == "tables": # Every measure is exported by default.
+                args[key] = sorted(db_measures)
+
+            elif key == "format": # The exports are CSV by default.
+                args[key] = "csv"
+
+    if args["cursor"] is not None and args["cursor"][0] not in args["tables"]:
+        raise ValueError(f"Invalid cursor. The table {args['cursor'][0]} is not exported.")
+
+    return args
+
+def check_list(key: str, arg: str) -> list:
+    """
+    Checks and splits a list of values separated by commas.
+
+    Args:
+        - key (str): The name of the argument.
+        - arg (str): The values, separated by commas.
+
+    Returns:
+        - values (list): The values, without duplicates.
+
+    Raises:
+        - ValueError: If the list is empty.
+    """
+
+    values = []
+
+    for value in arg.split(","): # Iterate over the values.
+        value = value.strip()
+
+        if value and value not in values:
+            values.append(value)
+
+    if not values:
+        raise ValueError(f"Invalid value for '{key}' ({arg}). At least one value is required.")
+
+    return values
+
+def check_date(arg: str, open_ended: bool = False) -> str:
     """
     Checks the date format.
+    A date in the future is replaced by the current date or, if the range is open ended, by None,
+    so the same open range always gets the same arguments (and the same cache key).
 
     Args:
         - arg (str): The date to check.
+        - open_ended (bool): True if the date is the end of a range.
 
     Returns:
         - arg (str): The date after checking.
@@ -59,13 +321,160 @@ def check_date(arg: str) -> str:
     try:
         date = datetime.strptime(arg, "%Y-%m-%d %H:%M:%S") # Check the date format.
 
-        if date >= datetime.now():
-            arg = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    except Exception as error:
+        raise ValueError(f"Incorrect date format ({arg}). The correct format is: 'YYYY-MM-DD HH:MM:SS'.")
+
+    if date >= datetime.now():
+        arg = None if open_ended else datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    return arg
+
+def check_limit(arg: str) -> int:
+    """
+    Checks the page size of a paginated request.
 
-        return arg
+    Args:
+        - arg (str): The page size.
+
+    Returns:
+        - limit (int): The page size as an integer.
+
+    Raises:
+        - ValueError: If the page size is not an integer between 1 and the maximum page size.
+    """
+
+    max_page_size = int(os.environ.get("API_MAX_PAGE_SIZE", "10000")) # Get the maximum page size from the environment variables.
+
+    try:
+        limit = int(arg)
 
     except Exception as error:
-        raise ValueError(f"Incorrect date format ({arg}). The correct format is: 'YYYY-MM-DD HH:MM:SS'.")
+        raise ValueError(f"Invalid limit ({arg}). The limit must be an integer.")
+
+    if limit < 1 or limit > max_page_size:
+        raise ValueError(f"Invalid limit ({arg}). The limit must be between 1 and {max_page_size}.")
+
+    return limit
+
+def check_cursor(arg: str) -> tuple:
+    """
+    Checks and decodes the continuation token of a paginated request.
+    The token is the hexadecimal encoding of the 'DATE|CHIP_ID|ID' of the last row of the previous page.
+
+    Args:
+        - arg (str): The continuation token.
+
+    Returns:
+        - cursor (tuple): The (DATE, CHIP_ID, ID) of the last row of the previous page.
+
+    Raises:
+        - ValueError: If the token is not valid.
+    """
+
+    try:
+        date, chip_id, reading_id = bytes.fromhex(arg).decode("utf-8").rsplit("|", 2) # Decode the token.
+        datetime.strptime(date, "%Y-%m-%d %H:%M:%S") # Check the date format.
+        reading_id = int(reading_id)
+
+    except Exception as error:
+        raise ValueError(f"Invalid cursor ({arg}).")
+
+    sanitizeSQL(chip_id) # Sanitize the decoded chip id to prevent SQL injection.
+
+    return date, chip_id, reading_id
+
+def encode_cursor(date: datetime, chip_id: str, reading_id: int) -> str:
+    """
+    Encodes the continuation token of a paginated request.
+
+    Args:
+        - date (datetime.datetime): The DATE of the last row of the page.
+        - chip_id (str): The CHIP_ID of the last row of the page.
+        - reading_id (int): The ID of the last row of the page.
+
+    Returns:
+        - cursor (str): The continuation token.
+    """
+
+    return f"{date.strftime('%Y-%m-%d %H:%M:%S')}|{chip_id}|{reading_id}".encode("utf-8").hex()
+
+def check_export_cursor(arg: str) -> tuple:
+    """
+    Checks and decodes the continuation token of an export.
+    The token is the hexadecimal encoding of the 'MEASURE|DATE|CHIP_ID|ID' of the last row received.
+
+    Args:
+        - arg (str): The continuation token.
+
+    Returns:
+        - cursor (tuple): The (MEASURE, DATE, CHIP_ID, ID) of the last row received.
+
+    Raises:
+        - ValueError: If the token is not valid.
+    """
+
+    try:
+        measure, date, chip_id, reading_id = bytes.fromhex(arg).decode("utf-8").split("|", 3) # Decode the token.
+        datetime.strptime(date, "%Y-%m-%d %H:%M:%S") # Check the date format.
+        reading_id = int(reading_id)
+
+    except Exception as error:
+        raise ValueError(f"Invalid cursor ({arg}).")
+
+    sanitizeSQL(measure); sanitizeSQL(chip_id) # Sanitize the decoded values to prevent SQL injection.
+
+    return measure, date, chip_id, reading_id
+
+def check_aggregates(arg: str) -> list:
+    """
+    Checks the aggregate functions of an aggregation.
+
+    Args:
+        - arg (str): The aggregate functions, separated by commas.
+
+    Returns:
+        - aggregates (list): The aggregate functions, without duplicates.
+
+    Raises:
+        - ValueError: If an aggregate function is not supported.
+    """
+
+    aggregates = []
+
+    for aggregate in arg.split(","): # Iterate over the aggregate functions.
+        aggregate = aggregate.strip().lower()
+
+        if aggregate not in AGGREGATES:
+            raise ValueError(f"Invalid aggregate. Aggregate: {aggregate}. Valid aggregates: {AGGREGATES}")
+
+        if aggregate not in aggregates:
+            aggregates.append(aggregate)
+
+    return aggregates
+
+def check_boolean(key: str, arg: str) -> bool:
+    """
+    Checks and converts a boolean flag.
+
+    Args:
+        - key (str): The name of the argument.
+        - arg (str): The value of the flag.
+
+    Returns:
+        - bool: The value of the flag as a boolean.
+
+    Raises:
+        - ValueError: If the value is not a valid boolean.
+    """
+
+    if arg.lower() in ("true", "1", "yes"):
+        return True
+
+    elif arg.lower() in ("false", "0", "no"):
+        return False
+
+    else:
+        raise ValueError(f"Invalid value for '{key}' ({arg}). The valid values are: 'true' or 'false'.")
 
 def sanitizeSQL(arg: str) -> None:
     """
@@ -25,6 +25,12 @@ def set_credentials() -> bool:
 
         set_credentials_db(database_credentials) # Set the database credentials in the environment variables.
         set_credentials_mqtt(mqtt_credentials) # Set the mqtt credentials in the environment variables.
+        set_settings_ingest(credentials.get("ingest", {})) # Set the optional ingest settings in the environment variables.
+        set_settings_rollups(credentials.get("rollups", {})) # Set the optional rollup settings in the environment variables.
+        set_settings_archive(credentials.get("archive", {})) # Set the optional archive settings in the environment variables.
+        set_settings_api(credentials.get("api", {})) # Set the optional query API settings in the environment variables.
+        set_settings_server(credentials.get("server", {})) # Set the optional web server settings in the environment variables.
+        set_settings_logs(credentials.get("logs", {})) # Set the optional logging settings in the environment variables.
 
     except Exception as error:
         raise error
@@ -51,6 +57,21 @@ def set_credentials_db(database_credentials: dict) -> bool:
         os.environ["API_DB_PASSWORD"] = database_credentials["password"]
         os.environ["API_DB_TABLE"] = database_credentials["table"]
 
+        # Set the optional settings of the connection pool in the environment variables.
+        os.environ["API_DB_POOL_SIZE"] = str(database_credentials.get("pool_size", "10"))
+        os.environ["API_DB_POOL_MIN_SIZE"] = str(database_credentials.get("pool_min_size", "2"))
+        os.environ["API_DB_POOL_TIMEOUT"] = str(database_credentials.get("pool_timeout", "10"))
+        os.environ["API_DB_POOL_MAX_USES"] = str(database_credentials.get("pool_max_uses", "1000"))
+        os.environ["API_DB_POOL_MAX_AGE"] = str(database_credentials.get("pool_max_age", "3600"))
+        os.environ["API_DB_POOL_PING_AFTER"] = str(database_credentials.get("pool_ping_after", "1"))
+        os.environ["API_DB_STREAM_CHUNK_SIZE"] = str(database_credentials.get("stream_chunk_size", "1000"))
+        os.environ["API_DB_MIGRATIONS"] = str(database_credentials.get("migrations", "check"))
+        os.environ["API_DB_PARTITIONS_AHEAD"] = str(database_credentials.get("partitions_ahead", "3"))
+        os.environ["API_DB_PARTITIONS_INTERVAL"] = str(database_credentials.get("partitions_interval", "86400")) # Seconds between two checks of the next partitions.
+        os.environ["API_DB_CONNECT_TIMEOUT"] = str(database_credentials.get("connect_timeout", "5"))
+        os.environ["API_DB_RECONNECT_MIN_DELAY"] = str(database_credentials.get("reconnect_min_delay", "1"))
+        os.environ["API_DB_RECONNECT_MAX_DELAY"] = str(database_credentials.get("reconnect_max_delay", "30"))
+
     except Exception as error: # If there is an error in setting the credentials.
         raise error
 
@@ -75,10 +96,208 @@ def set_credentials_mqtt(mqtt_credentials: dict) -> bool:
         os.environ["API_MQTT_USER"] = mqtt_credentials["username"]
         os.environ["API_MQTT_PASSWORD"] = mqtt_credentials["password"]
         os.environ["API_MQTT_TOPIC"] = mqtt_credentials["topic"]
+        os.environ["API_MQTT_NOTIFY_TOPIC"] = str(mqtt_credentials.get("notify_topic", "")) # By default '<topic>/committed' (see broker_connections.notify_topic).
+
+        # Set the optional settings of the ingest workers in the environment variables.
+        os.environ["API_MQTT_WORKERS"] = str(mqtt_credentials.get("workers", "1"))
+        os.environ["API_MQTT_QOS"] = str(mqtt_credentials.get("qos", "1"))
+        os.environ["API_MQTT_RECEIVE_MAXIMUM"] = str(mqtt_credentials.get("receive_maximum", "20")) # The in-flight window of the broker (mosquitto: max_inflight_messages).
+        os.environ["API_MQTT_CLIENT_ID"] = str(mqtt_credentials.get("client_id", "ORUS_API"))
+        os.environ["API_MQTT_SHARED_GROUP"] = str(mqtt_credentials.get("shared_group", "")) # Shared with the ingest of other hosts, so the write marks do not see every write (no conditional requests).
+        os.environ["API_MQTT_RECONNECT_MIN_DELAY"] = str(mqtt_credentials.get("reconnect_min_delay", "1"))
+        os.environ["API_MQTT_RECONNECT_MAX_DELAY"] = str(mqtt_credentials.get("reconnect_max_delay", "60"))
+        os.environ["API_MQTT_CONNECT_TIMEOUT"] = str(mqtt_credentials.get("connect_timeout", "10"))
 
     except Exception as error: # If there is an error in setting the credentials.
         raise error
 
+def set_settings_ingest(ingest_settings: dict) -> None:
+    """
+    This function sets the settings of the ingest pipeline in the OS environment variables.
+    Every setting is optional, the missing ones take their default value.
+
+    Args:
+        - ingest_settings (dict): The settings of the ingest pipeline.
+
+    Returns:
+        - None
+
+    Raises:
+        - Exception: If there is an unexpected error.
+    """
+
+    try:
+        # Set the settings in the environment variables.
+        os.environ["API_INGEST_QUEUE_SIZE"] = str(ingest_settings.get("queue_size", "10000"))
+        os.environ["API_INGEST_BATCH_SIZE"] = str(ingest_settings.get("batch_size", "200"))
+        os.environ["API_INGEST_FLUSH_INTERVAL"] = str(ingest_settings.get("flush_interval", "1"))
+        os.environ["API_INGEST_OVERFLOW_POLICY"] = str(ingest_settings.get("overflow_policy", "block"))
+        os.environ["API_INGEST_BLOCK_TIMEOUT"] = str(ingest_settings.get("block_timeout", "5"))
+        os.environ["API_INGEST_STATS_INTERVAL"] = str(ingest_settings.get("stats_interval", "5")) # Seconds between the statistics relayed by the ingest processes.
+        os.environ["API_INGEST_VALUE_RANGES"] = json.dumps(ingest_settings.get("value_ranges", {})) # The [minimum, maximum] of each measure, e.g. {"soil_moisture": [0, 100]}.
+
+        # Set the settings of the spool written while the database is unavailable.
+        os.environ["API_INGEST_SPOOL"] = str(ingest_settings.get("spool", "true")).lower()
+        os.environ["API_INGEST_SPOOL_SEGMENT_BYTES"] = str(ingest_settings.get("spool_segment_bytes", "16777216"))
+        os.environ["API_INGEST_SPOOL_MAX_BYTES"] = str(ingest_settings.get("spool_max_bytes", "1073741824"))
+        os.environ["API_INGEST_SPOOL_FSYNC"] = str(ingest_settings.get("spool_fsync", "interval")) # 'always', 'interval' or 'never'.
+        os.environ["API_INGEST_SPOOL_FSYNC_INTERVAL"] = str(ingest_settings.get("spool_fsync_interval", "1"))
+        os.environ["API_INGEST_SPOOL_MMAP"] = str(ingest_settings.get("spool_mmap", "false")).lower()
+        os.environ["API_INGEST_SPOOL_RETRY_INTERVAL"] = str(ingest_settings.get("spool_retry_interval", "5"))
+
+    except Exception as error: # If there is an error in setting the settings.
+        raise error
+
+def set_settings_rollups(rollup_settings: dict) -> None:
+    """
+    This function sets the settings of the hourly and daily rollups of the measurement tables in the OS environment variables.
+    Every setting is optional, the missing ones take their default value.
+
+    Args:
+        - rollup_settings (dict): The settings of the rollups.
+
+    Returns:
+        - None
+
+    Raises:
+        - Exception: If there is an unexpected error.
+    """
+
+    try:
+        # Set the settings in the environment variables.
+        os.environ["API_ROLLUPS"] = str(rollup_settings.get("enabled", "true")).lower() # Maintain the rollups and answer the aggregations with them.
+        os.environ["API_ROLLUPS_INTERVAL"] = str(rollup_settings.get("interval", "60")) # Seconds between two runs of the maintenance.
+        os.environ["API_ROLLUPS_LAG"] = str(rollup_settings.get("lag", "300")) # Seconds an hour is left open for the readings that arrive late.
+
+    except Exception as error: # If there is an error in setting the settings.
+        raise error
+
+def set_settings_archive(archive_settings: dict) -> None:
+    """
+    This function sets the settings of the archive of the old readings of the measurement tables in the OS environment variables.
+    Every setting is optional, the missing ones take their default value.
+
+    Args:
+        - archive_settings (dict): The settings of the archive.
+
+    Returns:
+        - None
+
+    Raises:
+        - Exception: If there is an unexpected error.
+    """
+
+    try:
+        # Set the settings in the environment variables.
+        os.environ["API_ARCHIVE"] = str(archive_settings.get("enabled", "false")).lower() # Move the old readings to the archive files.
+        os.environ["API_ARCHIVE_AFTER_MONTHS"] = str(archive_settings.get("after_months", "12")) # Age (in whole months) of the readings archived.
+        os.environ["API_ARCHIVE_INTERVAL"] = str(archive_settings.get("interval", "3600")) # Seconds between two runs of the archival.
+        os.environ["API_ARCHIVE_CHUNK_SIZE"] = str(archive_settings.get("chunk_size", "10000")) # Readings read or deleted per query.
+        os.environ["API_ARCHIVE_COMPRESSION"] = str(archive_settings.get("compression", "6")) # The gzip level of the segment files.
+
+    except Exception as error: # If there is an error in setting the settings.
+        raise error
+
+def set_settings_api(api_settings: dict) -> None:
+    """
+    This function sets the settings of the query API in the OS environment variables.
+    Every setting is optional, the missing ones take their default value.
+
+    Args:
+        - api_settings (dict): The settings of the query API.
+
+    Returns:
+        - None
+
+    Raises:
+        - Exception: If there is an unexpected error.
+    """
+
+    try:
+        # Set the settings in the environment variables.
+        os.environ["API_MAX_PAGE_SIZE"] = str(api_settings.get("max_page_size", "10000"))
+        os.environ["API_CACHE_SIZE"] = str(api_settings.get("cache_size", "256"))
+        os.environ["API_CACHE_TTL"] = str(api_settings.get("cache_ttl", "60"))
+        os.environ["API_CACHE_CLOSED_TTL"] = str(api_settings.get("cache_closed_ttl", "3600"))
+        os.environ["API_CACHE_MAX_ROWS"] = str(api_settings.get("cache_max_rows", "100000"))
+        os.environ["API_BUFFER_CAPACITY"] = str(api_settings.get("buffer_capacity", "720"))
+        os.environ["API_BUFFER_WARM_WINDOW"] = str(api_settings.get("buffer_warm_window", "3600"))
+        os.environ["API_COMPRESS_MIN_SIZE"] = str(api_settings.get("compress_min_size", "1024"))
+        os.environ["API_COMPRESS_LEVEL"] = str(api_settings.get("compress_level", "6"))
+        os.environ["API_EXPORT_CONCURRENCY"] = str(api_settings.get("export_concurrency", "2")) # Exports running at once in each web worker.
+        os.environ["API_LIVE_MAX_SUBSCRIBERS"] = str(api_settings.get("live_max_subscribers", "200")) # Live subscribers of each web worker (each one keeps an extra thread of the server).
+        os.environ["API_LIVE_MAX_PENDING"] = str(api_settings.get("live_max_pending", "1000")) # Readings pending for a subscriber before they are coalesced.
+        os.environ["API_LIVE_HEARTBEAT"] = str(api_settings.get("live_heartbeat", "15")) # Seconds between two keepalives of an idle subscription.
+        os.environ["API_CONDITIONAL_REQUESTS"] = str(api_settings.get("conditional_requests", "true")).lower() # Answer If-None-Match/If-Modified-Since from the write marks.
+        os.environ["API_DELTA_SETTLE"] = str(api_settings.get("delta_settle", "5")) # Seconds before the end of a delta, so the late readings of its last second are included.
+
+    except Exception as error: # If there is an error in setting the settings.
+        raise error
+
+def set_settings_logs(logs_settings: dict) -> None:
+    """
+    This function sets the settings of the logs in the OS environment variables.
+    Every setting is optional, the missing ones take their default value.
+
+    Args:
+        - logs_settings (dict): The settings of the logs.
+
+    Returns:
+        - None
+
+    Raises:
+        - Exception: If there is an unexpected error.
+    """
+
+    try:
+        # Set the settings in the environment variables.
+        os.environ["API_LOG_LEVEL"] = str(logs_settings.get("level", "INFO"))
+        os.environ["API_LOG_LEVELS"] = json.dumps(logs_settings.get("levels", {})) # The level of each logger, e.g. {"ingest": "WARNING"}.
+        os.environ["API_LOG_ROTATION"] = str(logs_settings.get("rotation", "size"))
+        os.environ["API_LOG_MAX_BYTES"] = str(logs_settings.get("max_bytes", "10485760"))
+        os.environ["API_LOG_WHEN"] = str(logs_settings.get("when", "midnight"))
+        os.environ["API_LOG_BACKUP_COUNT"] = str(logs_settings.get("backup_count", "10"))
+        os.environ["API_LOG_COMPRESS"] = str(logs_settings.get("compress", "true")).lower()
+        os.environ["API_LOG_RATE_LIMIT"] = str(logs_settings.get("rate_limit", "20"))
+        os.environ["API_LOG_RATE_INTERVAL"] = str(logs_settings.get("rate_interval", "60"))
+        os.environ["API_LOG_RATE_LIMIT_LEVEL"] = str(logs_settings.get("rate_limit_level", "INFO"))
+
+    except Exception as error: # If there is an error in setting the settings.
+        raise error
+
+def set_settings_server(server_settings: dict) -> None:
+    """
+    This function sets the settings of the web server in the OS environment variables.
+    Every setting is optional, the missing ones take their default value.
+
+    Args:
+        - server_settings (dict): The settings of the web server.
+
+    Returns:
+        - None
+
+    Raises:
+        - Exception: If there is an unexpected error.
+    """
+
+    try:
+        # Set the settings in the environment variables.
+        os.environ["API_SERVER_HOST"] = str(server_settings.get("host", "127.0.0.1"))
+        os.environ["API_SERVER_PORT"] = str(server_settings.get("port", "80"))
+        os.environ["API_SERVER_WORKERS"] = str(server_settings.get("workers", "1"))
+        os.environ["API_SERVER_THREADS"] = str(server_settings.get("threads", "8"))
+        os.environ["API_SERVER_CONNECTION_LIMIT"] = str(server_settings.get("connection_limit", "100"))
+        os.environ["API_SERVER_CHANNEL_TIMEOUT"] = str(server_settings.get("channel_timeout", "120"))
+        os.environ["API_SERVER_BACKLOG"] = str(server_settings.get("backlog", "1024"))
+        os.environ["API_SERVER_INGEST"] = str(server_settings.get("ingest", "inprocess"))
+        os.environ["API_SERVER_INGEST_PROCESSES"] = str(server_settings.get("ingest_processes", "1"))
+        os.environ["API_SERVER_STARTUP_TIMEOUT"] = str(server_settings.get("startup_timeout", "30"))
+        os.environ["API_SERVER_SUPERVISOR_INTERVAL"] = str(server_settings.get("supervisor_interval", "1"))
+        os.environ["API_SERVER_PROBE_INTERVAL"] = str(server_settings.get("probe_interval", "5"))
+
+    except Exception as error: # If there is an error in setting the settings.
+        raise error
+
 def open_credentials_file(data_dir: str) -> str:
     """
     This function opens the credentials file and returns the contents.
@@ -1,41 +1,137 @@
 import json
+import math
+import threading
+import time
+import os
 from datetime import datetime
 from utils import logs_handler as logs_handler
-import os
-
-def parse_data(data_json: str) -> dict:
+from utils import schema_catalog
+
+# The faster JSON decoder is optional, the standard one is used if it is not installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+INTEGER_TYPES = frozenset(("tinyint", "smallint", "mediumint", "int", "integer", "bigint")) # The column types stored as integers.
+
+# The validator compiled from the schema catalog, replaced as a whole when the catalog changes.
+validator_lock = threading.Lock() # Guards the compilation of the validator.
+validator = {
+    "version": None, # The version of the schema catalog the validator was compiled from.
+    "measures": frozenset(), # The keys of the measures accepted in a payload.
+    "converters": {}, # The function that checks and converts the value of each measure.
+}
+timestamp_cache = (None, None) # The (second, text) of the last timestamp, formatted once per second.
+
+def parse_data(data_json) -> dict:
     """
     This function parses the data received from the MQTT broker.
 
     Args:
-        - data_json (str): The data received from the MQTT broker.
+        - data_json (str or bytes): The data received from the MQTT broker.
 
     Returns:
         - data (dict): The data parsed as a dictionary.
+
+    Raises:
+        - KeyError: If the keys are not valid.
+        - ValueError: If the data is not valid JSON or the values are not valid.
     """
 
     try:
-        API_DB_TABLES = os.environ.get("API_DB_TABLES") # Get the tables from the environment variables.
-        db_tables = API_DB_TABLES.split() # Split the tables into a list.
+        data = decode(data_json) # Parse the data to a dictionary.
 
-        data_json = json.loads(data_json) # Parse the data to a dictionary.
+        check_data(compiled(), data) # Confirm the keys and convert the values for the database.
 
-        check_data(db_tables, data_json) # Confirm the keys for the database.
-
-        data_json["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S") # Add the timestamp to the data.
-        data = dict(data_json) # Create a copy of the data.
+        data["timestamp"] = timestamp() # Add the timestamp to the data.
 
         return data # Return the data.
 
     except Exception as error:
         raise error
 
-def check_data(db_tables, data_json) -> None:
+def parse_batch(data_jsons: list) -> tuple:
+    """
+    This function parses the data of several messages at once, with the same validator and timestamp.
+
+    Args:
+        - data_jsons (list): The data received from the MQTT broker (str or bytes) of each message.
+
+    Returns:
+        - batch (list): The data of the valid messages, parsed as dictionaries.
+        - errors (list): The (index, error) of each invalid message.
+    """
+
+    current = compiled()
+    received = timestamp()
+    batch = []; errors = []
+
+    for index, data_json in enumerate(data_jsons):
+        try:
+            data = decode(data_json)
+            check_data(current, data)
+
+        except Exception as error:
+            errors.append((index, error))
+
+            continue
+
+        data["timestamp"] = received
+        batch.append(data)
+
+    return batch, errors
+
+def timestamp() -> str:
+    """
+    This function returns the timestamp of the messages received now, formatted as the DATE column of the database.
+    The text is formatted once per second, the messages received in the same second share it.
+
+    Args:
+        - None
+
+    Returns:
+        - timestamp (str): The current time as 'YYYY-MM-DD HH:MM:SS'.
+    """
+
+    global timestamp_cache
+
+    second = int(time.time())
+    cached_second, text = timestamp_cache
+
+    if cached_second != second:
+        text = datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S")
+        timestamp_cache = (second, text) # A single assignment, the readers see the old or the new pair.
+
+    return text
+
+def decode(data_json) -> dict:
+    """
+    This function decodes the JSON of a message, with orjson if it is installed.
+
+    Args:
+        - data_json (str or bytes): The data received from the MQTT broker.
+
+    Returns:
+        - data (dict): The decoded object.
+
+    Raises:
+        - ValueError: If the data is not a valid JSON object.
+    """
+
+    data = orjson.loads(data_json) if orjson is not None else json.loads(data_json) # orjson.JSONDecodeError is a ValueError.
+
+    if not isinstance(data, dict):
+        raise ValueError(f"Invalid message format, a JSON object was expected. Message: {data}")
+
+    return data
+
+def check_data(current: dict, data_json: dict) -> None:
     """
-    This function confirms that the keys and values are valid for the DB tables format.
+    This function confirms that the keys and values are valid for the DB tables format, converting the values in place.
 
     Args:
-        - db_tables (list): The tables for the database.
+        - current (dict): The compiled validator, as returned by compiled.
         - data_json (dict): The data parsed as a dictionary.
 
     Returns:
@@ -46,22 +142,96 @@ def check_data(db_tables, data_json) -> None:
         - ValueError: If the values are not valid.
     """
 
-    try:
-        valid_keys = True; valid_values = True # Set the valid keys and valid values to True.
+    client_id = data_json.get("CLIENT_ID")
+
+    if not isinstance(client_id, str) or not client_id:
+        raise KeyError(f"Invalid keys format, the CLIENT_ID is missing. Message: {data_json}")
+
+    converters = current["converters"]
+
+    if not current["measures"].issuperset(data_json.keys() - {"CLIENT_ID"}): # Set operation instead of a lookup per key.
+        raise KeyError(f"Invalid keys format. Message: {data_json}")
+
+    for key, value in data_json.items():
+        if key != "CLIENT_ID":
+            data_json[key] = converters[key](value)
+
+def compiled() -> dict:
+    """
+    This function returns the validator of the current schema catalog, compiling it again if the catalog changed.
+
+    Args:
+        - None
+
+    Returns:
+        - validator (dict): The compiled validator. It must not be modified.
+    """
+
+    if validator["version"] != schema_catalog.version():
+        with validator_lock:
+            if validator["version"] != schema_catalog.version():
+                compile_validator()
+
+    return validator
+
+def compile_validator() -> None:
+    """
+    This function compiles the validator from the schema catalog: the set of the measures and a converter for each one,
+    built from the type of the VALUE column of its table and the range set in the 'value_ranges' setting.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    global validator
+
+    version = schema_catalog.version()
+    ranges = json.loads(os.environ.get("API_INGEST_VALUE_RANGES", "{}")) # The [minimum, maximum] of each measure.
+    converters = {}
+
+    for measure in schema_catalog.measures():
+        value_type = dict(schema_catalog.columns(measure)).get("VALUE", "float")
+        minimum, maximum = ranges.get(measure, (None, None))
+
+        converters[measure] = build_converter(measure, value_type in INTEGER_TYPES, minimum, maximum)
+
+    validator = {"version": version, "measures": frozenset(converters), "converters": converters}
+
+    logs_handler.init("ingest").debug(f"Payload validator compiled. Measures: {sorted(converters)}")
+
+def build_converter(measure: str, integer: bool, minimum: float = None, maximum: float = None) -> callable:
+    """
+    This function builds the converter of the values of a measure.
+
+    Args:
+        - measure (str): The measure.
+        - integer (bool): True if the values are stored as integers.
+        - minimum (float): The minimum value accepted, or None.
+        - maximum (float): The maximum value accepted, or None.
+
+    Returns:
+        - converter (function): The function that checks a value and returns it converted (an int, or a float rounded to 3 decimal places).
+    """
+
+    def convert(value):
+        if type(value) not in (int, float) or not math.isfinite(value): # The booleans are not accepted as numbers.
+            raise ValueError(f"Invalid values format. Measure: {measure}, Value: {value!r}")
+
+        if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+            raise ValueError(f"Value out of range. Measure: {measure}, Value: {value}, Range: [{minimum}, {maximum}]")
 
-        for key, value in data_json.items(): # Iterate over the data.
-            if valid_keys and valid_values: # If the keys and values are valid.
-                if key != "CLIENT_ID" and (key,) in db_tables: # Check if the key is not the CLIENT_ID and is in the tables.
-                    if isinstance(value, (int, float)) is True: # Check if the value is an integer or a float.
-                        data_json[key] = round(float(value), 3) # Convert the value to a float and round it to 3 decimal places.
+        if integer:
+            if value != int(value):
+                raise ValueError(f"Invalid values format, an integer was expected. Measure: {measure}, Value: {value}")
 
-                    else: # If the value is an integer or a float.
-                        valid_values = False # Set the valid_values to False and break the loop.
-                        raise ValueError(f"Invalid values format. Message: {data_json}") # Raise a ValueError.
+            return int(value)
 
-                elif key != "CLIENT_ID" and key not in db_tables: # If the key is not the CLIENT_ID and is not in the tables.
-                    valid_keys = False
-                    raise KeyError(f"Invalid keys format. Message: {data_json}") # Raise a KeyError.
+        return round(float(value), 3)
 
-    except Exception as error: # If there is an error in the data format.
-        raise error
\ No newline at end of file
+    return convert
@@ -0,0 +1,207 @@
+import itertools
+import threading
+import json
+import os
+
+# State of the live feed. The index is replaced as a whole when a subscriber is added or removed, so the batches are matched without locks.
+feed_lock = threading.Lock() # Guards the changes of the index and the counters below.
+feed_index = {} # The subscribers of each (measure, CHIP_ID) key, a None item matches any value: {key: {subscriber id: subscriber}}.
+feed_ids = itertools.count(1) # The ids of the subscribers.
+feed_stats_counters = {
+    "published": 0, # Number of readings of the committed batches matched by at least one subscriber.
+    "delivered": 0, # Number of readings sent to the subscribers.
+    "coalesced": 0, # Number of readings replaced by a later reading of the same series before a slow subscriber read them.
+    "dropped": 0, # Number of readings dropped because a slow subscriber had too many series pending.
+}
+
+def subscribe(measures: list = None, chip_ids: list = None) -> dict:
+    """
+    This function adds a subscriber to the readings of some measures and chips.
+
+    Args:
+        - measures (list): The measures, or None for every measure.
+        - chip_ids (list): The chips, or None for every chip.
+
+    Returns:
+        - subscriber (dict): The subscriber, to pass to wait and unsubscribe.
+    """
+
+    global feed_index
+
+    subscriber = {
+        "id": next(feed_ids),
+        "keys": [(measure, chip_id) for measure in (measures or [None]) for chip_id in (chip_ids or [None])], # The keys of the index.
+        "lock": threading.Lock(), # Guards the pending readings.
+        "ready": threading.Event(), # Set when there are pending readings.
+        "pending": [], # The ((measure, CHIP_ID), JSON) of the readings not sent yet.
+        "coalesced": 0, # Number of readings coalesced since the last read.
+    }
+
+    with feed_lock:
+        index = {key: dict(subscribers) for key, subscribers in feed_index.items()} # Copy, the current index may be in use.
+
+        for key in subscriber["keys"]:
+            index.setdefault(key, {})[subscriber["id"]] = subscriber
+
+        feed_index = index
+
+    return subscriber
+
+def unsubscribe(subscriber: dict) -> None:
+    """
+    This function removes a subscriber. Removing it twice has no effect.
+
+    Args:
+        - subscriber (dict): The subscriber returned by subscribe.
+
+    Returns:
+        - None
+    """
+
+    global feed_index
+
+    with feed_lock:
+        index = {key: dict(subscribers) for key, subscribers in feed_index.items()}
+
+        for key in subscriber["keys"]:
+            index.get(key, {}).pop(subscriber["id"], None)
+
+            if key in index and not index[key]:
+                del index[key]
+
+        feed_index = index
+
+def on_ingest(batch: list) -> None:
+    """
+    This function is called by the ingest pipeline after a batch is committed, and passes its readings to the matching subscribers.
+    Each reading is encoded once, whatever the number of subscribers that receive it.
+
+    Args:
+        - batch (list): The data of the messages written, as parsed by the data checker.
+
+    Returns:
+        - None
+    """
+
+    index = feed_index # The index of this batch, it is not modified.
+
+    if not index: # Nobody is subscribed.
+        return
+
+    deliveries = {} # The (subscriber, readings) of each subscriber id.
+    published = 0
+
+    for data in batch: # Iterate over the messages.
+        chip_id = data["CLIENT_ID"]
+
+        for key, value in data.items():
+            if key == "CLIENT_ID" or key == "timestamp":
+                continue
+
+            matches = [subscribers for subscribers in (index.get((key, chip_id)), index.get((key, None)), index.get((None, chip_id)), index.get((None, None))) if subscribers]
+
+            if not matches:
+                continue
+
+            reading = ((key, chip_id), json.dumps({"CHIP_ID": chip_id, "MEASURE": key, "VALUE": value, "DATE": data["timestamp"]}, separators = (",", ":")))
+            published += 1
+
+            for subscribers in matches:
+                for subscriber_id, subscriber in subscribers.items():
+                    delivery = deliveries.get(subscriber_id)
+
+                    if delivery is None:
+                        delivery = deliveries[subscriber_id] = (subscriber, [])
+
+                    delivery[1].append(reading)
+
+    for subscriber, readings in deliveries.values():
+        push(subscriber, readings)
+
+    with feed_lock:
+        feed_stats_counters["published"] += published
+
+def push(subscriber: dict, readings: list) -> None:
+    """
+    This function adds some readings to the pending ones of a subscriber.
+    If a slow subscriber has more pending readings than the 'live_max_pending' setting, only the last reading of each series is kept,
+    and if there are still too many series, the oldest ones are dropped.
+
+    Args:
+        - subscriber (dict): The subscriber.
+        - readings (list): The ((measure, CHIP_ID), JSON) of the readings.
+
+    Returns:
+        - None
+    """
+
+    max_pending = int(os.environ.get("API_LIVE_MAX_PENDING", "1000"))
+    coalesced = 0; dropped = 0
+
+    with subscriber["lock"]:
+        pending = subscriber["pending"]
+        pending.extend(readings)
+
+        if len(pending) > max_pending: # Coalesce the readings of each series, keeping the order of their last reading.
+            latest = {}
+
+            for key, reading in pending:
+                latest.pop(key, None)
+                latest[key] = reading
+
+            coalesced = len(pending) - len(latest)
+            dropped = max(len(latest) - max_pending, 0)
+
+            subscriber["pending"] = list(latest.items())[dropped:]
+            subscriber["coalesced"] += coalesced + dropped
+
+        subscriber["ready"].set()
+
+    if coalesced or dropped:
+        with feed_lock:
+            feed_stats_counters["coalesced"] += coalesced
+            feed_stats_counters["dropped"] += dropped
+
+def wait(subscriber: dict, timeout: float) -> tuple:
+    """
+    This function waits for the pending readings of a subscriber and takes them.
+
+    Args:
+        - subscriber (dict): The subscriber.
+        - timeout (float): The maximum seconds to wait.
+
+    Returns:
+        - readings (list): The JSON of the pending readings, oldest first (empty if the timeout expired).
+        - coalesced (int): The number of readings coalesced or dropped since the last call.
+    """
+
+    subscriber["ready"].wait(timeout)
+
+    with subscriber["lock"]:
+        readings = [reading for _, reading in subscriber["pending"]]
+        coalesced = subscriber["coalesced"]
+
+        subscriber["pending"] = []; subscriber["coalesced"] = 0
+        subscriber["ready"].clear()
+
+    if readings:
+        with feed_lock:
+            feed_stats_counters["delivered"] += len(readings)
+
+    return readings, coalesced
+
+def stats() -> dict:
+    """
+    This function returns the statistics of the live feed.
+
+    Args:
+        - None
+
+    Returns:
+        - stats (dict): The number of subscribers and the counters of the readings.
+    """
+
+    subscribers = {subscriber_id for subscribers in feed_index.values() for subscriber_id in subscribers}
+
+    with feed_lock:
+        return {"subscribers": len(subscribers), **feed_stats_counters}
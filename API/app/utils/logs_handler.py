@@ -1,12 +1,32 @@
-import os
+import logging.handlers
+import threading
 import logging
+import atexit
+import queue
+import json
+import gzip
+import time
+import os
+import shutil
 
-def init() -> logging.Logger:
+# State of the logging subsystem.
+logs_lock = threading.Lock() # Guards the setup and the state below.
+logs_state = {
+    "queue_handler": None, # The handler of the root logger, it only puts the records in the queue.
+    "listener": None, # The background thread that writes the records of the queue to the log file.
+    "pid": None, # The process that started the listener (a forked process must start its own).
+}
+rate_lock = threading.Lock() # Guards the counters of the rate limiter.
+rate_counters = {} # The (window start, records emitted, records suppressed) of each call site.
+
+def init(name: str = None) -> logging.Logger:
     """
     This function initializes the logger.
+    The logging subsystem is set up on the first call only, the next calls just return the logger.
+    The records are put in a queue and written to the log file by a background thread, so logging does not block the caller.
 
     Args:
-        None
+        - name (str): The name of the logger, to set its level separately (e.g. 'ingest' or 'query'). None for the root logger.
 
     Returns:
         - logger (logging.Logger): The logger object.
@@ -15,22 +35,224 @@ def init() -> logging.Logger:
         - None
     """
 
-    data_dir = os.environ.get("data_dir") # Get the data directory from the environment variables.
-    logs_dir = f"{data_dir}/logs" # The path to the logs directory.
-    log_file_path = f"{data_dir}/logs/api.log"
+    if logs_state["pid"] != os.getpid(): # If the subsystem is not set up in this process.
+        with logs_lock:
+            if logs_state["pid"] != os.getpid():
+                setup()
+
+    return logging.getLogger(name)
+
+def configure() -> None:
+    """
+    This function applies the logging settings set in the environment variables by the credentials manager:
+    the level of each logger, the rotation of the log file and the rate limit of the repetitive records.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - Exception: If there is an unexpected error.
+    """
+
+    try:
+        with logs_lock:
+            setup()
+
+        logging.getLogger().setLevel(os.environ.get("API_LOG_LEVEL", "INFO").upper())
+
+        for name, level in json.loads(os.environ.get("API_LOG_LEVELS", "{}")).items(): # Set the level of each logger.
+            logging.getLogger(name).setLevel(str(level).upper())
+
+    except Exception as error:
+        raise error
+
+def setup() -> None:
+    """
+    This function (re)starts the queue handler and the writer thread. It must be called holding the logs lock.
+    In a forked process, the file is not rotated (the process that forked it does it), it is only reopened when it is rotated.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    forked = logs_state["pid"] is not None and logs_state["pid"] != os.getpid() # If the subsystem was set up by the process that forked this one.
+
+    if logs_state["listener"] is not None and not forked: # Stop the previous writer thread, writing the records left.
+        logs_state["listener"].stop()
+
+    log_file_path = f"{os.environ.get('data_dir')}/logs/api.log"
+    os.makedirs(os.path.dirname(log_file_path), exist_ok = True) # Create the logs directory if it does not exist.
+
+    file_handler = logging.handlers.WatchedFileHandler(log_file_path, encoding = "utf-8") if forked else build_file_handler(log_file_path)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(levelno)s %(message)s', datefmt = "%m/%d/%Y %H:%M:%S"))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(rate_limit) # Drop the repetitive records before they are queued.
+
+    root_logger = logging.getLogger()
+
+    if logs_state["queue_handler"] is not None:
+        root_logger.removeHandler(logs_state["queue_handler"])
+
+    else:
+        root_logger.setLevel(logging.INFO)
+
+    root_logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+
+    if logs_state["pid"] is None:
+        atexit.register(shutdown) # Write the records left in the queue when the process exits.
+
+    logs_state.update(queue_handler = queue_handler, listener = listener, pid = os.getpid())
+
+def build_file_handler(log_file_path: str) -> logging.Handler:
+    """
+    This function builds the handler of the log file, rotated by size or by time depending on the settings.
+    The rotated files are compressed with gzip if the 'compress' setting is enabled.
+
+    Args:
+        - log_file_path (str): The path to the log file.
+
+    Returns:
+        - file_handler (logging.Handler): The handler.
+
+    Raises:
+        - None
+    """
+
+    backup_count = int(os.environ.get("API_LOG_BACKUP_COUNT", "10")) # Number of rotated files kept.
+
+    if os.environ.get("API_LOG_ROTATION", "size") == "time":
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            log_file_path, when = os.environ.get("API_LOG_WHEN", "midnight"), backupCount = backup_count, encoding = "utf-8"
+        )
+
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file_path, maxBytes = int(os.environ.get("API_LOG_MAX_BYTES", "10485760")), backupCount = backup_count, encoding = "utf-8"
+        )
+
+    if os.environ.get("API_LOG_COMPRESS", "true").lower() in ("true", "1", "yes"):
+        file_handler.namer = lambda name: name + ".gz"
+        file_handler.rotator = compress_rotated
+
+    return file_handler
+
+def compress_rotated(source: str, destination: str) -> None:
+    """
+    This function is the rotator of the log file: it compresses the rotated file with gzip.
+
+    Args:
+        - source (str): The path to the log file.
+        - destination (str): The path to the rotated file.
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    with open(source, "rb") as source_file, gzip.open(destination, "wb") as destination_file:
+        shutil.copyfileobj(source_file, destination_file)
+
+    os.remove(source)
+
+def rate_limit(record: logging.LogRecord) -> bool:
+    """
+    This function is the filter of the repetitive records: each call site (file and line) can emit up to 'rate_limit' records
+    of level 'rate_limit_level' or lower every 'rate_interval' seconds, the others are dropped and counted.
+    The next record emitted by the call site reports how many were suppressed.
+
+    Args:
+        - record (logging.LogRecord): The record.
+
+    Returns:
+        - bool: True if the record must be emitted.
+    """
+
+    if record.levelno > logging.getLevelName(os.environ.get("API_LOG_RATE_LIMIT_LEVEL", "INFO").upper()):
+        return True
+
+    limit = int(os.environ.get("API_LOG_RATE_LIMIT", "20")); interval = float(os.environ.get("API_LOG_RATE_INTERVAL", "60"))
+
+    if limit <= 0: # The rate limit is disabled.
+        return True
+
+    key = (record.pathname, record.lineno)
+    now = time.monotonic()
+
+    with rate_lock:
+        window_start, emitted, suppressed = rate_counters.get(key, (now, 0, 0))
+
+        if now - window_start >= interval: # Start a new window.
+            window_start = now; emitted = 0
+
+        if emitted >= limit:
+            rate_counters[key] = (window_start, emitted, suppressed + 1)
+
+            return False
 
-    if not os.path.exists(logs_dir): # Create the logs directory if it does not exist.
-        os.makedirs(logs_dir)
+        rate_counters[key] = (window_start, emitted + 1, 0)
 
-    logger = logging.getLogger() # Get the logger object.
+    if suppressed:
+        record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"; record.args = None
+
+    return True
+
+def after_fork() -> None:
+    """
+    This function is called in a forked process. The writer thread is not forked, so the records put in the queue of the
+    inherited handler would never be written (e.g. by a logger used without init): the subsystem is set up again at once.
+    The locks are created again, another thread of the process that forked this one may have held them.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
+
+    global logs_lock, rate_lock
+
+    logs_lock = threading.Lock(); rate_lock = threading.Lock()
+
+    if logs_state["pid"] is not None: # If the subsystem was set up before the fork.
+        setup()
+
+def shutdown() -> None:
+    """
+    This function stops the writer thread after it writes the records left in the queue.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+
+    Raises:
+        - None
+    """
 
-    logging.basicConfig( # Configure the logger.
-        filename = log_file_path,
-        filemode = "a+",
-        format = '%(asctime)s %(levelname)s %(levelno)s %(message)s',
-        datefmt = "%m/%d/%Y %H:%M:%S",
-        level = logging.INFO,
-        encoding = "utf-8"
-    )
+    with logs_lock:
+        if logs_state["listener"] is not None and logs_state["pid"] == os.getpid():
+            logs_state["listener"].stop()
+            logs_state["listener"] = None
 
-    return logger
\ No newline at end of file
+if hasattr(os, "register_at_fork"): # Where the platform forks.
+    os.register_at_fork(after_in_child = after_fork)
@@ -0,0 +1,183 @@
+from contextlib import contextmanager
+import threading
+import bisect
+import time
+
+# The upper bounds of the buckets of the latency histograms, in seconds.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# The metrics exposed by the API: (type, description) indexed by name.
+METRICS = {
+    "orus_request_seconds": ("histogram", "Time to answer a request of the API, by endpoint."),
+    "orus_db_checkout_seconds": ("histogram", "Time to check out a connection from the DataBase pool (including opening it)."),
+    "orus_db_query_seconds": ("histogram", "Time to execute a query and fetch its rows."),
+    "orus_format_seconds": ("histogram", "Time to format the rows of a result (format_data or the columnar encoders)."),
+    "orus_serialize_seconds": ("histogram", "Time to serialize a formatted result (jsonify)."),
+    "orus_ingest_parse_seconds": ("histogram", "Time to parse and check a message received from the MQTT broker."),
+    "orus_ingest_write_seconds": ("histogram", "Time to write a batch of messages to the DataBase."),
+    "orus_ingest_lag_seconds": ("histogram", "Time from the reception of a message to the commit of its batch."),
+    "orus_requests_total": ("counter", "Requests answered, by endpoint and status code."),
+    "orus_rows_returned_total": ("counter", "Rows returned by the query API."),
+    "orus_response_bytes_total": ("counter", "Bytes of the bodies of the responses (not counted for the streamed ones)."),
+    "orus_messages_received_total": ("counter", "Messages received from the MQTT broker."),
+    "orus_messages_rejected_total": ("counter", "Messages rejected by the data checker."),
+    "orus_db_errors_total": ("counter", "Errors of the queries and writes on the DataBase."),
+    "orus_exports_total": ("counter", "Exports started."),
+    "orus_exports_rejected_total": ("counter", "Exports rejected because the limit of exports running at once was reached."),
+    "orus_not_modified_total": ("counter", "Requests answered with 304 Not Modified from the write marks."),
+}
+
+# State of the metrics.
+metrics_lock = threading.Lock() # Guards the values below.
+metrics_histograms = {} # The [bucket counts, sum, count] of each (name, labels).
+metrics_counters = {} # The value of each (name, labels).
+metrics_gauges = {} # The (type, description, function) of the values read when the metrics are rendered.
+
+def observe(name: str, value: float, labels: tuple = ()) -> None:
+    """
+    This function records a value in a histogram.
+
+    Args:
+        - name (str): The name of the histogram (of METRICS).
+        - value (float): The value, in seconds for the latency histograms.
+        - labels (tuple): The (label, value) pairs of the series.
+
+    Returns:
+        - None
+    """
+
+    index = bisect.bisect_left(LATENCY_BUCKETS, value) # The first bucket whose bound is greater or equal to the value.
+
+    with metrics_lock:
+        histogram = metrics_histograms.get((name, labels))
+
+        if histogram is None:
+            histogram = metrics_histograms[(name, labels)] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+
+        histogram[0][index] += 1; histogram[1] += value; histogram[2] += 1
+
+def increment(name: str, amount: float = 1, labels: tuple = ()) -> None:
+    """
+    This function increments a counter.
+
+    Args:
+        - name (str): The name of the counter (of METRICS).
+        - amount (float): The amount to add.
+        - labels (tuple): The (label, value) pairs of the series.
+
+    Returns:
+        - None
+    """
+
+    with metrics_lock:
+        metrics_counters[(name, labels)] = metrics_counters.get((name, labels), 0) + amount
+
+@contextmanager
+def timer(name: str, labels: tuple = ()):
+    """
+    This function measures the time spent in a block and records it in a histogram.
+
+    Args:
+        - name (str): The name of the histogram (of METRICS).
+        - labels (tuple): The (label, value) pairs of the series.
+
+    Returns:
+        - None
+    """
+
+    start = time.perf_counter()
+
+    try:
+        yield
+
+    finally:
+        observe(name, time.perf_counter() - start, labels)
+
+def register_gauge(name: str, description: str, function: callable, metric_type: str = "gauge") -> None:
+    """
+    This function registers a value that is read only when the metrics are rendered, so it costs nothing when the metrics are not scraped.
+    It is also used to expose the counters already kept by other modules (e.g. the statistics of the ingest pipeline).
+
+    Args:
+        - name (str): The name of the metric.
+        - description (str): The description of the metric.
+        - function (function): The function returning the current value of the metric.
+        - metric_type (str): 'gauge' or 'counter'.
+
+    Returns:
+        - None
+    """
+
+    metrics_gauges[name] = (metric_type, description, function)
+
+def render() -> str:
+    """
+    This function renders the metrics in the Prometheus text format (version 0.0.4).
+
+    Args:
+        - None
+
+    Returns:
+        - text (str): The metrics.
+    """
+
+    with metrics_lock: # Copy the values, so the lock is not held while rendering.
+        histograms = {key: (list(histogram[0]), histogram[1], histogram[2]) for key, histogram in metrics_histograms.items()}
+        counters = dict(metrics_counters)
+
+    lines = []
+
+    for name, (metric_type, description) in METRICS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+        if metric_type == "counter":
+            for (series_name, labels), value in sorted(counters.items()):
+                if series_name == name:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+
+            continue
+
+        for (series_name, labels), (buckets, total, count) in sorted(histograms.items()):
+            if series_name != name:
+                continue
+
+            cumulative = 0
+
+            for bound, bucket_count in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {cumulative}")
+
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+
+    for name, (metric_type, description, function) in list(metrics_gauges.items()):
+        try:
+            value = function()
+
+        except Exception: # A value that cannot be read is left out.
+            continue
+
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
+
+def format_labels(labels: tuple) -> str:
+    """
+    This function formats the labels of a series.
+
+    Args:
+        - labels (tuple): The (label, value) pairs of the series.
+
+    Returns:
+        - text (str): The labels as {label="value",...}, or an empty string.
+    """
+
+    if not labels:
+        return ""
+
+    escaped = [(label, str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")) for label, value in labels]
+
+    return "{" + ",".join(f"{label}=\"{value}\"" for label, value in escaped) + "}"
@@ -0,0 +1,225 @@
+from collections import OrderedDict
+from datetime import datetime
+import threading
+import time
+import os
+
+# State of the query result cache.
+cache_entries = OrderedDict() # The cached results, from the least to the most recently used.
+cache_lock = threading.Lock() # Guards the entries and the counters of the cache.
+cache_stats_counters = {
+    "hits": 0, # Number of requests answered from the cache.
+    "misses": 0, # Number of requests that had to query the database.
+    "tail_refreshes": 0, # Number of hits whose open tail was queried again and appended.
+    "evictions": 0, # Number of entries removed because the cache was full or they expired.
+    "invalidations": 0, # Number of entries marked as stale or removed by the ingest path.
+}
+
+def build_key(args: dict) -> tuple:
+    """
+    This function builds the cache key of a request from its checked arguments.
+    The arguments must be already normalized by the args checker (an end date in the future is an open range, None).
+
+    Args:
+        - args (dict): The arguments of the request after checking.
+
+    Returns:
+        - key (tuple): The cache key.
+    """
+
+    return tuple((key, tuple(value) if isinstance(value, list) else value) for key, value in sorted(args.items()))
+
+def get(key: tuple) -> dict:
+    """
+    This function gets a cached result.
+
+    Args:
+        - key (tuple): The cache key.
+
+    Returns:
+        - entry (dict): A copy of the cached entry ('columns', 'rows', 'table', 'open', 'stale' and 'last_date'), or None if it is not cached.
+          If the entry is stale, its open tail must be queried again and appended with extend.
+    """
+
+    with cache_lock:
+        entry = cache_entries.get(key)
+
+        if entry is not None and entry["expires"] <= time.monotonic(): # If the entry expired.
+            del cache_entries[key]
+            cache_stats_counters["evictions"] += 1
+
+            entry = None
+
+        if entry is None:
+            cache_stats_counters["misses"] += 1
+
+            return None
+
+        cache_entries.move_to_end(key) # Mark the entry as the most recently used.
+        cache_stats_counters["hits"] += 1
+
+        if entry["stale"]:
+            cache_stats_counters["tail_refreshes"] += 1
+
+        return dict(entry) # The copy keeps the generation seen by the caller.
+
+def put(key: tuple, table: str, columns: list, rows: list, open_ended: bool, extendable: bool) -> None:
+    """
+    This function caches a result, evicting the least recently used entries if the cache is full.
+    The results larger than the 'max_rows' setting are not cached.
+
+    Args:
+        - key (tuple): The cache key.
+        - table (str): The table queried.
+        - columns (list): The column metadata of the result (cursor description).
+        - rows (list): The rows of the result.
+        - open_ended (bool): True if the range has no end date, so new readings belong to it.
+        - extendable (bool): True if the new readings can be appended to the result (raw rows, not aggregated or paginated).
+
+    Returns:
+        - None
+    """
+
+    if len(rows) > int(os.environ.get("API_CACHE_MAX_ROWS", "100000")): # Do not keep huge results in memory.
+        return
+
+    ttl = float(os.environ.get("API_CACHE_TTL" if open_ended else "API_CACHE_CLOSED_TTL", "60" if open_ended else "3600"))
+    last_date = None
+
+    if extendable and rows: # Keep the last date of the result, the tail is queried again from it.
+        date_index = [column[0] for column in columns].index("DATE")
+        last_date = max(row[date_index] for row in rows)
+
+    entry = {
+        "table": table, "columns": columns, "rows": rows, "open": open_ended, "extendable": extendable and open_ended,
+        "stale": False, "last_date": last_date, "expires": time.monotonic() + ttl,
+        "generation": 0, # Incremented every time the entry is invalidated.
+    }
+
+    with cache_lock:
+        cache_entries[key] = entry
+        cache_entries.move_to_end(key)
+
+        while len(cache_entries) > int(os.environ.get("API_CACHE_SIZE", "256")): # Evict the least recently used entries.
+            cache_entries.popitem(last = False)
+            cache_stats_counters["evictions"] += 1
+
+def extend(key: tuple, entry: dict, tail_rows: list) -> list:
+    """
+    This function appends the rows of the open tail to a stale entry.
+    The tail must be queried from the last date of the entry (included), so the cached rows of that date are replaced.
+
+    Args:
+        - key (tuple): The cache key.
+        - entry (dict): The stale entry.
+        - tail_rows (list): The rows with a DATE greater or equal to the last date of the entry.
+
+    Returns:
+        - rows (list): The rows of the entry after appending the tail.
+    """
+
+    date_index = [column[0] for column in entry["columns"]].index("DATE")
+    last_date = entry["last_date"]
+
+    if last_date is None: # If the entry was empty, the tail is the whole result.
+        rows = list(tail_rows)
+
+    else: # Replace the rows of the last date, which may have changed, and append the new ones.
+        rows = [row for row in entry["rows"] if row[date_index] != last_date] + list(tail_rows)
+
+    with cache_lock:
+        current = cache_entries.get(key)
+        invalidated = current is not None and current["generation"] != entry["generation"] # If new readings arrived while querying the tail.
+
+    put(key, entry["table"], entry["columns"], rows, entry["open"], True)
+
+    if invalidated: # Keep the entry stale, so the next request queries the tail again.
+        with cache_lock:
+            if key in cache_entries:
+                cache_entries[key]["stale"] = True
+
+    return rows
+
+def invalidate(table: str, since: datetime) -> None:
+    """
+    This function invalidates the cached results of a table that may include readings written from a date.
+    The open ranges that can be extended are marked as stale (only their tail is queried again), the other affected ones are removed.
+
+    Args:
+        - table (str): The table written.
+        - since (datetime.datetime): The oldest DATE of the readings written.
+
+    Returns:
+        - None
+    """
+
+    with cache_lock:
+        for key, entry in list(cache_entries.items()):
+            if entry["table"] != table:
+                continue
+
+            end_date = dict(key).get("end_date")
+
+            if end_date is not None and datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S") < since: # The closed range does not include the new readings.
+                continue
+
+            if entry["extendable"] and (entry["last_date"] is None or entry["last_date"] <= since): # Only the open tail changed.
+                entry["stale"] = True
+                entry["generation"] += 1
+
+            else:
+                del cache_entries[key]
+
+            cache_stats_counters["invalidations"] += 1
+
+def on_ingest(batch: list) -> None:
+    """
+    This function is called by the ingest pipeline after a batch is committed, and invalidates the cached results of the tables written.
+
+    Args:
+        - batch (list): The data of the messages written, as parsed by the data checker.
+
+    Returns:
+        - None
+    """
+
+    oldest = {} # The oldest DATE written to each table.
+
+    for data in batch: # Iterate over the messages.
+        for key in data:
+            if key != "CLIENT_ID" and key != "timestamp" and (key not in oldest or data["timestamp"] < oldest[key]):
+                oldest[key] = data["timestamp"]
+
+    for table, timestamp in oldest.items():
+        invalidate(table, datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S"))
+
+def clear() -> None:
+    """
+    This function removes every cached result.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+    """
+
+    with cache_lock:
+        cache_entries.clear()
+
+def stats() -> dict:
+    """
+    This function returns the statistics of the cache.
+
+    Args:
+        - None
+
+    Returns:
+        - stats (dict): The hit, miss, tail refresh, eviction and invalidation counts, and the number of entries.
+    """
+
+    with cache_lock:
+        stats = dict(cache_stats_counters)
+        stats["entries"] = len(cache_entries)
+
+    return stats
@@ -0,0 +1,195 @@
+from array import array
+from datetime import datetime, timedelta
+import threading
+import time
+import os
+
+# State of the buffer of the latest readings.
+buffer_lock = threading.Lock() # Guards the series below.
+buffer_series = {} # The ring buffer of each (measure, CHIP_ID), see new_series.
+buffer_stats_counters = {
+    "appended": 0, # Number of readings appended to the buffer.
+    "warm_loaded": 0, # Number of readings loaded from the database at startup.
+}
+
+def new_series(capacity: int) -> dict:
+    """
+    This function creates the ring buffer of a series. The memory of a series is fixed: two arrays of doubles of the buffer capacity.
+
+    Args:
+        - capacity (int): The number of readings kept by the series.
+
+    Returns:
+        - series (dict): The timestamps (seconds since the epoch) and values of the readings, the index of the next slot and the number of readings.
+    """
+
+    return {"dates": array("d", bytes(8 * capacity)), "values": array("d", bytes(8 * capacity)), "next": 0, "count": 0}
+
+def append(measure: str, chip_id: str, timestamp: float, value: float) -> None:
+    """
+    This function appends a reading to the buffer of its series, overwriting the oldest one if the buffer is full.
+
+    Args:
+        - measure (str): The measure (and table) of the reading.
+        - chip_id (str): The chip of the reading.
+        - timestamp (float): The date of the reading, in seconds since the epoch.
+        - value (float): The value of the reading.
+
+    Returns:
+        - None
+    """
+
+    with buffer_lock:
+        series = buffer_series.get((measure, chip_id))
+
+        if series is None:
+            series = buffer_series[(measure, chip_id)] = new_series(int(os.environ.get("API_BUFFER_CAPACITY", "720")))
+
+        capacity = len(series["values"])
+        index = series["next"]
+
+        series["dates"][index] = timestamp; series["values"][index] = value
+        series["next"] = (index + 1) % capacity
+        series["count"] = min(series["count"] + 1, capacity)
+
+        buffer_stats_counters["appended"] += 1
+
+def on_ingest(batch: list) -> None:
+    """
+    This function is called by the ingest pipeline after a batch is committed, and appends its readings to the buffer.
+
+    Args:
+        - batch (list): The data of the messages written, as parsed by the data checker.
+
+    Returns:
+        - None
+    """
+
+    for data in batch: # Iterate over the messages.
+        timestamp = datetime.strptime(data["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+
+        for key, value in data.items():
+            if key != "CLIENT_ID" and key != "timestamp":
+                append(key, data["CLIENT_ID"], timestamp, value)
+
+def warm(db_cursor, measures: list) -> None:
+    """
+    This function loads the buffer from the database: the last reading of every chip and the readings of the warm window.
+
+    Args:
+        - db_cursor (mysql.connector.cursor): The cursor object.
+        - measures (list): The measures (and tables) to load.
+
+    Returns:
+        - None
+
+    Raises:
+        - Exception: If there is an error in reading the tables.
+    """
+
+    window = int(os.environ.get("API_BUFFER_WARM_WINDOW", "3600")) # Seconds of readings to load.
+    since = (datetime.now() - timedelta(seconds = window)).strftime("%Y-%m-%d %H:%M:%S") # The dates are written in the local time of the API.
+
+    try:
+        for measure in measures: # Iterate over the measurement tables.
+            # Select the last reading of every chip (an index range scan per chip on (CHIP_ID, DATE)).
+            db_cursor.execute(
+                f"SELECT t.CHIP_ID, t.VALUE, t.DATE FROM {measure} t "
+                f"JOIN (SELECT CHIP_ID, MAX(DATE) AS DATE FROM {measure} GROUP BY CHIP_ID) l ON t.CHIP_ID = l.CHIP_ID AND t.DATE = l.DATE "
+                f"WHERE t.DATE < '{since}'"
+            )
+            rows = db_cursor.fetchall()
+
+            # Select the readings of the warm window, oldest first.
+            db_cursor.execute(f"SELECT CHIP_ID, VALUE, DATE FROM {measure} WHERE DATE >= '{since}' ORDER BY DATE")
+            rows += db_cursor.fetchall()
+
+            for CHIP_ID, VALUE, DATE in rows:
+                append(measure, CHIP_ID, DATE.timestamp(), VALUE)
+
+            with buffer_lock:
+                buffer_stats_counters["warm_loaded"] += len(rows)
+
+    except Exception as error:
+        raise error
+
+def latest(measure: str = None, chip_id: str = None) -> list:
+    """
+    This function returns the last reading of every series, optionally filtered by measure and chip.
+
+    Args:
+        - measure (str): The measure, or None for every measure.
+        - chip_id (str): The chip, or None for every chip.
+
+    Returns:
+        - readings (list): The last reading of each series as {"CHIP_ID", "MEASURE", "VALUE", "DATE"}.
+    """
+
+    readings = []
+
+    with buffer_lock:
+        for (series_measure, series_chip_id), series in buffer_series.items():
+            if (measure is None or series_measure == measure) and (chip_id is None or series_chip_id == chip_id) and series["count"]:
+                index = series["next"] - 1 # The last slot written (-1 is the last slot of the array).
+
+                readings.append({"CHIP_ID": series_chip_id, "MEASURE": series_measure, "VALUE": series["values"][index], "DATE": series["dates"][index]})
+
+    for reading in readings: # Convert the dates outside of the lock.
+        reading["DATE"] = datetime.fromtimestamp(reading["DATE"])
+
+    return readings
+
+def recent(window: float, measure: str = None, chip_id: str = None) -> list:
+    """
+    This function returns the readings of the last seconds of every series, optionally filtered by measure and chip.
+
+    Args:
+        - window (float): The number of seconds before now.
+        - measure (str): The measure, or None for every measure.
+        - chip_id (str): The chip, or None for every chip.
+
+    Returns:
+        - series (list): The readings of each series as {"CHIP_ID", "MEASURE", "DATE": [...], "VALUE": [...]}, oldest first.
+    """
+
+    since = time.time() - window
+    result = []
+
+    with buffer_lock:
+        for (series_measure, series_chip_id), series in buffer_series.items():
+            if (measure is None or series_measure == measure) and (chip_id is None or series_chip_id == chip_id):
+                capacity = len(series["values"])
+                start = (series["next"] - series["count"]) % capacity # The slot of the oldest reading.
+
+                dates = []; values = []
+
+                for offset in range(series["count"]): # Walk the ring from the oldest reading.
+                    index = (start + offset) % capacity
+
+                    if series["dates"][index] >= since:
+                        dates.append(series["dates"][index]); values.append(series["values"][index])
+
+                if dates:
+                    result.append({"CHIP_ID": series_chip_id, "MEASURE": series_measure, "DATE": dates, "VALUE": values})
+
+    for series in result: # Convert the dates outside of the lock.
+        series["DATE"] = [datetime.fromtimestamp(date) for date in series["DATE"]]
+
+    return result
+
+def stats() -> dict:
+    """
+    This function returns the statistics of the buffer.
+
+    Args:
+        - None
+
+    Returns:
+        - stats (dict): The number of series, readings appended and readings warm loaded.
+    """
+
+    with buffer_lock:
+        stats = dict(buffer_stats_counters)
+        stats["series"] = len(buffer_series)
+
+    return stats
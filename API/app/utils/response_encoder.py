@@ -0,0 +1,199 @@
+from datetime import datetime
+import zlib
+import os
+
+# The binary format and the brotli compression are optional, they are only offered if their libraries are installed.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# The content types of the output formats.
+MIMETYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "columnar": "application/vnd.orus.columnar+json",
+    "msgpack": "application/msgpack",
+}
+
+STREAM_FORMATS = ("json", "ndjson", "csv") # The formats that can be encoded row by row while streaming.
+DICTIONARY_COLUMNS = ("CHIP_ID", "MEASURE") # The columns with few distinct values, dictionary encoded in the columnar formats.
+
+def negotiate_format(accept_mimetypes) -> str:
+    """
+    This function chooses the output format of a request without the 'format' argument from its Accept header.
+
+    Args:
+        - accept_mimetypes (werkzeug.datastructures.MIMEAccept): The parsed Accept header of the request.
+
+    Returns:
+        - format (str): The best output format accepted by the client, 'json' if there is none.
+          A format other than JSON is only chosen if its content type is named in the header: a wildcard ('*/*', 'text/*')
+          keeps the JSON default, so the Accept headers of the browsers do not get CSV.
+    """
+
+    named = {mimetype.lower() for mimetype, quality in accept_mimetypes if quality > 0 and "*" not in mimetype} # The content types named by the client.
+    offered = [mimetype for output_format, mimetype in MIMETYPES.items() if output_format != "msgpack" or msgpack is not None]
+
+    if msgpack is not None:
+        offered.append("application/x-msgpack")
+
+    offered = [mimetype for mimetype in offered if mimetype == MIMETYPES["json"] or mimetype in named]
+    best = accept_mimetypes.best_match(offered, default = MIMETYPES["json"])
+
+    if best == "application/x-msgpack": # The legacy name of the MessagePack content type.
+        best = MIMETYPES["msgpack"]
+
+    return next(output_format for output_format, mimetype in MIMETYPES.items() if mimetype == best)
+
+def to_columns(column_names: list, rows: list) -> dict:
+    """
+    This function transposes the rows of a result into columns, straight from the cursor rows.
+    The columns with few distinct values (the chip ids) are dictionary encoded: the values are listed once and each row keeps an index.
+
+    Args:
+        - column_names (list): The column names of the result.
+        - rows (list): The rows of the result.
+
+    Returns:
+        - result (dict): {"columns": [...], "dictionaries": {column: [values]}, <column>: [values or indices], ...}.
+    """
+
+    columns = list(zip(*rows)) if rows else [() for _ in column_names]
+    result = {"columns": list(column_names), "dictionaries": {}}
+
+    for name, values in zip(column_names, columns):
+        if name in DICTIONARY_COLUMNS:
+            indices = {} # The index of each distinct value, in order of appearance.
+            result[name] = [indices.setdefault(value, len(indices)) for value in values]
+            result["dictionaries"][name] = list(indices)
+
+        else:
+            result[name] = list(values)
+
+    return result
+
+def encode(column_names: list, rows: list, output_format: str, json_provider) -> bytes:
+    """
+    This function encodes a result in one of the columnar formats.
+
+    Args:
+        - column_names (list): The column names of the result.
+        - rows (list): The rows of the result.
+        - output_format (str): The output format ('columnar' or 'msgpack').
+        - json_provider (flask.json.provider.JSONProvider): The JSON encoder of the app, the same used by jsonify.
+
+    Returns:
+        - body (bytes): The encoded result.
+
+    Raises:
+        - ValueError: If the format is not supported.
+    """
+
+    result = to_columns(column_names, rows)
+
+    if output_format == "columnar":
+        return json_provider.dumps(result, separators = (",", ":")).encode("utf-8")
+
+    if output_format == "msgpack":
+        if msgpack is None:
+            raise ValueError("The format 'msgpack' is not available, the msgpack library is not installed.")
+
+        return msgpack.packb(result, default = encode_value)
+
+    raise ValueError(f"Invalid format. Format: {output_format}")
+
+def encode_value(value):
+    """
+    This function converts the values that MessagePack cannot encode.
+
+    Args:
+        - value: The value.
+
+    Returns:
+        - value: The converted value (the dates as 'YYYY-MM-DD HH:MM:SS', the decimals as floats).
+
+    Raises:
+        - TypeError: If the value cannot be converted.
+    """
+
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+
+    try:
+        return float(value)
+
+    except Exception as error:
+        raise TypeError(f"Cannot encode the value {value!r}.")
+
+def negotiate_encoding(accept_encodings) -> str:
+    """
+    This function chooses the compression of a response from the Accept-Encoding header of the request.
+
+    Args:
+        - accept_encodings (werkzeug.datastructures.Accept): The parsed Accept-Encoding header of the request.
+
+    Returns:
+        - encoding (str): 'br', 'gzip' or None if the response must not be compressed.
+    """
+
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+    return accept_encodings.best_match(offered)
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """
+    This function compresses the body of a response.
+
+    Args:
+        - body (bytes): The body.
+        - encoding (str): 'br' or 'gzip'.
+
+    Returns:
+        - body (bytes): The compressed body.
+    """
+
+    level = int(os.environ.get("API_COMPRESS_LEVEL", "6"))
+
+    if encoding == "br":
+        return brotli.compress(body, quality = min(level, 11))
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # 31: the gzip container.
+
+    return compressor.compress(body) + compressor.flush()
+
+def compress_stream(parts: iter, encoding: str) -> iter:
+    """
+    This function compresses the parts of a streamed response as they are sent.
+
+    Args:
+        - parts (iter): An iterator over the parts (str or bytes) of the response.
+        - encoding (str): 'br' or 'gzip'.
+
+    Returns:
+        - parts (iter): An iterator over the compressed parts.
+    """
+
+    level = int(os.environ.get("API_COMPRESS_LEVEL", "6"))
+
+    if encoding == "br":
+        compressor = brotli.Compressor(quality = min(level, 11))
+        process = compressor.process; finish = compressor.finish
+
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # 31: the gzip container.
+        process = compressor.compress; finish = compressor.flush
+
+    for part in parts:
+        compressed = process(part.encode("utf-8") if isinstance(part, str) else part)
+
+        if compressed: # The compressor may keep small parts until it has a full block.
+            yield compressed
+
+    yield finish()
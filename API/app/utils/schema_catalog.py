@@ -0,0 +1,124 @@
+import threading
+
+# State of the schema catalog, loaded once at startup and replaced as a whole on refresh.
+catalog_lock = threading.Lock() # Guards the swap of the catalog.
+catalog = {
+    "tables": frozenset(), # The tables of the database.
+    "columns": {}, # The (name, type) of the columns of each table, in order.
+    "measures": {}, # The DATA_ID of each measure (and measurement table), indexed by MEASURE_NAME.
+    "version": 0, # Incremented on every load.
+}
+
+def load(db_cursor) -> None:
+    """
+    This function loads the schema catalog from the database, replacing the previous one.
+    The tables and columns are read with a single query to information_schema.
+
+    Args:
+        - db_cursor (mysql.connector.cursor): The cursor object.
+
+    Returns:
+        - None
+
+    Raises:
+        - Exception: If there is an error in reading the schema.
+    """
+
+    global catalog
+
+    try:
+        # Select the columns of every table of the database.
+        db_cursor.execute(
+            "select TABLE_NAME, COLUMN_NAME, DATA_TYPE from information_schema.columns "
+            "where TABLE_SCHEMA = database() order by TABLE_NAME, ORDINAL_POSITION"
+        )
+
+        columns = {}
+
+        for table, column, data_type in db_cursor.fetchall():
+            columns.setdefault(table, []).append((column, data_type))
+
+        db_cursor.execute("select MEASURE_NAME, DATA_ID from data_types") # Select the DATA_ID of every measure.
+        measures = {MEASURE_NAME: DATA_ID for MEASURE_NAME, DATA_ID in db_cursor.fetchall()}
+
+        with catalog_lock: # Swap the catalog (the readers keep the objects they already took).
+            catalog = {
+                "tables": frozenset(columns),
+                "columns": columns,
+                "measures": measures,
+                "version": catalog["version"] + 1,
+            }
+
+    except Exception as error:
+        raise error
+
+def tables() -> frozenset:
+    """
+    This function returns the tables of the database.
+
+    Args:
+        - None
+
+    Returns:
+        - tables (frozenset): The names of the tables.
+    """
+
+    return catalog["tables"]
+
+def columns(table: str) -> list:
+    """
+    This function returns the columns of a table.
+
+    Args:
+        - table (str): The table.
+
+    Returns:
+        - columns (list): The (name, type) of each column, in order. Empty if the table does not exist.
+    """
+
+    return catalog["columns"].get(table, [])
+
+def measures() -> dict:
+    """
+    This function returns the measures stored by the API. Each measure has a measurement table with the same name.
+
+    Args:
+        - None
+
+    Returns:
+        - measures (dict): The DATA_ID of each measure, indexed by MEASURE_NAME. It must not be modified.
+    """
+
+    return catalog["measures"]
+
+def version() -> int:
+    """
+    This function returns the version of the catalog, incremented on every load.
+
+    Args:
+        - None
+
+    Returns:
+        - version (int): The version of the catalog.
+    """
+
+    return catalog["version"]
+
+def summary() -> dict:
+    """
+    This function returns a summary of the catalog, for the clients of the API.
+
+    Args:
+        - None
+
+    Returns:
+        - summary (dict): The tables with their columns, the measures and the version of the catalog.
+    """
+
+    current = catalog
+
+    return {
+        "tables": {table: [{"name": name, "type": data_type} for name, data_type in table_columns] for table, table_columns in current["columns"].items()},
+        "measures": current["measures"],
+        "version": current["version"],
+    }
@@ -0,0 +1,165 @@
+from email.utils import formatdate
+import threading
+import time
+import zlib
+import os
+
+# State of the high-water marks of the writes seen by this process.
+marks_lock = threading.Lock() # Guards the marks below.
+marks_state = {
+    "epoch": f"{os.getpid():x}.{int(time.time()):x}", # Part of every ETag, so the versions of another process or run never match.
+    "started": time.time(), # The writes before this time are not known, it is the first Last-Modified.
+    "tracking": True, # False if this process does not receive the committed batches, then no validator is returned.
+}
+marks_tables = {} # The [version, time of the last write] of each table.
+marks_chips = {} # The [version, time of the last write] of each (table, CHIP_ID).
+
+def on_ingest(batch: list) -> None:
+    """
+    This function is called by the ingest pipeline after a batch is committed, and advances the marks of the tables and chips written.
+
+    Args:
+        - batch (list): The data of the messages written, as parsed by the data checker.
+
+    Returns:
+        - None
+    """
+
+    now = time.time()
+    written = set() # The (table, CHIP_ID) written.
+
+    for data in batch: # Iterate over the messages.
+        for key in data:
+            if key != "CLIENT_ID" and key != "timestamp":
+                written.add((key, data["CLIENT_ID"]))
+
+    with marks_lock:
+        for table in {table for table, _ in written}:
+            mark = marks_tables.setdefault(table, [0, now])
+            mark[0] += 1; mark[1] = now
+
+        for key in written:
+            mark = marks_chips.setdefault(key, [0, now])
+            mark[0] += 1; mark[1] = now
+
+def disable() -> None:
+    """
+    This function stops answering the conditional requests, when this process does not receive the committed batches.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+    """
+
+    marks_state["tracking"] = False
+
+def reset() -> None:
+    """
+    This function answers the conditional requests again, after the batches committed in between were missed:
+    the epoch changes, so the previous ETags do not match, and the Last-Modified is at least now.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+    """
+
+    with marks_lock:
+        marks_tables.clear(); marks_chips.clear()
+
+        marks_state["epoch"] = f"{os.getpid():x}.{int(time.time() * 1000):x}"
+        marks_state["started"] = time.time()
+        marks_state["tracking"] = True
+
+def tracking() -> bool:
+    """
+    This function checks if the marks know every write. With a shared group set in the settings, the subscription of the topic
+    can be shared with the ingest of other hosts, whose writes never advance the marks of this one, so they are not used.
+
+    Args:
+        - None
+
+    Returns:
+        - bool: True if the marks can validate the responses.
+    """
+
+    return marks_state["tracking"] and not os.environ.get("API_MQTT_SHARED_GROUP", "")
+
+def validators(keys: list, variant: tuple) -> dict:
+    """
+    This function builds the validators of a response from the marks of the tables (or the (table, CHIP_ID)) it reads.
+
+    Args:
+        - keys (list): The tables, or (table, CHIP_ID) pairs, read by the response.
+        - variant (tuple): The arguments of the request, so each result has its own ETag.
+
+    Returns:
+        - validators (dict): The 'etag' (weak, without the quotes), 'last_modified' (seconds since the epoch) and the HTTP headers,
+          or None if this process does not know all the writes (or the conditional requests are disabled).
+          Last-Modified has a resolution of one second, so it is only given once the second of the last write is over:
+          a write later in that second would have the same Last-Modified, and the copy of the client would be validated.
+    """
+
+    if not tracking() or os.environ.get("API_CONDITIONAL_REQUESTS", "true") != "true":
+        return None
+
+    version = 0; last_write = marks_state["started"]
+
+    with marks_lock:
+        for key in keys:
+            mark = marks_chips.get(key) if isinstance(key, tuple) else marks_tables.get(key)
+
+            if mark is not None: # The versions only grow, so their sum changes on every write.
+                version += mark[0]; last_write = max(last_write, mark[1])
+
+    etag = f"{marks_state['epoch']}.{version:x}.{zlib.crc32(repr(variant).encode('utf-8')):08x}"
+    last_modified = int(last_write) if int(last_write) < int(time.time()) else None # None while the second of the last write is not over.
+    headers = {"ETag": f'W/"{etag}"', "Cache-Control": "no-cache"}
+
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt = True)
+
+    return {"etag": etag, "last_modified": last_modified, "headers": headers}
+
+def not_modified(current: dict, if_none_match, if_modified_since) -> bool:
+    """
+    This function evaluates the conditional headers of a request against the validators of its response.
+    If-None-Match takes precedence over If-Modified-Since, which has a resolution of one second, so it is ignored
+    while the second of the last write is not over.
+
+    Args:
+        - current (dict): The validators returned by validators, or None.
+        - if_none_match (werkzeug.datastructures.ETags): The parsed If-None-Match header.
+        - if_modified_since (datetime.datetime): The parsed If-Modified-Since header, or None.
+
+    Returns:
+        - bool: True if the client has the current result, so a 304 can be answered.
+    """
+
+    if current is None:
+        return False
+
+    if if_none_match: # The weak comparison, the representations only differ by their encoding.
+        return if_none_match.contains_weak(current["etag"])
+
+    if if_modified_since is not None and current["last_modified"] is not None:
+        return current["last_modified"] <= if_modified_since.timestamp()
+
+    return False
+
+def stats() -> dict:
+    """
+    This function returns the statistics of the marks.
+
+    Args:
+        - None
+
+    Returns:
+        - stats (dict): If the marks are tracked, and the version of each table.
+    """
+
+    with marks_lock:
+        return {"tracking": tracking(), "tables": {table: mark[0] for table, mark in marks_tables.items()}, "chips": len(marks_chips)}
@@ -0,0 +1,478 @@
+"""
+End-to-end benchmark of the API with a simulated fleet of chips.
+
+The fleet publishes payloads with the shape sent by the firmware (CLIENT_ID and one key per measure) to a stand-in of the broker,
+which delivers them to the same on_message function used with the MQTT client, so they go through the data checker, the ingest
+pipeline and the database. At the same time, several threads send dashboard queries to the web server of the API over HTTP.
+The report includes the ingest throughput, the end-to-end lag (publication to commit) and the p50/p99 latency of each kind of query.
+
+The benchmark writes to the database of the credentials file, it must be a database used only for benchmarks. For example:
+
+    docker run -d --name orus-bench-db -e MYSQL_ROOT_PASSWORD=bench -p 3306:3306 mysql:8.0
+    mysql -h 127.0.0.1 -u root -pbench < ../../DataBase/ORUS_DB_V1.0.1.sql
+
+    python benchmark.py --data-dir ./bench_data --chips 2000 --interval 5 --duration 60 --output result.json
+    python benchmark.py --data-dir ./bench_data --chips 2000 --interval 5 --duration 60 --baseline result.json
+
+The data directory must contain a credentials.json like the one of the API ('database' pointing to the benchmark database,
+the 'mqtt' section is required by the credentials manager but the broker is not used). With --baseline, the benchmark exits
+with code 1 if the throughput or a p99 latency is worse than the baseline by more than the tolerance.
+"""
+
+# Importing the required libraries
+from collections import deque
+from datetime import datetime, timedelta
+import urllib.request
+import urllib.parse
+import argparse
+import threading
+import random
+import types
+import json
+import time
+import sys
+import os
+
+# The modules of the API are imported from its app directory.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import config as cf
+assert cf
+
+from flask import Flask
+from connections import db_connections, ingest_pipeline
+from utils import credentials_manager, logs_handler
+import API
+
+# The ranges of the readings of the firmware: (minimum, maximum, maximum step between two readings) of each measure.
+MEASURE_RANGES = {"ambient_temperature": (10.0, 40.0, 0.5), "ambient_moisture": (20.0, 95.0, 1.0), "soil_moisture": (0.0, 100.0, 1.0)}
+
+# The kinds of dashboard queries sent by the query threads.
+QUERY_KINDS = ("raw_last_hour", "aggregate_last_day", "latest", "chip_panel")
+
+def parse_args() -> argparse.Namespace:
+    """
+    This function parses the arguments of the benchmark.
+
+    Args:
+        - None
+
+    Returns:
+        - args (argparse.Namespace): The arguments.
+    """
+
+    parser = argparse.ArgumentParser(description = "End-to-end benchmark of the API with a simulated fleet of chips.")
+    parser.add_argument("--data-dir", default = None, help = "The data directory with the credentials.json of the benchmark database.")
+    parser.add_argument("--chips", type = int, default = 1000, help = "Number of simulated chips.")
+    parser.add_argument("--interval", type = float, default = 5.0, help = "Seconds between two payloads of a chip.")
+    parser.add_argument("--duration", type = float, default = 60.0, help = "Seconds of publication and queries.")
+    parser.add_argument("--publishers", type = int, default = 4, help = "Threads publishing the payloads of the fleet.")
+    parser.add_argument("--query-threads", type = int, default = 8, help = "Threads sending dashboard queries.")
+    parser.add_argument("--seed-hours", type = float, default = 0.0, help = "Hours of history written for the fleet before the benchmark.")
+    parser.add_argument("--port", type = int, default = 18080, help = "Port of the web server of the API.")
+    parser.add_argument("--seed", type = int, default = 1, help = "Seed of the random readings, for reproducible runs.")
+    parser.add_argument("--output", default = None, help = "File to write the report to (JSON).")
+    parser.add_argument("--baseline", default = None, help = "Report of a previous run to compare with.")
+    parser.add_argument("--tolerance", type = float, default = 0.2, help = "Allowed regression against the baseline (0.2 = 20%%).")
+
+    return parser.parse_args()
+
+def setup_api(args: argparse.Namespace) -> None:
+    """
+    This function starts the components of the API used by the benchmark: the DataBase pool, the schema, the ingest pipeline
+    and the web server (in a background thread).
+
+    Args:
+        - args (argparse.Namespace): The arguments of the benchmark.
+
+    Returns:
+        - None
+    """
+
+    if args.data_dir is not None:
+        os.environ["data_dir"] = os.path.abspath(args.data_dir)
+
+    logger = logs_handler.init()
+
+    credentials_manager.set_credentials() # Set the credentials of the benchmark database.
+    logs_handler.configure()
+
+    os.environ["API_SERVER_HOST"] = "127.0.0.1"; os.environ["API_SERVER_PORT"] = str(args.port)
+    os.environ["API_SERVER_WORKERS"] = "1"
+
+    API.init_database_pool(logger)
+    API.complete_startup(logger, [], fatal = True) # Migrate the database, load the schema and warm the buffer of the latest readings.
+    API.start_ingest_pipeline(logger)
+
+    app = Flask("benchmark")
+    threading.Thread(target = API.start_web_services, args = (logger, app, None, None), daemon = True).start()
+
+    wait_for_server(args.port)
+
+def wait_for_server(port: int, timeout: float = 30) -> None:
+    """
+    This function waits until the web server of the API answers.
+
+    Args:
+        - port (int): The port of the web server.
+        - timeout (float): The maximum seconds to wait.
+
+    Returns:
+        - None
+
+    Raises:
+        - TimeoutError: If the server does not answer.
+    """
+
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/OrusDashboard/API/schema", timeout = 1).read()
+
+            return
+
+        except Exception:
+            time.sleep(0.2)
+
+    raise TimeoutError(f"The web server of the API did not start on the port {port}.")
+
+def new_fleet(chips: int, rng: random.Random) -> dict:
+    """
+    This function creates the state of the simulated fleet: the last reading of each measure of each chip.
+
+    Args:
+        - chips (int): The number of chips.
+        - rng (random.Random): The random generator.
+
+    Returns:
+        - fleet (dict): The last readings of each chip, indexed by CLIENT_ID.
+    """
+
+    return {
+        f"BENCH_{index:05d}": {measure: rng.uniform(low, high) for measure, (low, high, step) in MEASURE_RANGES.items()}
+        for index in range(chips)
+    }
+
+def next_payload(client_id: str, readings: dict, rng: random.Random) -> dict:
+    """
+    This function simulates the next readings of a chip (a random walk inside the range of each measure).
+
+    Args:
+        - client_id (str): The CLIENT_ID of the chip.
+        - readings (dict): The last readings of the chip, updated in place.
+        - rng (random.Random): The random generator.
+
+    Returns:
+        - payload (dict): The payload, with the shape sent by the firmware.
+    """
+
+    payload = {"CLIENT_ID": client_id}
+
+    for measure, (low, high, step) in MEASURE_RANGES.items():
+        readings[measure] = min(high, max(low, readings[measure] + rng.uniform(-step, step)))
+        payload[measure] = round(readings[measure], 2)
+
+    return payload
+
+def seed_history(fleet: dict, hours: float, interval: float, rng: random.Random) -> None:
+    """
+    This function writes hours of history of the fleet to the database, so the queries read a realistic volume of rows.
+
+    Args:
+        - fleet (dict): The state of the fleet.
+        - hours (float): The hours of history.
+        - interval (float): The seconds between two payloads of a chip.
+        - rng (random.Random): The random generator.
+
+    Returns:
+        - None
+    """
+
+    start = datetime.now() - timedelta(hours = hours)
+    steps = int(hours * 3600 / interval)
+    batch = []
+
+    db_connection, db_cursor = db_connections.init() # Check out a connection from the pool.
+
+    try:
+        for step in range(steps):
+            timestamp = (start + timedelta(seconds = step * interval)).strftime("%Y-%m-%d %H:%M:%S")
+
+            for client_id, readings in fleet.items():
+                data = next_payload(client_id, readings, rng)
+                data["timestamp"] = timestamp
+                batch.append(data)
+
+                if len(batch) >= 5000:
+                    db_connections.write_batch(db_cursor, batch); batch = []
+
+        if batch:
+            db_connections.write_batch(db_cursor, batch)
+
+    finally:
+        db_connections.close(db_connection, db_cursor) # Return the connection to the pool.
+
+def run_fleet(fleet: dict, interval: float, duration: float, publishers: int, seed: int, published: dict) -> int:
+    """
+    This function publishes the payloads of the fleet to the stand-in of the broker during the benchmark.
+    The chips are spread over the publisher threads and their payloads are spread over the interval.
+
+    Args:
+        - fleet (dict): The state of the fleet.
+        - interval (float): The seconds between two payloads of a chip.
+        - duration (float): The seconds of publication.
+        - publishers (int): The number of publisher threads.
+        - seed (int): The seed of the random readings.
+        - published (dict): The publication times of the pending payloads of each chip, filled by the publishers.
+
+    Returns:
+        - count (int): The number of payloads published.
+    """
+
+    client_ids = list(fleet)
+    counts = [0] * publishers
+    start = time.monotonic()
+
+    for client_id in client_ids:
+        published[client_id] = deque()
+
+    def publish(index: int) -> None:
+        rng = random.Random(seed + index)
+        own = client_ids[index::publishers]
+        # The time of the next payload of each chip, spread over the first interval.
+        due = [start + interval * position / max(len(own), 1) for position in range(len(own))]
+        position = 0
+
+        while own:
+            now = time.monotonic()
+
+            if now - start >= duration:
+                break
+
+            if due[position] > now:
+                time.sleep(min(due[position] - now, 0.05))
+                continue
+
+            client_id = own[position]
+            message = types.SimpleNamespace(topic = "benchmark", qos = 0, payload = json.dumps(next_payload(client_id, fleet[client_id], rng)).encode("utf-8"))
+
+            published[client_id].append(time.monotonic())
+            API.broker_on_message(None, None, message) # The same function called by the MQTT client thread.
+
+            counts[index] += 1
+            due[position] += interval
+            position = (position + 1) % len(own)
+
+    threads = [threading.Thread(target = publish, args = (index,)) for index in range(publishers)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    return sum(counts)
+
+def run_queries(port: int, threads: int, duration: float, client_ids: list, latencies: dict, errors: list) -> None:
+    """
+    This function sends dashboard queries to the web server during the benchmark, each thread cycling over the kinds of queries.
+
+    Args:
+        - port (int): The port of the web server.
+        - threads (int): The number of query threads.
+        - duration (float): The seconds of queries.
+        - client_ids (list): The chips of the fleet.
+        - latencies (dict): The latencies (seconds) of each kind of query, filled by the threads.
+        - errors (list): The errors, filled by the threads.
+
+    Returns:
+        - None
+    """
+
+    base_url = f"http://127.0.0.1:{port}/OrusDashboard/API"
+    start = time.monotonic()
+
+    def build_url(kind: str, rng: random.Random) -> str:
+        now = datetime.now()
+        client_id = rng.choice(client_ids)
+
+        if kind == "raw_last_hour":
+            arguments = {"table_id": "ambient_temperature", "start_date": (now - timedelta(hours = 1)).strftime("%Y-%m-%d %H:%M:%S")}
+            return f"{base_url}?{urllib.parse.urlencode(arguments)}"
+
+        if kind == "aggregate_last_day":
+            arguments = {"table_id": "soil_moisture", "start_date": (now - timedelta(days = 1)).strftime("%Y-%m-%d %H:%M:%S"), "bucket": "15m"}
+            return f"{base_url}?{urllib.parse.urlencode(arguments)}"
+
+        if kind == "latest":
+            return f"{base_url}/latest?{urllib.parse.urlencode({'chip_id': client_id})}"
+
+        arguments = {"chip_id": client_id, "start_date": (now - timedelta(hours = 1)).strftime("%Y-%m-%d %H:%M:%S"), "align": "true"}
+        return f"{base_url}/chips?{urllib.parse.urlencode(arguments)}"
+
+    def query(index: int) -> None:
+        rng = random.Random(index)
+        turn = index
+
+        while time.monotonic() - start < duration:
+            kind = QUERY_KINDS[turn % len(QUERY_KINDS)]; turn += 1
+            url = build_url(kind, rng)
+            sent = time.perf_counter()
+
+            try:
+                urllib.request.urlopen(url, timeout = 60).read()
+                latencies[kind].append(time.perf_counter() - sent)
+
+            except Exception as error:
+                errors.append(f"{kind}: {error}")
+
+    for kind in QUERY_KINDS:
+        latencies[kind] = []
+
+    workers = [threading.Thread(target = query, args = (index,)) for index in range(threads)]
+
+    for worker in workers:
+        worker.start()
+
+    for worker in workers:
+        worker.join()
+
+def percentile(values: list, fraction: float) -> float:
+    """
+    This function returns a percentile of a list of values (nearest rank).
+
+    Args:
+        - values (list): The values.
+        - fraction (float): The percentile, between 0 and 1.
+
+    Returns:
+        - value (float): The percentile, or None if there are no values.
+    """
+
+    if not values:
+        return None
+
+    ordered = sorted(values)
+
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """
+    This function compares a report with the report of a previous run.
+
+    Args:
+        - report (dict): The report of this run.
+        - baseline (dict): The report of the previous run.
+        - tolerance (float): The allowed regression (0.2 = 20%).
+
+    Returns:
+        - regressions (list): The description of each regression.
+    """
+
+    regressions = []
+
+    if report["ingest"]["throughput"] < baseline["ingest"]["throughput"] * (1 - tolerance):
+        regressions.append(f"Ingest throughput: {report['ingest']['throughput']} < {baseline['ingest']['throughput']} messages/s")
+
+    for name, values in [("Ingest lag", (report["ingest"], baseline["ingest"]))] + [(kind, (report["queries"][kind], baseline["queries"].get(kind, {}))) for kind in report["queries"]]:
+        current, previous = values
+
+        if current.get("p99_ms") is not None and previous.get("p99_ms") is not None and current["p99_ms"] > previous["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{name} p99: {current['p99_ms']} > {previous['p99_ms']} ms")
+
+    return regressions
+
+def main() -> None:
+    """
+    This function runs the benchmark and prints its report.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+    """
+
+    args = parse_args()
+    rng = random.Random(args.seed)
+
+    setup_api(args)
+
+    fleet = new_fleet(args.chips, rng)
+
+    if args.seed_hours > 0:
+        print(f"Writing {args.seed_hours} hours of history for {args.chips} chips...")
+        seed_history(fleet, args.seed_hours, args.interval, rng)
+        API.refresh_db_schema(logs_handler.init())
+
+    published = {} # The publication times of the pending payloads of each chip.
+    lags = [] # The seconds from the publication of each payload to the commit of its batch.
+
+    def on_committed(batch: list) -> None: # Match the committed messages with their publication, the messages of a chip are written in order.
+        committed = time.monotonic()
+
+        for data in batch:
+            pending = published.get(data["CLIENT_ID"])
+
+            if pending:
+                lags.append(committed - pending.popleft())
+
+    ingest_pipeline.add_listener(on_committed)
+
+    latencies = {}; errors = []
+    query_thread = threading.Thread(target = run_queries, args = (args.port, args.query_threads, args.duration, list(fleet), latencies, errors))
+
+    print(f"Running the benchmark: {args.chips} chips every {args.interval} s, {args.query_threads} query threads, {args.duration} s...")
+
+    start = time.monotonic()
+    query_thread.start()
+    count = run_fleet(fleet, args.interval, args.duration, args.publishers, args.seed, published)
+    ingest_pipeline.shutdown(timeout = 300) # Wait for the messages left in the queue to be written.
+    elapsed = time.monotonic() - start
+    query_thread.join()
+
+    stats = ingest_pipeline.stats()
+
+    report = {
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "data_dir")},
+        "ingest": {
+            "published": count, "written": stats["written"], "dropped": stats["dropped"], "failed": stats["failed"],
+            "throughput": round(stats["written"] / elapsed, 1),
+            "p50_ms": round(1000 * percentile(lags, 0.5), 1) if lags else None,
+            "p99_ms": round(1000 * percentile(lags, 0.99), 1) if lags else None,
+        },
+        "queries": {
+            kind: {
+                "count": len(values),
+                "p50_ms": round(1000 * percentile(values, 0.5), 1) if values else None,
+                "p99_ms": round(1000 * percentile(values, 0.99), 1) if values else None,
+            }
+            for kind, values in latencies.items()
+        },
+        "errors": len(errors),
+    }
+
+    print(json.dumps(report, indent = 2))
+
+    for error in errors[:10]:
+        print(f"Error: {error}")
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent = 2)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+
+        for regression in regressions:
+            print(f"Regression: {regression}")
+
+        if regressions:
+            sys.exit(1)
+
+    db_connections.close_pool() # The web server thread is a daemon, it stops with the process.
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Micro-benchmark of the data checker: the validator compiled from the schema catalog against the previous parsing path.
+
+The payloads have the shape sent by the firmware (CLIENT_ID and one key per measure). The schema catalog is loaded from a stand-in
+of the database cursor, so the benchmark does not need a database or a broker. It measures the messages parsed per second by:
+
+    - legacy: the previous path, copied verbatim (the tables read from the environment and split, a list lookup per key,
+      flag variables and a copy of each payload).
+    - compiled: data_checker.parse_data, one message at a time (as called by the MQTT threads).
+    - batch: data_checker.parse_batch, with batches of --batch-size messages.
+
+    python data_checker_benchmark.py --messages 200000 --output result.json
+
+The decoder used (orjson or json) is included in the report.
+"""
+
+# Importing the required libraries
+from datetime import datetime
+import argparse
+import random
+import types
+import json
+import time
+import sys
+import os
+
+# The modules of the API are imported from its app directory.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import config as cf # Sets the data directory of the API, the logs are written under it.
+assert cf
+from utils import data_checker, schema_catalog
+
+# The measures of the firmware: (minimum, maximum) of the readings.
+MEASURE_RANGES = {"ambient_temperature": (10.0, 40.0), "ambient_moisture": (20.0, 95.0), "soil_moisture": (0.0, 100.0)}
+
+def catalog_cursor() -> types.SimpleNamespace:
+    """
+    This function builds a stand-in of the database cursor, answering the queries of schema_catalog.load with the tables of the measures.
+
+    Args:
+        - None
+
+    Returns:
+        - cursor (types.SimpleNamespace): An object with the execute and fetchall methods of a cursor.
+    """
+
+    rows = []
+
+    def execute(query: str, params: tuple = None) -> None:
+        if "information_schema" in query:
+            rows[:] = [(measure, column, data_type) for measure in MEASURE_RANGES for column, data_type in (("CHIP_ID", "varchar"), ("DATA_ID", "int"), ("VALUE", "float"), ("DATE", "datetime"))]
+
+        else:
+            rows[:] = [(measure, data_id) for data_id, measure in enumerate(MEASURE_RANGES, 1)]
+
+    return types.SimpleNamespace(execute = execute, fetchall = lambda: list(rows))
+
+def parse_args() -> argparse.Namespace:
+    """
+    This function parses the arguments of the benchmark.
+
+    Args:
+        - None
+
+    Returns:
+        - args (argparse.Namespace): The arguments.
+    """
+
+    parser = argparse.ArgumentParser(description = "Micro-benchmark of the data checker.")
+    parser.add_argument("--messages", type = int, default = 100000, help = "Number of payloads parsed by each path.")
+    parser.add_argument("--batch-size", type = int, default = 200, help = "Messages per call of parse_batch.")
+    parser.add_argument("--repeat", type = int, default = 3, help = "Runs of each path, the best one is reported.")
+    parser.add_argument("--seed", type = int, default = 1, help = "Seed of the random payloads, for reproducible runs.")
+    parser.add_argument("--output", default = None, help = "File to write the report to (JSON).")
+
+    return parser.parse_args()
+
+def legacy_parse_data(data_json: str) -> dict:
+    """
+    This function is the previous parsing path of the data checker (parse_data), copied verbatim as the reference of the benchmark.
+
+    Args:
+        - data_json (str): The data received from the MQTT broker.
+
+    Returns:
+        - data (dict): The data parsed as a dictionary.
+    """
+
+    try:
+        API_DB_TABLES = os.environ.get("API_DB_TABLES") # Get the tables from the environment variables.
+        db_tables = API_DB_TABLES.split() # Split the tables into a list.
+
+        data_json = json.loads(data_json) # Parse the data to a dictionary.
+
+        legacy_check_data(db_tables, data_json) # Confirm the keys for the database.
+
+        data_json["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S") # Add the timestamp to the data.
+        data = dict(data_json) # Create a copy of the data.
+
+        return data # Return the data.
+
+    except Exception as error:
+        raise error
+
+def legacy_check_data(db_tables, data_json) -> None:
+    """
+    This function is the previous check of the data checker (check_data), copied verbatim as the reference of the benchmark.
+
+    Args:
+        - db_tables (list): The tables for the database.
+        - data_json (dict): The data parsed as a dictionary.
+
+    Returns:
+        - None
+
+    Raises:
+        - KeyError: If the keys are not valid.
+        - ValueError: If the values are not valid.
+    """
+
+    try:
+        valid_keys = True; valid_values = True # Set the valid keys and valid values to True.
+
+        for key, value in data_json.items(): # Iterate over the data.
+            if valid_keys and valid_values: # If the keys and values are valid.
+                if key != "CLIENT_ID" and (key,) in db_tables: # Check if the key is not the CLIENT_ID and is in the tables.
+                    if isinstance(value, (int, float)) is True: # Check if the value is an integer or a float.
+                        data_json[key] = round(float(value), 3) # Convert the value to a float and round it to 3 decimal places.
+
+                    else: # If the value is an integer or a float.
+                        valid_values = False # Set the valid_values to False and break the loop.
+                        raise ValueError(f"Invalid values format. Message: {data_json}") # Raise a ValueError.
+
+                elif key != "CLIENT_ID" and key not in db_tables: # If the key is not the CLIENT_ID and is not in the tables.
+                    valid_keys = False
+                    raise KeyError(f"Invalid keys format. Message: {data_json}") # Raise a KeyError.
+
+    except Exception as error: # If there is an error in the data format.
+        raise error
+
+def new_payloads(count: int, rng: random.Random) -> list:
+    """
+    This function generates the payloads of the benchmark, encoded as the MQTT client delivers them.
+
+    Args:
+        - count (int): The number of payloads.
+        - rng (random.Random): The random generator.
+
+    Returns:
+        - payloads (list): The payloads (bytes).
+    """
+
+    return [
+        json.dumps({"CLIENT_ID": f"CHIP_{rng.randrange(2000):05d}", **{measure: round(rng.uniform(*limits), 2) for measure, limits in MEASURE_RANGES.items()}}).encode("utf-8")
+        for _ in range(count)
+    ]
+
+def measure(function: callable, payloads: list, repeat: int) -> float:
+    """
+    This function measures the messages parsed per second by a path.
+
+    Args:
+        - function (function): The function parsing every payload.
+        - payloads (list): The payloads.
+        - repeat (int): The runs, the best one is reported.
+
+    Returns:
+        - rate (float): The messages parsed per second of the best run.
+    """
+
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(payloads)
+        elapsed = time.perf_counter() - start
+
+        best = elapsed if best is None else min(best, elapsed)
+
+    return round(len(payloads) / best, 1)
+
+def main() -> None:
+    """
+    This function runs the benchmark and prints its report.
+
+    Args:
+        - None
+
+    Returns:
+        - None
+    """
+
+    args = parse_args()
+    payloads = new_payloads(args.messages, random.Random(args.seed))
+
+    schema_catalog.load(catalog_cursor())
+
+    # The previous path read the tables of the database (SHOW TABLES) from this environment variable on every message.
+    os.environ["API_DB_TABLES"] = " ".join(["data_types", "iot_chips", *MEASURE_RANGES])
+
+    def run_legacy(payloads: list) -> None:
+        for payload in payloads:
+            legacy_parse_data(payload.decode("utf-8")) # The previous path decoded the payload before parsing it.
+
+    def run_compiled(payloads: list) -> None:
+        for payload in payloads:
+            data_checker.parse_data(payload)
+
+    def run_batch(payloads: list) -> None:
+        for start in range(0, len(payloads), args.batch_size):
+            data_checker.parse_batch(payloads[start:start + args.batch_size])
+
+    report = {
+        "messages": args.messages,
+        "decoder": "orjson" if data_checker.orjson is not None else "json",
+        "legacy_per_second": measure(run_legacy, payloads, args.repeat),
+        "compiled_per_second": measure(run_compiled, payloads, args.repeat),
+        "batch_per_second": measure(run_batch, payloads, args.repeat),
+    }
+
+    report["compiled_speedup"] = round(report["compiled_per_second"] / report["legacy_per_second"], 2)
+    report["batch_speedup"] = round(report["batch_per_second"] / report["legacy_per_second"], 2)
+
+    print(json.dumps(report, indent = 2))
+
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent = 2)
+
+if __name__ == "__main__":
+    main()
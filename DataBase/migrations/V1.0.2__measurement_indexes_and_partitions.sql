@@ -0,0 +1,57 @@
+-- ORUS DataBase migration V1.0.2
+--
+-- Adds a surrogate primary key and the indexes used by the date range queries of the API to the measurement tables,
+-- and partitions them by month on DATE, so old partitions are pruned from range queries and can be dropped cheaply.
+--
+-- The readings taken before August 2024 stay in the 'p_history' partition. The monthly partitions after it are created
+-- by the API at startup (see connections/db_migrations.py), splitting the 'p_future' partition.
+--
+-- Note: MySQL requires the partitioning column in every unique key, so the primary key is (ID, DATE).
+
+--
+-- Table `ambient_temperature`
+--
+
+ALTER TABLE `ambient_temperature`
+  ADD COLUMN `ID` bigint NOT NULL AUTO_INCREMENT COMMENT 'Incremental reading id' FIRST,
+  ADD PRIMARY KEY (`ID`, `DATE`),
+  ADD INDEX `IDX_AMBIENT_TEMPERATURE_DATE_CHIP` (`DATE`, `CHIP_ID`),
+  ADD INDEX `IDX_AMBIENT_TEMPERATURE_CHIP_DATE` (`CHIP_ID`, `DATE`);
+
+ALTER TABLE `ambient_temperature`
+  PARTITION BY RANGE (TO_DAYS(`DATE`)) (
+    PARTITION `p_history` VALUES LESS THAN (TO_DAYS('2024-08-01')),
+    PARTITION `p_future` VALUES LESS THAN MAXVALUE
+  );
+
+--
+-- Table `ambient_moisture`
+--
+
+ALTER TABLE `ambient_moisture`
+  ADD COLUMN `ID` bigint NOT NULL AUTO_INCREMENT COMMENT 'Incremental reading id' FIRST,
+  ADD PRIMARY KEY (`ID`, `DATE`),
+  ADD INDEX `IDX_AMBIENT_MOISTURE_DATE_CHIP` (`DATE`, `CHIP_ID`),
+  ADD INDEX `IDX_AMBIENT_MOISTURE_CHIP_DATE` (`CHIP_ID`, `DATE`);
+
+ALTER TABLE `ambient_moisture`
+  PARTITION BY RANGE (TO_DAYS(`DATE`)) (
+    PARTITION `p_history` VALUES LESS THAN (TO_DAYS('2024-08-01')),
+    PARTITION `p_future` VALUES LESS THAN MAXVALUE
+  );
+
+--
+-- Table `soil_moisture`
+--
+
+ALTER TABLE `soil_moisture`
+  ADD COLUMN `ID` bigint NOT NULL AUTO_INCREMENT COMMENT 'Incremental reading id' FIRST,
+  ADD PRIMARY KEY (`ID`, `DATE`),
+  ADD INDEX `IDX_SOIL_MOISTURE_DATE_CHIP` (`DATE`, `CHIP_ID`),
+  ADD INDEX `IDX_SOIL_MOISTURE_CHIP_DATE` (`CHIP_ID`, `DATE`);
+
+ALTER TABLE `soil_moisture`
+  PARTITION BY RANGE (TO_DAYS(`DATE`)) (
+    PARTITION `p_history` VALUES LESS THAN (TO_DAYS('2024-08-01')),
+    PARTITION `p_future` VALUES LESS THAN MAXVALUE
+  );
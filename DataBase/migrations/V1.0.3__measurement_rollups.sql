@@ -0,0 +1,50 @@
+-- ORUS DataBase migration V1.0.3
+--
+-- Adds the hourly and daily rollup tables of the measurement tables: the count, minimum, maximum and sum of the values
+-- of each chip and measure per hour and per day. They are maintained incrementally by the API (see connections/db_rollups.py),
+-- which uses them to answer the aggregations of wide date ranges.
+--
+-- The readings before the WATERMARK of a measure are rolled up in the hourly table, and the ones before the start of its day
+-- in the daily table. LAST_ID is the last reading ID seen, the readings written later with an older DATE are rolled up again.
+
+--
+-- Table `rollup_hourly`
+--
+
+CREATE TABLE IF NOT EXISTS `rollup_hourly` (
+  `MEASURE` varchar(100) NOT NULL COMMENT 'The measure (and measurement table) of the values.',
+  `CHIP_ID` varchar(100) NOT NULL COMMENT 'The ID of each client.',
+  `BUCKET` datetime NOT NULL COMMENT 'The start of the hour.',
+  `COUNT` int unsigned NOT NULL COMMENT 'The number of values.',
+  `MIN` float NOT NULL COMMENT 'The minimum value.',
+  `MAX` float NOT NULL COMMENT 'The maximum value.',
+  `SUM` double NOT NULL COMMENT 'The sum of the values.',
+  PRIMARY KEY (`MEASURE`, `BUCKET`, `CHIP_ID`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci COMMENT='This table stores the hourly rollups of the measurement tables.';
+
+--
+-- Table `rollup_daily`
+--
+
+CREATE TABLE IF NOT EXISTS `rollup_daily` (
+  `MEASURE` varchar(100) NOT NULL COMMENT 'The measure (and measurement table) of the values.',
+  `CHIP_ID` varchar(100) NOT NULL COMMENT 'The ID of each client.',
+  `BUCKET` datetime NOT NULL COMMENT 'The start of the day.',
+  `COUNT` int unsigned NOT NULL COMMENT 'The number of values.',
+  `MIN` float NOT NULL COMMENT 'The minimum value.',
+  `MAX` float NOT NULL COMMENT 'The maximum value.',
+  `SUM` double NOT NULL COMMENT 'The sum of the values.',
+  PRIMARY KEY (`MEASURE`, `BUCKET`, `CHIP_ID`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci COMMENT='This table stores the daily rollups of the measurement tables.';
+
+--
+-- Table `rollup_watermarks`
+--
+
+CREATE TABLE IF NOT EXISTS `rollup_watermarks` (
+  `MEASURE` varchar(100) NOT NULL COMMENT 'The measure (and measurement table).',
+  `WATERMARK` datetime NOT NULL COMMENT 'The readings before this date are rolled up.',
+  `LAST_ID` bigint NOT NULL DEFAULT 0 COMMENT 'The last reading ID rolled up.',
+  `UPDATED_AT` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT 'The date of the last update.',
+  PRIMARY KEY (`MEASURE`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci COMMENT='This table stores the progress of the rollups of each measure.';